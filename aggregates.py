@@ -0,0 +1,285 @@
+"""
+Aggregates of the combined fire dataframe, shared by Plotter and any other consumer.
+
+The frame is normalized once (month, cleaned county, region color), and each aggregate is
+computed on first use and memoized until the data changes. Totals by year, month and county are
+read from a cube.FireCube of the data, and daily statistics from a timeseries.FireTimeSeries.
+When the data is replaced by a new version, update_from carries the cube and the time series of
+the previous version over, updated with the changed fires only.
+"""
+import numpy as np
+import pandas as pd
+
+from counties import county_colors, explode_counties, single_county
+from cube import FireCube
+from intervals import FireIntervals, interval_defaults
+from timeseries import WINDOWS, FireTimeSeries
+
+# throw out 1 fire each from Mexico, Nevada and Oregon
+NON_CALIFORNIA = ["State of Oregon", "State of Nevada", "Mexico"]
+
+
+def changed_rows(old, new):
+    """
+    Compare two versions of the data row by row, on all their values
+
+    Parameters
+    ----------
+    old, new (Pandas dataframes): with the same columns and dtypes
+
+    Returns
+    -------
+    (removed, added): rows of old that are not in new, and rows of new that are not in old. A row
+    that appears n times in one and m times in the other is in the difference |n - m| times.
+    """
+    keys = []
+    for df in [old, new]:
+        hashes = pd.Series(pd.util.hash_pandas_object(df, index=False).to_numpy())
+        # The n-th copy of a row is only matched by the n-th copy in the other version
+        copies = hashes.groupby(hashes.to_numpy()).cumcount()
+        keys.append(pd.util.hash_pandas_object(pd.DataFrame({'row': hashes, 'copy': copies}), index=False))
+    removed = old.iloc[np.flatnonzero(~keys[0].isin(keys[1]).to_numpy())]
+    added = new.iloc[np.flatnonzero(~keys[1].isin(keys[0]).to_numpy())]
+    return removed, added
+
+
+class FireAggregates(object):
+
+    def __init__(self, df):
+        """
+        Parameters
+        ----------
+        df (Pandas dataframe): combined fire data, as returned by run.get_combined_dataframe
+        """
+        self.set_data(df)
+
+    def set_data(self, df):
+        """
+        Replace the underlying data, and drop all memoized aggregates
+        """
+        self._df = df
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Drop memoized aggregates. Call this after modifying the underlying dataframe in place.
+        """
+        self._frame = None
+        self._cache = {}
+
+    def update_from(self, previous, removed, added):
+        """
+        Take the cube and the time series of the aggregates of the previous version of the data,
+        and update copies of them with the fires that changed, instead of computing them again.
+        previous is not modified, and can still be used.
+
+        The time series is only carried over if the data has the same default duration and end
+        of burning fires (see intervals.interval_defaults): otherwise it is computed again on use.
+
+        Parameters
+        ----------
+        previous (FireAggregates)
+        removed (Pandas dataframe): fires of the previous data that are not in this one
+        added (Pandas dataframe): fires of this data that were not in the previous one, see
+                                  changed_rows
+        """
+        if 'cube' in previous._cache:
+            cube = previous._cache['cube'].copy()
+            cube.update(removed, added, rows=self._df)
+            self._cache['cube'] = cube
+        if 'timeseries' in previous._cache:
+            series = previous._cache['timeseries']
+            if interval_defaults(self._df) == (series.default_days, series.today):
+                series = series.copy()
+                series.update(removed, added)
+                self._cache['timeseries'] = series
+
+    @property
+    def df(self):
+        return self._df
+
+    @property
+    def frame(self):
+        """
+        Normalized copy of the data, made once: adds month, county2 (single county or
+        'Multiple Counties') and the region color of county2.
+        """
+        if self._frame is None:
+            df = self._df.copy()
+            df['month'] = pd.to_datetime(df.start_date).dt.month
+
+            df['county2'] = single_county(df['county'])
+            df['color'] = county_colors(df['county2'])
+            self._frame = df
+        return self._frame
+
+    def annual(self):
+        """
+        Returns
+        -------
+        Dataframe with year, total_area_burned_SF, biggest_fire_area_SF, num_fires
+        """
+        if 'annual' not in self._cache:
+            df = self.cube().rollup(['year'])
+            df = df[['year', 'total_area_SF', 'largest_area_SF', 'num_fires']]
+            df.columns = ['year', 'total_area_burned_SF', 'biggest_fire_area_SF', 'num_fires']
+            self._cache['annual'] = df
+        return self._cache['annual']
+
+    def monthly(self):
+        """
+        Returns
+        -------
+        Dataframe with month (when the fire started), total_area, num_fires, largest_fire_area,
+        total_area_SF, largest_fire_SF
+        """
+        if 'monthly' not in self._cache:
+            df = self.cube().rollup(['month'], month=range(1, 13))
+            df = df[['month', 'total_acres', 'num_fires', 'largest_acres', 'total_area_SF', 'largest_area_SF']]
+            df.columns = ['month', 'total_area', 'num_fires', 'largest_fire_area',
+                          'total_area_SF', 'largest_fire_SF']
+            self._cache['monthly'] = df
+        return self._cache['monthly']
+
+    def county(self):
+        """
+        Returns
+        -------
+        Dataframe with county, num_fires, total_area, largest_fire_area, color.
+        A fire in several counties is split between them (see county_shares): each of them counts
+        its share of the fire and of its acres, so the numbers of fires add up to the number of
+        fires, and the areas to the total area burned. The largest fire area is the whole area of
+        the largest fire that burned in the county. Fires outside California are left out.
+        """
+        if 'county' not in self._cache:
+            shares = self.county_shares()
+            acres = pd.to_numeric(self._df['acres'], errors='coerce').to_numpy(dtype=float)
+            shares = shares.assign(fire_acres=acres[shares['fire_id'].to_numpy()])
+            df = shares.groupby('county', as_index=False).agg({'share': 'sum', 'acres': 'sum',
+                                                               'fire_acres': 'max'})
+            df.columns = ['county', 'num_fires', 'total_area', 'largest_fire_area']
+            df = df[~df.county.isin(NON_CALIFORNIA)].copy()
+            df['color'] = county_colors(df.county)
+            self._cache['county'] = df
+        return self._cache['county']
+
+    def cube(self):
+        """
+        Returns
+        -------
+        cube.FireCube of the data, by year, month and county
+        """
+        if 'cube' not in self._cache:
+            self._cache['cube'] = FireCube(self._df)
+        return self._cache['cube']
+
+    def county_shares(self, weights=None):
+        """
+        Parameters
+        ----------
+        weights (dict): weight of each county, acres are split equally between counties if None
+
+        Returns
+        -------
+        Dataframe with one row per fire and county it burned in: fire_id (position of the fire in
+        the data), county, share, and its share of acres and area_SF. See counties.explode_counties.
+        """
+        key = ('county_shares', None if weights is None else tuple(sorted(dict(weights).items())))
+        if key not in self._cache:
+            self._cache[key] = explode_counties(self._df, weights)
+        return self._cache[key]
+
+    def largest(self, n=20):
+        """
+        Parameters
+        ----------
+        n (int): number of fires
+
+        Returns
+        -------
+        Dataframe with the n largest fires by acres, with a display_name of "<name>, <year>"
+        """
+        key = ('largest', n)
+        if key not in self._cache:
+            df = self.frame.sort_values(by='acres', ascending=False)
+            df = df.iloc[:n, :].copy()
+            df['county'] = df.county.astype(object).fillna("")
+            # Add year to fire name for display in plot
+            df['display_name'] = df.name.str.split("(").str[0].str.strip() + ", " + df.year.astype(str)
+            self._cache[key] = df
+        return self._cache[key]
+
+    def intervals(self):
+        """
+        Returns
+        -------
+        intervals.FireIntervals over the burning period of every fire
+        """
+        if 'intervals' not in self._cache:
+            self._cache['intervals'] = FireIntervals(self._df)
+        return self._cache['intervals']
+
+    def daily_active(self):
+        """
+        Returns
+        -------
+        Dataframe with date, active_fires (number of fires burning that day)
+        """
+        if 'daily_active' not in self._cache:
+            counts = self.intervals().daily_counts()
+            self._cache['daily_active'] = pd.DataFrame({'date': counts.index, 'active_fires': counts.values})
+        return self._cache['daily_active']
+
+    def timeseries(self):
+        """
+        Returns
+        -------
+        timeseries.FireTimeSeries of the data: fires started, acres and active fires by day
+        """
+        if 'timeseries' not in self._cache:
+            self._cache['timeseries'] = FireTimeSeries(self._df)
+        return self._cache['timeseries']
+
+    def rolling(self, name='started', windows=WINDOWS):
+        """
+        Parameters
+        ----------
+        name (string): started, acres or active
+        windows (list): window lengths in days
+
+        Returns
+        -------
+        Dataframe with date, and the daily mean of name over each window in a column "<window>d"
+        """
+        key = ('rolling', name, tuple(windows))
+        if key not in self._cache:
+            series = self.timeseries()
+            df = pd.DataFrame({'date': pd.DatetimeIndex(series.dates)})
+            for window in windows:
+                df['{}d'.format(window)] = series.rolling(name, window, how='mean').values
+            self._cache[key] = df
+        return self._cache[key]
+
+    def season_curves(self, name='acres'):
+        """
+        Returns
+        -------
+        Dataframe with day_of_year and one column per year with the total of name so far that year,
+        see FireTimeSeries.season_curves
+        """
+        key = ('season_curves', name)
+        if key not in self._cache:
+            self._cache[key] = self.timeseries().season_curves(name)
+        return self._cache[key]
+
+    def anomalies(self, name='acres', window=30):
+        """
+        Returns
+        -------
+        Dataframe with date, value (total of name over window days), climatology and anomaly,
+        see FireTimeSeries.anomalies, and window
+        """
+        key = ('anomalies', name, window)
+        if key not in self._cache:
+            self._cache[key] = self.timeseries().anomalies(name, window).assign(window=window)
+        return self._cache[key]
@@ -0,0 +1,92 @@
+"""
+Compare row-wise and vectorized cleaning of dates (WikiFire.clean_data) and acres (get_combined_dataframe).
+
+Usage:
+    python benchmarks/bench_cleaning.py [--rows 1000000] [--per-row-rows 100000]
+
+The row-wise versions take minutes on a million rows, so by default they run on the first
+--per-row-rows rows and their time is scaled to the full table. Pass --per-row-rows 0 to time them
+on the whole table.
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from wikipedia_calfire_scraper import WikiFire  # noqa: E402
+from fixtures import raw_wiki_frames  # noqa: E402
+
+
+def dates_per_row(fires):
+    def get_start_date(row):
+        day = row['start_date'].split(",")[0]
+        date_string = '{}, {}'.format(day, row['year'])
+        return pd.to_datetime(date_string)
+
+    def get_end_date(row):
+        day = row['contained_date'].split(",")[0]
+        date_string = '{}, {}'.format(day, row['year'])
+        try:
+            return pd.to_datetime(date_string)
+        except (ValueError, OverflowError):
+            return None
+
+    return fires.apply(get_start_date, axis=1), fires.apply(get_end_date, axis=1)
+
+
+def dates_vectorized(fires):
+    def get_end_date(date_string):
+        try:
+            return pd.to_datetime(date_string)
+        except (ValueError, OverflowError):
+            return None
+
+    return (WikiFire._parse_dates(fires['start_date'], fires['year'], pd.to_datetime),
+            WikiFire._parse_dates(fires['contained_date'], fires['year'], get_end_date))
+
+
+def acres_per_row(acres):
+    import re
+    return acres.fillna("").apply(lambda x: int(re.sub(",", "", x)) if x != '' else 0)
+
+
+def acres_vectorized(acres):
+    return pd.to_numeric(acres.fillna("").str.replace(",", "", regex=False).replace("", "0")).astype(int)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", default=1000000, type=int)
+    ap.add_argument("--per-row-rows", default=100000, type=int, help="0 for the whole table")
+    args = ap.parse_args()
+
+    fires = pd.concat(raw_wiki_frames(args.rows)).rename(columns={'Start date': 'start_date',
+                                                                  'Containment date': 'contained_date'})
+    sample = fires if not args.per_row_rows else fires.iloc[:args.per_row_rows]
+    scale = len(fires) / len(sample)
+
+    print("{:,} rows".format(len(fires)))
+    for label, per_row, vectorized, column in [('dates', dates_per_row, dates_vectorized, None),
+                                               ('acres', acres_per_row, acres_vectorized, 'Acres')]:
+        per_row_args = sample if column is None else sample[column]
+        vectorized_args = fires if column is None else fires[column]
+        per_row_time, per_row_result = timed(per_row, per_row_args)
+        vectorized_time, vectorized_result = timed(vectorized, vectorized_args)
+
+        if column is None:
+            same = all(a.equals(b.iloc[:len(sample)]) for a, b in zip(per_row_result, vectorized_result))
+        else:
+            same = per_row_result.equals(vectorized_result.iloc[:len(sample)])
+        print("{}: per-row {:8.2f}s{}  vectorized {:6.2f}s  speedup {:6.0f}x  same output: {}".format(
+            label, per_row_time * scale, " (scaled)" if scale > 1 else "", vectorized_time,
+            per_row_time * scale / vectorized_time, same))
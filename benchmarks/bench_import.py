@@ -0,0 +1,70 @@
+"""
+Check that starting the CLIs stays cheap: importing run, calfire_backends or plotter must not
+load the heavy modules used only by some subcommands.
+
+Usage:
+    python benchmarks/bench_import.py [--repeat 5] [--budget 0.5]
+
+Each module is imported in a fresh interpreter with -X importtime. The script exits with a
+nonzero status if a heavy module is loaded where it should not be, or if the import takes longer
+than --budget seconds, so it can run as a check in CI.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# module -> heavy modules it must not import at startup
+CHECKS = {
+    'run': ['pandas', 'numpy', 'selenium', 'bs4', 'requests', 'matplotlib', 'seaborn', 'pyarrow'],
+    'calfire_backends': ['pandas', 'selenium', 'bs4', 'requests'],
+    'plotter': ['seaborn'],
+}
+
+
+def import_time(module):
+    """
+    Returns
+    -------
+    (seconds taken to import module, set of top-level modules imported)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            cwd=ROOT, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            universal_newlines=True, check=True)
+    total = 0
+    loaded = set()
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)', line)
+        if match is None:
+            continue
+        loaded.add(match.group(3).split('.')[0])
+        if match.group(3) == module:
+            total = int(match.group(1))
+    return total / 1e6, loaded
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5, help="imports per module, the fastest one is reported")
+    ap.add_argument("--budget", type=float, default=0.5, help="maximum seconds to import run")
+    args = ap.parse_args()
+
+    failures = []
+    for module, heavy in CHECKS.items():
+        runs = [import_time(module) for _ in range(args.repeat)]
+        seconds = min(seconds for seconds, _ in runs)
+        loaded = runs[0][1]
+        print("{:<20} {:8.3f}s".format(module, seconds))
+
+        unexpected = sorted(loaded.intersection(heavy))
+        if unexpected:
+            failures.append("importing {} loads {}".format(module, ', '.join(unexpected)))
+        if module == 'run' and seconds > args.budget:
+            failures.append("importing run takes {:.3f}s, budget is {:.3f}s".format(seconds, args.budget))
+
+    for failure in failures:
+        print("FAIL: {}".format(failure))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,251 @@
+"""
+Time the pipeline on synthetic data of growing size: WikiFire.clean_data, run.get_combined_dataframe
+and each Plotter method, with wall time and peak memory, compared against saved baselines.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--rows 10000 1000000 10000000] [--stages ...]
+                                        [--workdir /tmp/wildfire-bench] [--save-baseline]
+                                        [--baseline benchmarks/baselines.json] [--tolerance 1.25]
+
+Data for each size is generated once into <workdir>/<rows>/ (see fixtures.write_synthetic_data)
+and reused by later runs. Every stage runs in its own process, so its peak memory is not hidden
+by an earlier stage: peak_mb is the peak resident memory of that process, and stage_mb how far it
+rose above the memory used by the inputs of the stage.
+
+Without --save-baseline, results are compared with the baselines of the same size and stage. A
+stage more than --tolerance times slower (and at least 50ms slower), or using more than
+--tolerance times the memory, is a regression, and the script exits with status 1. Baselines are
+only meaningful on the machine and environment they were saved on, recorded in their "machine"
+entry with the versions of Python, pandas, NumPy and matplotlib: the committed ones come from the
+environment pinned in requirements.txt. Save new ones before comparing elsewhere.
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, HERE)
+
+PLOTS = ['plot_annual_stats', 'plot_monthly_stats', 'plot_county_stats', 'plot_largest_fires',
+         'plot_active_fires', 'plot_timeseries']
+STAGES = ['clean_data', 'get_combined_dataframe'] + PLOTS
+SIZES = [10000, 1000000, 10000000]
+BASELINE_PATH = os.path.join(HERE, 'baselines.json')
+# Data generated by an older version of fixtures.write_synthetic_data is generated again
+FIXTURES_VERSION = '2'
+# Slowdowns smaller than this are noise, whatever their ratio
+MIN_SLOWDOWN_SECONDS = 0.05
+
+
+def rss_mb():
+    """
+    Current resident memory of this process, in MB
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    # ru_maxrss is kept across exec on Linux, so it would include the peak of the parent process.
+    # VmHWM starts over.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def prepare(directory, rows):
+    """
+    Generate the synthetic data of a size, unless it is already in directory
+    """
+    from fixtures import raw_wiki_frames, write_synthetic_data
+    from storage import read_table, write_table
+
+    marker = os.path.join(directory, 'complete')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read() == FIXTURES_VERSION:
+                return
+    print("Generating {:,} rows in {}".format(rows, directory))
+    shutil.rmtree(os.path.join(directory, 'data'), ignore_errors=True)
+    for path in write_synthetic_data(directory, rows):
+        # As the first run of the pipeline would, so every timed run reads Parquet
+        write_table(read_table(path), path)
+    with open(os.path.join(directory, 'raw_wiki.pkl'), 'wb') as f:
+        pickle.dump(raw_wiki_frames(rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(marker, 'w') as f:
+        f.write(FIXTURES_VERSION)
+
+
+def run_stage(stage, directory):
+    """
+    Run one stage on the data in directory, in this process
+
+    Returns
+    -------
+    Dictionary with seconds, peak_mb and stage_mb
+    """
+    os.chdir(directory)
+    if stage == 'clean_data':
+        from wikipedia_calfire_scraper import WikiFire
+        with open('raw_wiki.pkl', 'rb') as f:
+            frames = pickle.load(f)
+        before = rss_mb()
+        start = time.perf_counter()
+        WikiFire.clean_data(frames)
+    elif stage == 'get_combined_dataframe':
+        from fixtures import mark_fresh
+        from run import get_combined_dataframe
+        mark_fresh(directory)
+        before = rss_mb()
+        start = time.perf_counter()
+        df = get_combined_dataframe(backend='http', cache=None)
+    else:
+        import matplotlib
+        matplotlib.use('Agg')
+        import pandas as pd
+        from plotter import Plotter
+        df = pd.read_pickle('combined.pkl')
+        os.makedirs('images', exist_ok=True)
+        before = rss_mb()
+        start = time.perf_counter()
+        getattr(Plotter(df), stage)()
+    seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+
+    if stage == 'get_combined_dataframe':
+        # Input of the plot stages
+        df.to_pickle('combined.pkl')
+    return {'seconds': round(seconds, 4), 'peak_mb': round(peak, 1), 'stage_mb': round(max(peak - before, 0), 1)}
+
+
+def measure(stage, directory):
+    """
+    Run a stage in a fresh process
+
+    Returns
+    -------
+    Dictionary with seconds, peak_mb and stage_mb
+    """
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--stage', stage, '--dir', directory],
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    # The last line is the result, anything before it is logging
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def environment():
+    """
+    Returns
+    -------
+    Description of the machine and of the versions the timings depend on
+    """
+    import matplotlib
+    import numpy
+    import pandas
+
+    return '{} {}, Python {}, pandas {}, numpy {}, matplotlib {}'.format(
+        platform.system(), platform.machine(), platform.python_version(), pandas.__version__,
+        numpy.__version__, matplotlib.__version__)
+
+
+def compare(results, baselines, tolerance):
+    """
+    Print results next to their baselines
+
+    Returns
+    -------
+    List of (rows, stage) that regressed
+    """
+    regressions = []
+    print("{:>10}  {:<24} {:>9} {:>9} {:>7} {:>9} {:>9} {:>7}".format(
+        'rows', 'stage', 'seconds', 'baseline', 'ratio', 'peak MB', 'baseline', 'ratio'))
+    for rows, stages in results.items():
+        for stage, result in stages.items():
+            baseline = baselines.get(rows, {}).get(stage)
+            if baseline is None:
+                print("{:>10}  {:<24} {:9.3f} {:>9} {:>7} {:9.1f}".format(rows, stage, result['seconds'], '-', '-',
+                                                                          result['peak_mb']))
+                continue
+            time_ratio = result['seconds'] / max(baseline['seconds'], 1e-9)
+            memory_ratio = result['peak_mb'] / max(baseline['peak_mb'], 1e-9)
+            slower = (time_ratio > tolerance and
+                      result['seconds'] - baseline['seconds'] > MIN_SLOWDOWN_SECONDS)
+            regressed = slower or memory_ratio > tolerance
+            if regressed:
+                regressions.append((rows, stage))
+            print("{:>10}  {:<24} {:9.3f} {:9.3f} {:6.2f}x {:9.1f} {:9.1f} {:6.2f}x{}".format(
+                rows, stage, result['seconds'], baseline['seconds'], time_ratio, result['peak_mb'],
+                baseline['peak_mb'], memory_ratio, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", nargs='+', default=SIZES, type=int, help="dataset sizes")
+    ap.add_argument("--stages", nargs='+', default=STAGES, choices=STAGES)
+    ap.add_argument("--workdir", default=os.path.join('/tmp', 'wildfire-bench'), help="where data is generated")
+    ap.add_argument("--baseline", default=BASELINE_PATH, help="baselines json")
+    ap.add_argument("--save-baseline", action='store_true', help="store these results as the baselines")
+    ap.add_argument("--tolerance", default=1.25, type=float, help="allowed slowdown or memory growth")
+    # Used by measure to run a single stage in a child process
+    ap.add_argument("--stage", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--dir", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.stage:
+        print(json.dumps(run_stage(args.stage, args.dir)))
+        sys.exit(0)
+
+    stages = [stage for stage in STAGES if stage in args.stages]
+    # Plots read the output of get_combined_dataframe
+    if any(stage in PLOTS for stage in stages) and 'get_combined_dataframe' not in stages:
+        stages.insert(0, 'get_combined_dataframe')
+
+    results = {}
+    for rows in args.rows:
+        directory = os.path.join(args.workdir, str(rows))
+        prepare(directory, rows)
+        results[str(rows)] = {}
+        for stage in stages:
+            result = results[str(rows)][stage] = measure(stage, directory)
+            print("{:>10,} rows  {:<24} {:8.3f}s  peak {:8.1f} MB".format(rows, stage, result['seconds'],
+                                                                          result['peak_mb']))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        for rows, stage_results in results.items():
+            baselines.setdefault(rows, {}).update(stage_results)
+        baselines['machine'] = environment()
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print("Baselines saved to {}".format(args.baseline))
+    else:
+        print()
+        if baselines.get('machine') != environment():
+            print("Baselines were saved on {}, not on {}\n".format(baselines.get('machine'), environment()))
+        regressions = compare(results, baselines, args.tolerance)
+        if regressions:
+            print("{} regressions".format(len(regressions)))
+            sys.exit(1)
@@ -0,0 +1,69 @@
+"""
+Compare per-cell xpath extraction with bulk page-source extraction of the Cal Fire incident table.
+
+Usage:
+    python benchmarks/bench_table_extraction.py [--page saved_page.html] [--rows 200] [--chromedriver path]
+
+Without --page a synthetic page is generated. The browser comparison needs chromedriver;
+without it only the in-process parse is timed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from calfire_backends import SeleniumBackend, parse_incident_page  # noqa: E402
+from fixtures import incident_page_html  # noqa: E402
+
+
+def best_of(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--page", default=None, help="saved incidents page")
+    ap.add_argument("--rows", default=200, type=int, help="rows in the synthetic page")
+    ap.add_argument("--repeat", default=3, type=int)
+    ap.add_argument("--chromedriver", default=None, help="path to chromedriver")
+    args = ap.parse_args()
+
+    if args.page:
+        page_path = os.path.abspath(args.page)
+    else:
+        page_path = os.path.join(tempfile.mkdtemp(), 'incidents.html')
+        with open(page_path, 'w') as f:
+            f.write(incident_page_html(args.rows))
+
+    with open(page_path) as f:
+        html = f.read()
+    parse_time, rows = best_of(lambda: parse_incident_page(html), args.repeat)
+    print("in-process parse:   {:8.4f}s  ({} rows)".format(parse_time, len(rows)))
+
+    try:
+        backend = SeleniumBackend(args.chromedriver or os.path.join(os.pardir, "chromedriver"), headless=True)
+        driver = backend.open()
+    except Exception as e:
+        print("Skipping browser comparison, could not start chromedriver: {}".format(e))
+        sys.exit(0)
+
+    try:
+        driver.get('file://' + page_path)
+        cell_time, cell_rows = best_of(lambda: backend.read_rows_by_cell(driver), args.repeat)
+        bulk_time, bulk_rows = best_of(lambda: parse_incident_page(driver.page_source), args.repeat)
+    finally:
+        driver.quit()
+
+    assert cell_rows == bulk_rows, "bulk extraction differs from per-cell extraction"
+    print("per-cell xpath:     {:8.4f}s  ({} round trips)".format(cell_time, 5 * len(cell_rows) + 1))
+    print("bulk page source:   {:8.4f}s  (1 round trip)".format(bulk_time))
+    print("speedup:            {:8.1f}x".format(cell_time / bulk_time))
@@ -0,0 +1,67 @@
+"""
+Compare the html.parser and lxml parsers of WikiFire on year pages.
+
+Usage:
+    python benchmarks/bench_wiki_parse.py [--pages dir] [--rows 300] [--repeat 3]
+
+--pages is a directory of saved "<year>_California_wildfires" pages, e.g. downloaded with
+    curl -o pages/2008_California_wildfires https://en.wikipedia.org/wiki/2008_California_wildfires
+Without it, synthetic pages for 2002-2012 are generated. Both parsers must return the same tables.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from wikipedia_calfire_scraper import WikiFire  # noqa: E402
+from fixtures import wiki_year_page_html  # noqa: E402
+
+
+def load_pages(directory):
+    pages = []
+    for filename in sorted(os.listdir(directory)):
+        match = re.match(r'(\d{4})', filename)
+        if match:
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                pages.append((int(match.group(1)), f.read()))
+    return pages
+
+
+def time_parser(parser, pages, repeat):
+    wiki = WikiFire(parser=parser)
+    timings = []
+    tables = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tables = [wiki._parse_page(html, year) for year, html in pages]
+        timings.append(time.perf_counter() - start)
+    return min(timings), tables
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", default=None, help="directory of saved year pages")
+    ap.add_argument("--rows", default=300, type=int, help="incidents per synthetic page")
+    ap.add_argument("--repeat", default=3, type=int)
+    args = ap.parse_args()
+
+    if args.pages:
+        pages = load_pages(args.pages)
+    else:
+        pages = [(year, wiki_year_page_html(year, args.rows)) for year in range(2002, 2013)]
+    size = sum(len(html) for _, html in pages)
+    print("{} pages, {:.1f} MB".format(len(pages), size / 1e6))
+
+    soup_time, soup_tables = time_parser('html.parser', pages, args.repeat)
+    lxml_time, lxml_tables = time_parser('lxml', pages, args.repeat)
+    for soup_table, lxml_table in zip(soup_tables, lxml_tables):
+        pd.testing.assert_frame_equal(soup_table, lxml_table)
+
+    print("html.parser:  {:8.4f}s  ({} rows)".format(soup_time, sum(len(t) for t in soup_tables)))
+    print("lxml:         {:8.4f}s".format(lxml_time))
+    print("speedup:      {:8.1f}x".format(soup_time / lxml_time))
@@ -0,0 +1,253 @@
+"""
+Saved-page style fixtures used by the benchmarks.
+
+The html mirrors the structure the scrapers rely on, so the same pages can be served
+from a local http server (python -m http.server) or opened with file://.
+"""
+import random
+
+COUNTIES = ['Santa Clara', 'Sonoma', 'Los Angeles', 'San Diego', 'Shasta', 'Napa and Lake',
+            'Riverside', 'Fresno', 'Kern and Ventura', 'Mendocino']
+NAMES = ['Grant', 'Refuse', 'Pfeiffer', 'Happy Camp', 'McCabe', 'DeLuz', 'Clover', 'Creek', 'Camp', 'Valley']
+
+
+def incident_page_html(n_rows=50, year=2020, seed=0):
+    """
+    Build a fire.ca.gov style incidents page with n_rows incidents on a single page
+
+    Returns
+    -------
+    string with the page html
+    """
+    rng = random.Random(seed)
+    rows = ['<div class="row header"><div>Name</div><div>Started</div><div>Counties</div>'
+            '<div>Acres</div><div>Containment</div></div>']
+    for i in range(n_rows):
+        rows.append('<div class="row"><div><a href="#">{} Fire</a></div><div>{}/{}/{}</div><div>{}</div>'
+                    '<div>{:,}</div><div>{}%</div></div>'.format(rng.choice(NAMES), rng.randint(1, 12),
+                                                                 rng.randint(1, 28), year, rng.choice(COUNTIES),
+                                                                 rng.randint(10, 400000), rng.choice([100, 95, 50])))
+    return ('<html><body><div id="incidentListTable"><div><div>{}</div>'
+            '<nav><ul><li><a href="#">1</a></li></ul></nav></div></div></body></html>').format(''.join(rows))
+
+
+def wiki_year_page_html(year, n_rows=50, seed=0):
+    """
+    Build a Wikipedia "<year> California wildfires" style page.
+
+    Like the real pages, the incidents table is preceded by other tables, and some rows
+    have no notes cell.
+
+    Returns
+    -------
+    string with the page html
+    """
+    rng = random.Random(seed + year)
+    months = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+              'September', 'October', 'November', 'December']
+    rows = ['<tr><th>Name</th><th>County</th><th>Acres</th><th>Start date</th><th>Containment date</th>'
+            '<th>Notes</th><th>Ref</th></tr>']
+    for i in range(n_rows):
+        month = rng.randint(0, 10)
+        start = '{} {}'.format(months[month], rng.randint(1, 28))
+        end = '{} {}'.format(months[month + 1], rng.randint(1, 28))
+        if rng.random() < 0.3:
+            start, end = '{}, {}'.format(start, year), '{}, {}'.format(end, year)
+        cells = [rng.choice(NAMES), rng.choice(COUNTIES), '{:,}'.format(rng.randint(1000, 400000)), start, end]
+        if rng.random() < 0.5:
+            cells += ['{} structures destroyed'.format(rng.randint(1, 100)), '[{}]'.format(i)]
+        else:
+            cells += ['[{}]'.format(i)]
+        rows.append('<tr>{}</tr>'.format(''.join('<td>{}</td>'.format(c) for c in cells)))
+
+    other_table = '<table class="infobox"><tbody><tr><th>Statistics</th></tr><tr><td>{}</td></tr></tbody></table>'
+    incidents_table = '<table class="wikitable sortable"><tbody>\n{}\n</tbody></table>'.format('\n'.join(rows))
+    return ('<html><head><title>{0} California wildfires</title></head><body><h1>{0} California wildfires</h1>'
+            '{1}<p>Text</p>{2}</body></html>').format(year, other_table.format(n_rows), incidents_table)
+
+
+def raw_wiki_frames(n_rows, years=range(2002, 2013), seed=0):
+    """
+    Build uncleaned per-year tables as scraped from Wikipedia, n_rows in total
+
+    Returns
+    -------
+    List of Pandas dataframes, one per year, ready for WikiFire.clean_data
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.RandomState(seed)
+    months = np.array(['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+                       'September', 'October', 'November', 'December'])
+    years = list(years)
+    frames = []
+    for i, year in enumerate(years):
+        n = n_rows // len(years) + (1 if i < n_rows % len(years) else 0)
+        month = rng.randint(0, 11, n)
+        start = pd.Series(months[month]) + ' ' + pd.Series(rng.randint(1, 29, n)).astype(str)
+        end = pd.Series(months[month + 1]) + ' ' + pd.Series(rng.randint(1, 29, n)).astype(str)
+        with_year = rng.rand(n) < 0.3
+        start[with_year] = start[with_year] + ', {}'.format(year)
+        end[rng.rand(n) < 0.01] = 'Present'
+        frames.append(pd.DataFrame({
+            'Name': np.array(NAMES)[rng.randint(0, len(NAMES), n)],
+            'County': np.array(COUNTIES)[rng.randint(0, len(COUNTIES), n)],
+            'Acres': pd.Series(rng.randint(10, 400000, n)).map('{:,}'.format),
+            'Start date': start,
+            'Containment date': end,
+            'Notes': '',
+            'Ref': '',
+            'year': year,
+        }).astype(object))
+    return frames
+
+
+def _county_lists(rng, n, missing=0.0):
+    """
+    County column as listed by Cal Fire and Wikipedia: mostly single counties, some lists
+    like "Napa, Sonoma and Lake", and some missing
+    """
+    import numpy as np
+    import pandas as pd
+    from counties import CALIFORNIA_COUNTIES
+
+    names = np.array(CALIFORNIA_COUNTIES, dtype=object)
+    county = pd.Series(names[rng.randint(0, len(names), n)])
+    pairs = rng.rand(n) < 0.05
+    county[pairs] = county[pairs] + ' and ' + names[rng.randint(0, len(names), pairs.sum())]
+    triples = rng.rand(n) < 0.01
+    county[triples] = (names[rng.randint(0, len(names), triples.sum())] + ', ' + county[triples] + ' and ' +
+                       names[rng.randint(0, len(names), triples.sum())])
+    county[rng.rand(n) < missing] = None
+    return county
+
+
+def _acres_strings(rng, n):
+    """
+    Acres as scraped: "2,400", some plain numbers and some empty
+    """
+    import numpy as np
+    import pandas as pd
+
+    acres = pd.Series(np.exp(rng.uniform(np.log(10), np.log(400000), n)).astype(int))
+    text = acres.map('{:,}'.format)
+    plain = rng.rand(n) < 0.2
+    text[plain] = acres[plain].astype(str)
+    text[rng.rand(n) < 0.02] = ''
+    return text
+
+
+def synthetic_calfire_frame(n_rows, years=range(2013, 2021), seed=0):
+    """
+    Incidents in the schema of data/<date>_calfire_data.csv: name, start_date ("7/23/2018",
+    "12/31/1969" when Cal Fire has no date), county, acres ("2,400"), containment ("95%"), year
+
+    Returns
+    -------
+    Pandas dataframe with n_rows incidents
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.RandomState(seed)
+    years = np.array(list(years))
+    year = years[rng.randint(0, len(years), n_rows)]
+    start = (pd.to_datetime(pd.Series(year).astype(str) + '-01-01') +
+             pd.to_timedelta(rng.randint(0, 365, n_rows), unit='D'))
+    start_date = (start.dt.month.astype(str) + '/' + start.dt.day.astype(str) + '/' + start.dt.year.astype(str))
+    start_date[rng.rand(n_rows) < 0.01] = '12/31/1969'
+    containment = np.where(rng.rand(n_rows) < 0.9, 100, rng.randint(0, 100, n_rows))
+    return pd.DataFrame({
+        'name': pd.Series(np.array(NAMES, dtype=object)[rng.randint(0, len(NAMES), n_rows)]) + ' Fire',
+        'start_date': start_date,
+        'county': _county_lists(rng, n_rows, missing=0.02),
+        'acres': _acres_strings(rng, n_rows),
+        'containment': pd.Series(containment).astype(str) + '%',
+        'year': year,
+    })
+
+
+def synthetic_wiki_frame(n_rows, years=range(2002, 2013), seed=0):
+    """
+    Incidents in the schema of data/<date>_wiki_calfire_data.csv: name, county, acres ("2,400"),
+    start_date and contained_date ("2002-02-09", some contained dates missing), notes, year
+
+    Returns
+    -------
+    Pandas dataframe with n_rows incidents
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.RandomState(seed + 1)
+    years = np.array(list(years))
+    year = years[rng.randint(0, len(years), n_rows)]
+    start = (pd.to_datetime(pd.Series(year).astype(str) + '-01-01') +
+             pd.to_timedelta(rng.randint(0, 365, n_rows), unit='D'))
+    contained = start + pd.to_timedelta(rng.geometric(0.1, n_rows), unit='D')
+    contained[rng.rand(n_rows) < 0.05] = pd.NaT
+    notes = pd.Series(rng.randint(1, 100, n_rows)).astype(str) + ' structures destroyed'
+    notes[rng.rand(n_rows) < 0.5] = ''
+    return pd.DataFrame({
+        'name': pd.Series(np.array(NAMES, dtype=object)[rng.randint(0, len(NAMES), n_rows)]),
+        'county': _county_lists(rng, n_rows),
+        'acres': _acres_strings(rng, n_rows),
+        'start_date': start.dt.strftime('%Y-%m-%d'),
+        'contained_date': contained.dt.strftime('%Y-%m-%d'),
+        'notes': notes,
+        'year': year,
+    })
+
+
+def write_synthetic_data(directory, n_rows, wiki_fraction=0.4, chunk_rows=1000000, seed=0):
+    """
+    Write synthetic Cal Fire and Wikipedia tables to directory/data, as dated CSVs like the
+    scraped ones, in chunks of chunk_rows so that 10M rows fit in memory. The Cal Fire store is
+    marked as just refreshed, and both tables run through the current year, so reading them
+    does not fetch anything.
+
+    Returns
+    -------
+    List of the paths written
+    """
+    import json
+    import os
+    from datetime import datetime
+
+    data = os.path.join(directory, 'data')
+    os.makedirs(data, exist_ok=True)
+    today = datetime.today()
+    n_wiki = int(n_rows * wiki_fraction)
+    paths = []
+    for stem, total, make, years in [('wiki_calfire_data', n_wiki, synthetic_wiki_frame, range(2002, today.year + 1)),
+                                     ('calfire_data', n_rows - n_wiki, synthetic_calfire_frame,
+                                      range(2013, today.year + 1))]:
+        path = os.path.join(data, '{}_{}.csv'.format(today.strftime('%Y-%m-%d'), stem))
+        for i, start in enumerate(range(0, max(total, 1), chunk_rows)):
+            make(min(chunk_rows, total - start), years=years, seed=seed + i).to_csv(path, index=None, header=i == 0,
+                                                                                    mode='w' if i == 0 else 'a')
+        paths.append(path)
+    with open(os.path.join(data, 'calfire_state.json'), 'w') as f:
+        json.dump({'last_refresh': today.isoformat(), 'last_full_refresh': today.isoformat()}, f)
+    return paths
+
+
+def mark_fresh(directory):
+    """
+    Date the tables in directory/data today, and mark the Cal Fire store as just refreshed, so that
+    reading data generated by write_synthetic_data on an earlier day does not fetch anything either
+    """
+    import json
+    import os
+    from datetime import datetime
+
+    data = os.path.join(directory, 'data')
+    today = datetime.today()
+    for filename in os.listdir(data):
+        date, _, rest = filename.partition('_')
+        if rest and date != today.strftime('%Y-%m-%d') and date[:1].isdigit():
+            os.replace(os.path.join(data, filename), os.path.join(data, '{}_{}'.format(today.strftime('%Y-%m-%d'),
+                                                                                       rest)))
+    with open(os.path.join(data, 'calfire_state.json'), 'w') as f:
+        json.dump({'last_refresh': today.isoformat(), 'last_full_refresh': today.isoformat()}, f)
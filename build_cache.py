@@ -0,0 +1,153 @@
+"""
+Content-hash based build cache for the generated figures.
+
+The manifest (images/manifest.json) records, for every figure, the fingerprint of the data
+it was drawn from and the path it was written to. A figure whose fingerprint has not changed
+is not rendered again: the previous image is hard-linked to the new path instead.
+"""
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+MANIFEST_PATH = os.path.join('images', 'manifest.json')
+
+
+def fingerprint_frame(df):
+    """
+    Returns
+    -------
+    Hex digest of the columns, dtypes and values of df
+    """
+    digest = hashlib.sha1()
+    digest.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint_figure(draw, data):
+    """
+    Fingerprint of a figure: the aggregate it is drawn from, the code drawing it, and the
+    current year (used to color recent fires).
+
+    Parameters
+    ----------
+    draw (function): plotter draw_* function
+    data (Pandas dataframe): aggregate passed to draw
+    """
+    return _fingerprint([draw], fingerprint_frame(data))
+
+
+def fingerprint_input(draws, df):
+    """
+    Fingerprint of a whole build: the input data, the code drawing every figure, and the current year
+
+    Parameters
+    ----------
+    draws (list): plotter draw_* functions
+    df (Pandas dataframe): input data
+    """
+    return _fingerprint(draws, fingerprint_frame(df))
+
+
+def _fingerprint(draws, data_fingerprint):
+    digest = hashlib.sha1()
+    for draw in draws:
+        digest.update(draw.__name__.encode('utf-8'))
+        digest.update(draw.__code__.co_code)
+        digest.update(repr(draw.__code__.co_consts).encode('utf-8'))
+    digest.update(str(datetime.today().year).encode('utf-8'))
+    digest.update(data_fingerprint.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PlotBuildCache(object):
+
+    def __init__(self, manifest_path=MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        try:
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {'input': None, 'figures': {}}
+
+    def input_is_current(self, input_fingerprint):
+        """
+        Returns
+        -------
+        True if the input data is unchanged and every recorded figure still exists
+        """
+        figures = self.manifest['figures']
+        return (bool(figures) and self.manifest['input'] == input_fingerprint
+                and all(os.path.exists(entry['path']) for entry in figures.values()))
+
+    def figures(self):
+        """
+        Returns
+        -------
+        Names of the recorded figures
+        """
+        return list(self.manifest['figures'])
+
+    def reuse(self, name, fingerprint, path):
+        """
+        Put the previous image of figure <name> at path, if it was drawn from the same fingerprint
+
+        Parameters
+        ----------
+        name (string): figure name
+        fingerprint (string): fingerprint of the figure, or None to accept the recorded one
+        path (string): where the figure should be
+
+        Returns
+        -------
+        True if the previous image was reused, False if the figure needs to be rendered
+        """
+        entry = self.manifest['figures'].get(name)
+        if entry is None or not os.path.exists(entry['path']):
+            return False
+        if fingerprint is not None and entry['fingerprint'] != fingerprint:
+            return False
+
+        if os.path.abspath(entry['path']) != os.path.abspath(path):
+            self._link(entry['path'], path)
+            logging.info("{} unchanged, linked {}".format(name, path))
+        else:
+            logging.info("{} unchanged, keeping {}".format(name, path))
+        entry['path'] = path
+        return True
+
+    def record(self, name, fingerprint, path):
+        self.manifest['figures'][name] = {
+            'path': path,
+            'fingerprint': fingerprint,
+            'rendered_at': datetime.today().isoformat(),
+        }
+
+    def save(self, input_fingerprint):
+        """
+        Write the manifest, recording the fingerprint of the input data
+        """
+        self.manifest['input'] = input_fingerprint
+        directory = os.path.dirname(self.manifest_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _link(source, path):
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            os.link(source, path)
+        except OSError:
+            # File systems without hard links
+            shutil.copyfile(source, path)
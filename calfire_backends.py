@@ -0,0 +1,443 @@
+"""
+Fetch backends for Cal Fire incident data.
+
+A backend opens sessions, and turns an incidents page url into a dataframe with the
+columns in INCIDENT_COLUMNS, using one of those sessions:
+
+    session = backend.open()
+    df = backend.fetch(url, session)
+    backend.close(session)
+
+backend.iter_pages(url, session) yields the same rows one page at a time instead, so they can
+be stored as they arrive.
+
+Errors listed in backend.errors are the ones worth retrying with a fresh session.
+
+selenium, requests, bs4 and pandas are imported when a backend first uses them, so that
+importing this module (e.g. for BACKENDS in a CLI) stays cheap.
+"""
+from urllib.parse import urlsplit
+import logging
+import json
+import re
+
+import instrumentation
+
+INCIDENT_COLUMNS = ['name', 'start_date', 'county', 'acres', 'containment']
+
+# JSON feed behind the incidents pages, relative to the site root
+INCIDENT_FEED_PATH = '/umbraco/api/IncidentApi/List'
+
+
+def parse_incident_page(html):
+    """
+    Extract all rows of a rendered incident table page in one pass over its html.
+
+    Mirrors the xpaths used when reading cell by cell: rows are the divs under
+    //*[@id="incidentListTable"]/div/div, the first row is the header, and the first
+    five cells of a row are name, date, county, acres and containment.
+
+    Parameters
+    ----------
+    html (string): page source
+
+    Returns
+    -------
+    List of rows, each a list of the five column values. An incident table without incidents gives
+    an empty list.
+
+    Raises
+    ------
+    ValueError if the page has no incident table, e.g. because it is not rendered
+    """
+    from bs4 import BeautifulSoup
+
+    parsed_page = BeautifulSoup(html, "html.parser")
+    incident_table = parsed_page.find(id="incidentListTable")
+    container = None
+    if incident_table is not None:
+        container = incident_table.find('div', recursive=False)
+        if container is not None:
+            container = container.find('div', recursive=False)
+    if container is None:
+        raise ValueError("No incident table found on the page")
+
+    fires = []
+    for row in container.find_all('div', recursive=False)[1:]:
+        cells = row.find_all('div', recursive=False)[:len(INCIDENT_COLUMNS)]
+        if len(cells) < len(INCIDENT_COLUMNS):
+            break
+        fires.append([' '.join(cell.get_text(' ').split()) for cell in cells])
+    return fires
+
+
+def parse_incident_feed(records, year=None):
+    """
+    Convert records of the incident JSON feed to rows formatted like the scraped table
+
+    Parameters
+    ----------
+    records (list of dicts): as returned by the feed
+    year (int): keep only incidents started in this year
+
+    Returns
+    -------
+    List of rows, each a list of the five column values
+    """
+    import pandas as pd
+
+    fires = []
+    for record in records:
+        started = pd.to_datetime(record.get('Started') or record.get('StartedDateOnly'), errors='coerce')
+        if year is not None and (pd.isnull(started) or started.year != year):
+            continue
+
+        counties = record.get('Counties') or record.get('County') or ''
+        if isinstance(counties, str):
+            counties = [c.strip() for c in counties.split(',') if c.strip()]
+        if len(counties) > 1:
+            county = '{} and {}'.format(', '.join(counties[:-1]), counties[-1])
+        else:
+            county = ''.join(counties)
+
+        acres = record.get('AcresBurned')
+        contained = record.get('PercentContained')
+        fires.append([
+            (record.get('Name') or '').strip(),
+            '' if pd.isnull(started) else '{}/{}/{}'.format(started.month, started.day, started.year),
+            county,
+            '' if acres is None else '{:,}'.format(int(acres)),
+            '' if contained is None else '{}%'.format(int(contained)),
+        ])
+    return fires
+
+
+class SeleniumBackend(object):
+    """
+    Scrape the rendered incidents table with chromedriver.
+    """
+    name = 'selenium'
+
+    @property
+    def errors(self):
+        from selenium.common.exceptions import WebDriverException
+        # ValueError: a page source without the incident table
+        return (WebDriverException, ValueError)
+
+    def __init__(self, path_to_chromedriver, headless=False, bulk_extract=True):
+        self.path_to_chromedriver = path_to_chromedriver
+        self.headless = headless
+        self.bulk_extract = bulk_extract
+
+    def open(self, headless=None):
+        """
+        Start a chromedriver instance
+
+        Parameters
+        ----------
+        headless (bool): defaults to self.headless
+        """
+        from selenium import webdriver
+
+        if headless is None:
+            headless = self.headless
+        options = webdriver.ChromeOptions()
+        if headless:
+            options.add_argument('--headless')
+            options.add_argument('--disable-gpu')
+        return webdriver.Chrome(self.path_to_chromedriver, options=options)
+
+    def close(self, driver):
+        driver.quit()
+
+    def fetch(self, url, driver):
+        """
+        Function to fetch data using xpaths
+        Parameters
+        ----------
+        url (string)
+        driver (chromedriver instance)
+
+        Returns
+        -------
+        Pandas dataframe with data scraped from the given calfire url
+        """
+        import pandas as pd
+
+        fires = []
+        for page in self.iter_pages(url, driver):
+            fires += page
+        df = pd.DataFrame(fires, columns=INCIDENT_COLUMNS)
+        return df
+
+    def iter_pages(self, url, driver, skip=0):
+        """
+        Parameters
+        ----------
+        url (string)
+        driver (chromedriver instance)
+        skip (int): number of pages not to read, e.g. because they were read before an interruption
+
+        Yields
+        ------
+        Rows of each page of the incident table, as lists of the five column values
+        """
+        from selenium.common.exceptions import NoSuchElementException
+
+        driver.get(url)
+        page_number = 1
+        while page_number:
+            try:
+                xpath_to_page_button = '//*[@id="incidentListTable"]/div/nav/ul/li[{}]/a'.format(page_number)
+                page_button = driver.find_element_by_xpath(xpath_to_page_button)
+                page_button.click()
+            except NoSuchElementException as e:
+                logging.debug(e)
+                logging.debug("Completed all pages")
+                break
+
+            if page_number > skip:
+                instrumentation.count('pages_fetched')
+                if self.bulk_extract:
+                    # One round trip for the whole page, instead of one per cell
+                    html = driver.page_source
+                    instrumentation.count('bytes_downloaded', len(html))
+                    with instrumentation.stage('calfire.parse'):
+                        rows = parse_incident_page(html)
+                    yield rows
+                else:
+                    yield self.read_rows_by_cell(driver)
+                logging.debug("Completed page {}".format(page_number))
+            page_number += 1
+
+    @staticmethod
+    def read_rows_by_cell(driver):
+        """
+        Read the rows of the currently displayed incident page, one xpath lookup per cell
+
+        Parameters
+        ----------
+        driver (chromedriver instance)
+
+        Returns
+        -------
+        List of rows, each a list of the five column values
+        """
+        from selenium.common.exceptions import NoSuchElementException
+
+        xpath_base_string = '//*[@id="incidentListTable"]/div/div/'
+        fires = []
+        # We scan by row, and then fetch data in each column of the row
+        row_num = 2   # row_num 1 is the header
+        while row_num:
+            try:
+                res = []
+                for col_num in range(1, 6):
+                    # col_num = 1 - 5 corresponds to name, date, county, acres, containment
+                    xpath_to_element = '{}div[{}]/div[{}]'.format(xpath_base_string, row_num, col_num)
+                    element = driver.find_element_by_xpath(xpath_to_element)
+                    element = element.text
+                    res.append(element)
+                fires.append(res)
+                row_num += 1
+            except NoSuchElementException as e:
+                logging.debug(e)
+                logging.debug("Got all rows on this page")
+                break
+        return fires
+
+
+class HttpBackend(object):
+    """
+    Fetch incidents over plain http, without a browser.
+
+    Incidents are read from the site's JSON feed. If the feed is unavailable, the rows
+    embedded in the incidents page html are used instead. With a PageCache, responses are
+    revalidated with conditional requests, and unchanged responses are not parsed again.
+    """
+    name = 'http'
+
+    @property
+    def errors(self):
+        import requests
+        return (requests.RequestException, ValueError)
+
+    def __init__(self, timeout=30, pool_size=10, feed_path=INCIDENT_FEED_PATH, cache=None):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.feed_path = feed_path
+        self.cache = cache
+
+    def open(self, headless=None):
+        """
+        Returns
+        -------
+        requests.Session with a connection pool of self.pool_size
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self, session):
+        session.close()
+
+    def fetch(self, url, session):
+        """
+        Parameters
+        ----------
+        url (string): incidents page, either for a year (".../incidents/2020/") or for active fires
+        session (requests.Session)
+
+        Returns
+        -------
+        Pandas dataframe with the same columns as the scraped table
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self._fetch_rows(url, session), columns=INCIDENT_COLUMNS)
+
+    def iter_pages(self, url, session, skip=0):
+        """
+        The feed lists all incidents of a url in one response, so they come as a single page.
+
+        Yields
+        ------
+        Rows of all incidents, as lists of the five column values, unless skip is at least 1
+        """
+        if skip < 1:
+            yield self._fetch_rows(url, session)
+
+    def _fetch_rows(self, url, session):
+        year = self._year_from_url(url)
+        parts = urlsplit(url)
+        feed_url = '{}://{}{}'.format(parts.scheme, parts.netloc, self.feed_path)
+        params = {'inactive': 'true' if year else 'false'}
+        if year:
+            params['year'] = year
+
+        try:
+            fires = self._get_parsed(feed_url, params, session, lambda text: self._parse_feed(text, year))
+        except self.errors as e:
+            logging.info("Incident feed unavailable ({}), reading the page instead".format(e))
+            fires = self._get_parsed(url, None, session, parse_incident_page)
+        return fires
+
+    def _get_parsed(self, url, params, session, parse):
+        """
+        GET url and parse the body. With a cache, a 304 reuses the previously parsed result.
+        """
+        instrumentation.count('pages_fetched')
+        if self.cache is None:
+            response = session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            instrumentation.count('bytes_downloaded', len(response.content))
+            with instrumentation.stage('calfire.parse'):
+                return parse(response.text)
+
+        page = self.cache.get(url, session, params=params, timeout=self.timeout)
+        if page.not_modified:
+            parsed = self.cache.load_parsed(url, params=params)
+            if parsed is not None:
+                return parsed
+        with instrumentation.stage('calfire.parse'):
+            parsed = parse(page.text)
+        self.cache.store_parsed(url, parsed, params=params)
+        return parsed
+
+    @staticmethod
+    def _parse_feed(text, year):
+        records = json.loads(text)
+        if not isinstance(records, list):
+            raise ValueError("Unexpected incident feed format")
+        if not year:
+            records = [record for record in records if record.get('IsActive', True)]
+        return parse_incident_feed(records, year)
+
+    @staticmethod
+    def _year_from_url(url):
+        match = re.search(r'/(\d{4})/?$', url)
+        return int(match.group(1)) if match else None
+
+
+class FallbackBackend(object):
+    """
+    Use a primary backend, and fall back to a secondary one for urls the primary fails on.
+
+    The secondary session is only opened the first time it is needed.
+    """
+    name = 'auto'
+
+    def __init__(self, primary, secondary):
+        self.primary = primary
+        self.secondary = secondary
+
+    @property
+    def errors(self):
+        return tuple(self.primary.errors) + tuple(self.secondary.errors)
+
+    def open(self, headless=None):
+        return {'primary': self.primary.open(headless), 'secondary': None, 'headless': headless}
+
+    def close(self, session):
+        self.primary.close(session['primary'])
+        if session['secondary'] is not None:
+            self.secondary.close(session['secondary'])
+
+    def fetch(self, url, session):
+        try:
+            return self.primary.fetch(url, session['primary'])
+        except self.primary.errors as e:
+            logging.warning("{} backend failed for {} ({}), using {}".format(self.primary.name, url, e,
+                                                                             self.secondary.name))
+        return self.secondary.fetch(url, self._secondary_session(session))
+
+    def iter_pages(self, url, session, skip=0):
+        # Pages of one backend do not line up with pages of the other, so the secondary backend is
+        # only used if the primary one fails before yielding anything. Later failures are raised.
+        pages = 0
+        try:
+            for page in self.primary.iter_pages(url, session['primary'], skip):
+                pages += 1
+                yield page
+            return
+        except self.primary.errors as e:
+            if pages:
+                raise
+            logging.warning("{} backend failed for {} ({}), using {}".format(self.primary.name, url, e,
+                                                                             self.secondary.name))
+        for page in self.secondary.iter_pages(url, self._secondary_session(session), skip):
+            yield page
+
+    def _secondary_session(self, session):
+        if session['secondary'] is None:
+            session['secondary'] = self.secondary.open(session['headless'])
+        return session['secondary']
+
+
+BACKENDS = ['selenium', 'http', 'auto']
+
+
+def get_backend(name, path_to_chromedriver=None, headless=False, bulk_extract=True, cache=None):
+    """
+    Parameters
+    ----------
+    name (string): one of BACKENDS. "auto" uses http, and falls back to selenium.
+    cache (http_cache.PageCache): used by the http backend
+
+    Returns
+    -------
+    Backend instance
+    """
+    if name == 'selenium':
+        return SeleniumBackend(path_to_chromedriver, headless=headless, bulk_extract=bulk_extract)
+    elif name == 'http':
+        return HttpBackend(cache=cache)
+    elif name == 'auto':
+        return FallbackBackend(HttpBackend(cache=cache),
+                               SeleniumBackend(path_to_chromedriver, headless=headless, bulk_extract=bulk_extract))
+    raise ValueError("Unknown backend {}, expected one of {}".format(name, BACKENDS))
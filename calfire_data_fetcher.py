@@ -1,7 +1,11 @@
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
+from calfire_backends import BACKENDS, INCIDENT_COLUMNS, get_backend
+from incident_store import IncidentStore
+import instrumentation
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+import threading
+import queue
 import os
 import logging
 import sys
@@ -10,52 +14,138 @@ import argparse
 log_format = '%(asctime)s|%(levelname)s| %(message)s'
 logging.basicConfig(stream=sys.stdout, format=log_format, level=logging.INFO)
 
-DATE_STRING = datetime.today().strftime(format='%Y-%m-%d')
+CALFIRE_URL = 'https://www.fire.ca.gov/incidents/'
+
+
+class _SessionPool(object):
+    """
+    Bounded pool of backend sessions (browsers or http sessions) shared by the fetch workers.
+
+    Sessions are opened lazily, so the pool never holds more sessions than there are
+    workers asking for one. A session that failed is discarded and replaced on the next acquire.
+    """
+
+    def __init__(self, backend, headless=True):
+        self._backend = backend
+        self._headless = headless
+        self._idle = queue.Queue()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            session = self._backend.open(headless=self._headless)
+            with self._lock:
+                self._sessions.append(session)
+            return session
+
+    def release(self, session):
+        self._idle.put(session)
+
+    def discard(self, session):
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+        self._close(session)
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            self._close(session)
+
+    def _close(self, session):
+        try:
+            self._backend.close(session)
+        except self._backend.errors as e:
+            logging.debug(e)
 
 
 class CalFire(object):
-    def __init__(self):
-        self.path_to_chromedriver = os.path.join(os.pardir, "chromedriver")
+    def __init__(self, path_to_chromedriver=None, headless=False, base_url=CALFIRE_URL, bulk_extract=True,
+                 backend='selenium', cache=None):
+        """
+        Parameters
+        ----------
+        path_to_chromedriver (string): defaults to "../chromedriver"
+        headless (bool): run chrome without a window. Parallel fetches are always headless.
+        base_url (string): incidents page. Point this at a local server to scrape saved pages.
+        bulk_extract (bool): read each incident page from its page source in a single call,
+                             instead of looking up every cell by xpath.
+        backend (string or backend instance): "selenium", "http", or "auto" (http, falling back
+                                              to selenium). See calfire_backends.py.
+        cache (http_cache.PageCache): raw response cache, used by the http backend
+        """
+        if path_to_chromedriver is None:
+            path_to_chromedriver = os.path.join(os.pardir, "chromedriver")
+        self.path_to_chromedriver = path_to_chromedriver
+        self.headless = headless
+        self.base_url = base_url
+        self.bulk_extract = bulk_extract
+        if isinstance(backend, str):
+            backend = get_backend(backend, path_to_chromedriver, headless=headless, bulk_extract=bulk_extract,
+                                  cache=cache)
+        self.backend = backend
 
-    def get_data(self):
+    def get_data(self, refresh_hours=1, full_refresh_days=10, columns=None, export_csv=False, workers=1):
         """
-        Read data from disk if file available, else fetch from web.
+        Read data from disk if available, else fetch from web.
+
+        Stored data is refreshed incrementally: currently active fires are fetched and
+        upserted into the store, and only new or changed incidents are written. Fires drop
+        off the active list once contained, so every full_refresh_days the current year is
+        fetched instead, to record their final state.
+
+        Parameters
+        ----------
+        refresh_hours (float): stored data younger than this is used as is
+        full_refresh_days (float): how often the whole current year is reconciled
+        columns (list): return only these columns
+        export_csv (bool): also write stored snapshots as CSV
+        workers (int): number of years fetched concurrently when the store is first filled, see fetch
 
         Returns
         -------
-        Dataframe with fire data.
+        Dataframe with fire data, typed as in storage.SCHEMA
         """
+        store = IncidentStore(export_csv=export_csv)
+        now = datetime.today()
+        current_year = now.year
 
-        calfire_filename = None
-        for filename in os.listdir('data/'):
-            if 'wiki' not in filename:
-                calfire_filename = filename
-
-        if not calfire_filename:
+        if not store.exists():
             logging.info("No file with Cal Fire data found locally. Fetching now.")
-            df = self.fetch(2013, 2020)
-        else:
-            logging.info("Using Calfire file {}".format(calfire_filename))
-            file_date = calfire_filename.split("_")[0]
-            file_date = pd.to_datetime(file_date)
-            data_age = (datetime.today() - file_date).days
+            staging = self.stream(2013, current_year, store.staging(), workers=workers)
+            store.write_staged(staging)
+            store.set_state('last_refresh', now)
+            store.set_state('last_full_refresh', now)
+            return store.load(columns)
 
-            calfire_filename = os.path.join('data', calfire_filename)
-            df = pd.read_csv(calfire_filename)
+        store.migrate()
+        logging.info("Using Calfire file {}".format(store.base_path()))
+        last_refresh = store.get_state('last_refresh') or self._snapshot_date(store.base_path())
+        if (now - last_refresh).total_seconds() < refresh_hours * 3600:
+            return store.load(columns)
 
-            if data_age < 10:
-                return df
-            else:
-                logging.info("Local file is more than 10 days old. Updating fires")
-                current_year = datetime.today().year
-                fires = self.fetch(current_year, current_year)
-                df = pd.concat([df[df.year < current_year], fires])
+        last_full_refresh = store.get_state('last_full_refresh') or self._snapshot_date(store.base_path())
+        if (now - last_full_refresh).days >= full_refresh_days:
+            logging.info("Reconciling all fires of {}".format(current_year))
+            fires = self.fetch(current_year, current_year)
+            store.set_state('last_full_refresh', now)
+        else:
+            logging.info("Updating active fires")
+            fires = self.fetch_active_fires()
+            start_year = pd.to_datetime(fires.start_date, errors='coerce').dt.year
+            fires['year'] = start_year.fillna(current_year).astype(int)
 
-            os.remove(calfire_filename)
+        store.upsert(fires)
+        store.set_state('last_refresh', now)
+        return store.load(columns)
 
-        filename = 'data/{}_calfire_data.csv'.format(DATE_STRING)
-        df.to_csv(filename, index=None)
-        return df
+    @staticmethod
+    def _snapshot_date(path):
+        return pd.to_datetime(os.path.basename(path).split("_")[0]).to_pydatetime()
 
     def fetch_active_fires(self):
         """
@@ -63,13 +153,15 @@ class CalFire(object):
         -------
         Pandas dataframe with currently active fires
         """
-        driver = webdriver.Chrome(self.path_to_chromedriver)
-        url = 'https://www.fire.ca.gov/incidents/'
-        df = self._fetch_data(url, driver)
-        driver.quit()
+        session = self.backend.open()
+        try:
+            df = self._fetch_data(self.base_url, session)
+        finally:
+            self.backend.close(session)
         return df
 
-    def fetch(self, start_year, end_year):
+    @instrumentation.timed('calfire.fetch')
+    def fetch(self, start_year, end_year, workers=1, retries=2):
         """
         Fetch all fires from start_year through end_year
 
@@ -77,71 +169,137 @@ class CalFire(object):
         ----------
         start_year (int)
         end_year (int)
+        workers (int): number of years fetched concurrently, each with its own backend session
+                       (a headless browser for selenium).
+        retries (int): number of times a failed year is retried.
 
         Returns
         -------
-        Pandas dataframe
+        Pandas dataframe, ordered by year
         """
-        driver = webdriver.Chrome(self.path_to_chromedriver)
-        dfs = []
-        for year in range(start_year, end_year+1):
-            url = 'https://www.fire.ca.gov/incidents/{}/'.format(year)
-            logging.info("Fetching Calfire data for year {}".format(year))
-            df = self._fetch_data(url, driver)
-            df['year'] = year
-            dfs.append(df)
-
-        fire_df = pd.concat(dfs)
-        driver.quit()
-        return fire_df
+        years = list(range(start_year, end_year+1))
+        fires = {}
+
+        def fetch_year(year, session):
+            rows = []
+            for page in self.backend.iter_pages(self._year_url(year), session):
+                rows += page
+                instrumentation.count('rows_parsed', len(page))
+            fires[year] = self._year_frame(rows, year)
 
+        self._for_each_year(years, fetch_year, workers, retries)
+        return pd.concat([fires[year] for year in years])
+
+    @instrumentation.timed('calfire.stream')
+    def stream(self, start_year, end_year, staging, workers=1, retries=2):
+        """
+        Fetch all fires from start_year through end_year into staging, one page at a time.
+
+        Every page is stored as soon as it is read, so memory use does not grow with the number
+        of pages, and a fetch that was interrupted resumes after the last page it stored.
+        Years that were completed before are not fetched again.
+
+        Parameters
+        ----------
+        start_year (int)
+        end_year (int)
+        staging (staging.StagedTable): e.g. IncidentStore.staging()
+        workers (int): number of years fetched concurrently
+        retries (int): number of times a failed year is retried, from its last stored page
+
+        Returns
+        -------
+        staging, with every year complete
+        """
+        completed = staging.completed()
+        years = [year for year in range(start_year, end_year+1) if str(year) not in completed]
+
+        def stream_year(year, session):
+            unit = str(year)
+            skip = staging.batches(unit)
+            if skip:
+                logging.info("Resuming year {} after page {}".format(year, skip))
+            for page in self.backend.iter_pages(self._year_url(year), session, skip=skip):
+                instrumentation.count('rows_parsed', len(page))
+                staging.append(unit, self._year_frame(page, year))
+            staging.complete(unit)
+
+        self._for_each_year(years, stream_year, workers, retries)
+        return staging
+
+    def _for_each_year(self, years, fetch_year, workers=1, retries=2):
+        """
+        Call fetch_year(year, session) for every year, with sessions from a pool of backend sessions.
+        A year that fails with one of the backend errors is retried with a fresh session.
+
+        Parameters
+        ----------
+        years (list)
+        fetch_year (function)
+        workers (int): number of years fetched concurrently. Parallel fetches are always headless.
+        retries (int)
+        """
+        parallel = workers > 1 and len(years) > 1
+        pool = _SessionPool(self.backend, headless=True if parallel else None)
+
+        def fetch_with_retries(year):
+            for attempt in range(retries + 1):
+                session = pool.acquire()
+                try:
+                    logging.info("Fetching Calfire data for year {}".format(year))
+                    fetch_year(year, session)
+                except self.backend.errors as e:
+                    pool.discard(session)
+                    if attempt == retries:
+                        raise
+                    logging.warning("Failed to fetch year {} (attempt {}): {}".format(year, attempt + 1, e))
+                    continue
+                pool.release(session)
+                return
+
+        # Counters of the worker threads go to the stages of this one, e.g. calfire.fetch
+        stages = instrumentation.current_stages()
+
+        def fetch_in_stages(year):
+            with instrumentation.within(stages):
+                fetch_with_retries(year)
+
+        try:
+            if parallel:
+                with ThreadPoolExecutor(max_workers=min(workers, len(years))) as executor:
+                    for future in as_completed([executor.submit(fetch_in_stages, year) for year in years]):
+                        future.result()
+            else:
+                for year in years:
+                    fetch_with_retries(year)
+        finally:
+            pool.close()
+
+    @staticmethod
+    def _year_frame(rows, year):
+        df = pd.DataFrame(rows, columns=INCIDENT_COLUMNS)
+        df['year'] = year
+        return df
+
+    def _year_url(self, year):
+        return '{}{}/'.format(self.base_url, year)
+
+    @instrumentation.timed('calfire.fetch_data')
     def _fetch_data(self, url, driver):
         """
-        Function to fetch data using xpaths
+        Fetch the incidents listed at url
+
         Parameters
         ----------
         url (string)
-        driver (chromedriver instance)
+        driver (session opened by self.backend; a chromedriver instance for selenium)
 
         Returns
         -------
         Pandas dataframe with data scraped from the given calfire url
         """
-        driver.get(url)
-        xpath_base_string = '//*[@id="incidentListTable"]/div/div/'
-        fires = []
-        page_number = 1
-        while page_number:
-            try:
-                xpath_to_page_button = '//*[@id="incidentListTable"]/div/nav/ul/li[{}]/a'.format(page_number)
-                page_button = driver.find_element_by_xpath(xpath_to_page_button)
-                page_button.click()
-            except NoSuchElementException as e:
-                logging.debug(e)
-                logging.debug("Completed all pages")
-                break
-
-            # We scan by row, and then fetch data in each column of the row
-            row_num = 2   # row_num 1 is the header
-            while row_num:
-                try:
-                    res = []
-                    for col_num in range(1, 6):
-                        # col_num = 1 - 5 corresponds to name, date, county, acres, containment
-                        xpath_to_element = '{}div[{}]/div[{}]'.format(xpath_base_string, row_num, col_num)
-                        element = driver.find_element_by_xpath(xpath_to_element)
-                        element = element.text
-                        res.append(element)
-                    fires.append(res)
-                    row_num += 1
-                except NoSuchElementException as e:
-                    logging.debug(e)
-                    logging.debug("Got all rows on this page")
-                    break
-            logging.debug("Completed page {}".format(page_number))
-            page_number += 1
-
-        df = pd.DataFrame(fires, columns=['name', 'start_date', 'county', 'acres', 'containment'])
+        df = self.backend.fetch(url, driver)
+        instrumentation.count('rows_parsed', len(df))
         return df
 
 
@@ -151,9 +309,15 @@ if __name__ == '__main__':
     ap.add_argument("-u", "--update", required=False, help="get only currently active fires")
     ap.add_argument("-s", "--start_year", default=2013, required=False, help="get fires starting from this year")
     ap.add_argument("-e", "--end_year", default=2020, required=False, help="get fires ending on this year")
+    ap.add_argument("-w", "--workers", default=1, required=False, help="number of years to fetch in parallel")
+    ap.add_argument("--headless", action='store_true', help="run chrome without a window")
+    ap.add_argument("--chromedriver", default=None, required=False, help="path to chromedriver")
+    ap.add_argument("--base_url", default=CALFIRE_URL, required=False, help="incidents page to scrape")
+    ap.add_argument("-b", "--backend", default='selenium', choices=BACKENDS, help="how to fetch incidents")
     args = vars(ap.parse_args())
 
-    calfire = CalFire()
+    calfire = CalFire(args['chromedriver'], headless=args['headless'], base_url=args['base_url'],
+                      backend=args['backend'])
     if args['update']:
         calfire.fetch_active_fires()
     else:
@@ -164,4 +328,4 @@ if __name__ == '__main__':
         end_year = int(args['end_year'])
         logging.info("Fetching complete data starting from {} to {}.".format(start_year, end_year))
 
-        calfire.fetch(start_year, end_year)
+        calfire.fetch(start_year, end_year, workers=int(args['workers']))
@@ -0,0 +1,217 @@
+"""
+Compact in-memory representation of the combined fire data, for holding long histories.
+
+The combined frame carries object columns: names and counties repeated across years, containment
+as strings like "100%", contained dates as a mix of Timestamps, dates, strings and None, and free
+text notes, on a duplicated index left by concat. compact_incidents types every column:
+
+    name, county            categorical, each distinct string stored once
+    acres                   nullable integer (Int32)
+    start_date, contained_date
+                            datetime64, NaT if missing or unparseable
+    containment             percentage as nullable uint8 (UInt8)
+    year                    int16
+    area_SF                 float32
+
+and moves notes, read by few consumers, to a NotesTable that keeps only the fires that have
+notes, or reads them from the stored table when first asked for. The result works everywhere
+the combined frame does (FireAggregates, Plotter, FireCube), with the same figures.
+
+    python compact.py [data/<date>_combined_fire_data.parquet]
+
+prints memory_report of the latest combined table before and after.
+"""
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+NOTES = 'notes'
+# Columns stored as categoricals
+CATEGORIES = ['name', 'county', 'source', 'wiki_name']
+
+
+class NotesTable(object):
+    """
+    Notes of the fires, by row of the compact frame, loaded on demand
+    """
+
+    def __init__(self, notes=None, path=None):
+        """
+        Parameters
+        ----------
+        notes (Pandas series): notes indexed by row, only fires with notes
+        path (string): stored table with a notes column, one row per fire, read on first use if
+                       notes is None
+        """
+        self._notes = notes
+        self.path = path
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Parameters
+        ----------
+        df (Pandas dataframe): fires, in the order of the compact frame
+
+        Returns
+        -------
+        NotesTable of the non-empty notes of df
+        """
+        if NOTES not in df.columns:
+            return cls(pd.Series([], dtype=object))
+        return cls(_non_empty(df[NOTES].reset_index(drop=True)))
+
+    @property
+    def notes(self):
+        """
+        Pandas series of the non-empty notes, indexed by row
+        """
+        if self._notes is None:
+            from storage import read_table
+
+            logging.info("Loading notes from {}".format(self.path))
+            self._notes = _non_empty(read_table(self.path, columns=[NOTES])[NOTES])
+        return self._notes
+
+    @property
+    def loaded(self):
+        return self._notes is not None
+
+    def __len__(self):
+        return len(self.notes)
+
+    def get(self, rows):
+        """
+        Parameters
+        ----------
+        rows (list): rows of the compact frame, e.g. the index of a selection of it
+
+        Returns
+        -------
+        Pandas series with the notes of each row, '' if it has none, indexed by rows
+        """
+        return self.notes.reindex(pd.Index(rows)).fillna('')
+
+
+def _non_empty(notes):
+    notes = notes.astype(object)
+    keep = notes.notnull() & (notes.astype(str).str.strip() != '')
+    return notes[keep]
+
+
+def compact_incidents(df, path=None):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): combined fire data, as returned by run.get_combined_dataframe or stored
+                           by run.py clean (with or without notes)
+    path (string): stored table df was read from. If df has no notes column, the NotesTable reads
+                   them from it when first used.
+
+    Returns
+    -------
+    (compact dataframe, NotesTable). The dataframe has a RangeIndex, the rows of the notes table.
+    """
+    # Without copying the columns, as reset_index would
+    df = df.copy(deep=False)
+    df.index = pd.RangeIndex(len(df))
+    if NOTES in df.columns:
+        notes = NotesTable.from_frame(df)
+    else:
+        notes = NotesTable(path=path) if path is not None else NotesTable(pd.Series([], dtype=object))
+
+    compact = pd.DataFrame(index=df.index)
+    for column in df.columns:
+        if column == NOTES:
+            continue
+        values = df[column]
+        if column in CATEGORIES:
+            compact[column] = values.astype('category')
+        elif column == 'acres':
+            if not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values.astype(str).str.replace(",", "", regex=False), errors='coerce')
+            compact[column] = values.round().astype('Int32')
+        elif column.endswith('_date'):
+            compact[column] = _dates(values)
+        elif column == 'containment':
+            compact[column] = containment_percent(values)
+        elif column == 'year':
+            compact[column] = pd.to_numeric(values).astype(np.int16)
+        elif column in ['area_SF', 'match_score', 'wiki_acres']:
+            compact[column] = pd.to_numeric(values, errors='coerce').astype(np.float32)
+        else:
+            compact[column] = values
+    return compact, notes
+
+
+def _dates(values):
+    # Timestamps, dates, strings and None alike, to datetime64
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values, errors='coerce')
+
+
+def containment_percent(values):
+    """
+    Parameters
+    ----------
+    values (Pandas series): containment as "75%", 75 or missing
+
+    Returns
+    -------
+    Pandas series of percentages from 0 to 100 as nullable uint8, missing if unknown
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        percent = values.astype(np.float64)
+    else:
+        # Parse each distinct string once
+        codes, uniques = pd.factorize(values.astype(object))
+        parsed = pd.to_numeric(pd.Series(uniques, dtype=object).astype(str).str.strip().str.rstrip('%'),
+                               errors='coerce').to_numpy(dtype=np.float64)
+        percent = pd.Series(np.append(parsed, np.nan)[codes], index=values.index)
+    percent = percent.where((percent >= 0) & (percent <= 100))
+    return percent.round().astype('UInt8')
+
+
+def memory_report(df, notes=None):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe)
+    notes (NotesTable): counted if loaded
+
+    Returns
+    -------
+    Dataframe with column, dtype and bytes (memory_usage(deep=True)) of each column and the
+    index, and a last row with the total
+    """
+    usage = df.memory_usage(deep=True)
+    report = pd.DataFrame({'column': usage.index, 'dtype': ['index'] + [str(dtype) for dtype in df.dtypes],
+                           'bytes': usage.values})
+    if notes is not None and notes.loaded:
+        report.loc[len(report)] = ['notes (side table)', 'object', int(notes.notes.memory_usage(deep=True))]
+    report.loc[len(report)] = ['total', '', int(report.bytes.sum())]
+    return report
+
+
+if __name__ == '__main__':
+    from run import COMBINED_STEM
+    from storage import find_table, read_table
+
+    ap = argparse.ArgumentParser(description="Memory of the combined fire data, before and after compact_incidents")
+    ap.add_argument("path", nargs='?', default=None, help="combined table, the latest in data/ by default")
+    args = vars(ap.parse_args())
+
+    path = args['path'] or find_table('data', COMBINED_STEM)
+    if path is None:
+        raise SystemExit("No combined data found, run 'python run.py clean' first")
+    df = read_table(path)
+    compact, notes = compact_incidents(df)
+    before, after = memory_report(df), memory_report(compact, notes)
+    print(before.to_string(index=False))
+    print()
+    print(after.to_string(index=False))
+    print()
+    print("{:,} fires: {:.1f} MB -> {:.1f} MB".format(len(df), before.bytes.iloc[-1] / 1e6, after.bytes.iloc[-1] / 1e6))
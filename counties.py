@@ -1,33 +1,224 @@
-bay_area = ['Santa Clara', 'San Mateo', 'San Francisco', 'Marin', 'Sonoma', 
+"""
+Reference table of California counties, and helpers to classify the county column of fire data.
+
+Cal Fire and Wikipedia list a fire in several counties as "Napa, Sonoma and Lake", and sometimes
+leave the county out. normalize_counties turns such strings into canonical sets of counties, and
+single_county into one county or 'Multiple Counties', and explode_counties splits each fire into one
+row per county, with its share of the acres. All of them parse each distinct string once, so they
+take about as long as factorizing the column.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+bay_area = ['Santa Clara', 'San Mateo', 'San Francisco', 'Marin', 'Sonoma',
             'Napa', 'Solano', 'Contra Costa', 'Alameda']
 
-sierras_and_cascades = ['Modoc','Lassen', 'Plumas', 'Sierra', 'Nevada', 'Placer', 'El Dorado', 
+sierras_and_cascades = ['Modoc','Lassen', 'Plumas', 'Sierra', 'Nevada', 'Placer', 'El Dorado',
             'Amador', 'Alpine', 'Calaveras', 'Tuolumne', 'Mariposa', 'Mono', 'Inyo', 'Madera']
 
 socal = ['Imperial', 'Kern', 'Los Angeles', 'Orange', 'Riverside', 'San Bernardino',
          'San Diego', 'Santa Barbara', 'San Luis Obispo', 'Ventura']
 
-#def get_region(county):
-#    if county in bay_area:
-#        return "San Francisco Bay Area"
-#    elif county in socal:
-#        return "Southern California"
-#    elif county in sierras:
-#        return 'Sierra or Cascades'
-#    else:
-#        return 'Other'
-    
+CALIFORNIA_COUNTIES = [
+    'Alameda', 'Alpine', 'Amador', 'Butte', 'Calaveras', 'Colusa', 'Contra Costa', 'Del Norte',
+    'El Dorado', 'Fresno', 'Glenn', 'Humboldt', 'Imperial', 'Inyo', 'Kern', 'Kings', 'Lake', 'Lassen',
+    'Los Angeles', 'Madera', 'Marin', 'Mariposa', 'Mendocino', 'Merced', 'Modoc', 'Mono', 'Monterey',
+    'Napa', 'Nevada', 'Orange', 'Placer', 'Plumas', 'Riverside', 'Sacramento', 'San Benito',
+    'San Bernardino', 'San Diego', 'San Francisco', 'San Joaquin', 'San Luis Obispo', 'San Mateo',
+    'Santa Barbara', 'Santa Clara', 'Santa Cruz', 'Shasta', 'Sierra', 'Siskiyou', 'Solano', 'Sonoma',
+    'Stanislaus', 'Sutter', 'Tehama', 'Trinity', 'Tulare', 'Tuolumne', 'Ventura', 'Yolo', 'Yuba']
+
+MULTIPLE_COUNTIES = 'Multiple Counties'
+
+# Unit of the area_SF columns: areas are also given as a number of San Franciscos
+SAN_FRANCISCO_LAND_AREA = 30022.4   # acres
+
+# Region code: (name, plot color)
+REGIONS = {
+    'bay_area': ("San Francisco Bay Area", "teal"),
+    'socal': ("Southern California", "orange"),
+    'sierras_and_cascades': ('Sierra or Cascades', 'pink'),
+    'other': ('Other', 'grey'),
+}
+MULTIPLE_COUNTIES_COLOR = 'maroon'
+
+
+def _region_code(county):
+    if county in bay_area:
+        return 'bay_area'
+    elif county in socal:
+        return 'socal'
+    elif county in sierras_and_cascades:
+        return 'sierras_and_cascades'
+    return 'other'
+
+
+# One row per county: its canonical name and region code, both categorical
+COUNTIES = pd.DataFrame({
+    'county': pd.Categorical(CALIFORNIA_COUNTIES, categories=CALIFORNIA_COUNTIES),
+    'region': pd.Categorical([_region_code(county) for county in CALIFORNIA_COUNTIES], categories=list(REGIONS)),
+})
+
+_REGION_BY_COUNTY = dict(zip(CALIFORNIA_COUNTIES, COUNTIES.region.astype(str)))
+# Lower case name, without "County", to canonical name
+_CANONICAL = {county.lower(): county for county in CALIFORNIA_COUNTIES}
+
+# "A, B and C", "A & B", "A/B". 'and' only as a whole word.
+_SEPARATOR = re.compile(r'\s*(?:,|/|&|\band\b)\s*', re.IGNORECASE)
+_COUNTY_SUFFIX = re.compile(r'\s+(?:county|counties|co\.?)$', re.IGNORECASE)
+
+
+def canonical_county(name):
+    """
+    Parameters
+    ----------
+    name (string): one county, e.g. "los angeles County"
+
+    Returns
+    -------
+    Canonical name from COUNTIES, e.g. "Los Angeles", or the stripped name if it is not a
+    California county (e.g. "State of Oregon")
+    """
+    name = ' '.join(name.split())
+    stripped = _COUNTY_SUFFIX.sub('', name)
+    return _CANONICAL.get(stripped.lower(), _CANONICAL.get(name.lower(), name))
+
+
+def parse_counties(value):
+    """
+    Parameters
+    ----------
+    value (string): county column of one fire, e.g. "Napa, Sonoma and Lake"
+
+    Returns
+    -------
+    Sorted tuple of canonical county names, empty if value is missing
+    """
+    if not isinstance(value, str):
+        return ()
+    names = {canonical_county(name) for name in _SEPARATOR.split(value.strip()) if name.strip()}
+    return tuple(sorted(names))
+
+
+def _map_distinct(values, function):
+    """
+    Apply function to each distinct value of a series (and to None for missing values), and
+    broadcast the results back to every row
+    """
+    codes, uniques = pd.factorize(values.astype(object))
+    results = np.empty(len(uniques) + 1, dtype=object)
+    for i, value in enumerate(uniques):
+        results[i] = function(value)
+    # factorize codes missing values as -1, the last result
+    results[-1] = function(None)
+    return pd.Series(results[codes], index=values.index)
+
+
+def normalize_counties(county):
+    """
+    Parameters
+    ----------
+    county (Pandas series): county column, as listed by Cal Fire or Wikipedia
+
+    Returns
+    -------
+    Pandas series with a sorted tuple of canonical county names per fire, see parse_counties
+    """
+    return _map_distinct(county, parse_counties)
+
+
+def explode_counties(df, weights=None):
+    """
+    Split fires into one row per county they burned in, apportioning their acres and area.
+
+    Parameters
+    ----------
+    df (Pandas dataframe): fires with county, and optionally acres and area_SF
+    weights (dict or Pandas series): weight of each county, e.g. its land area. A fire is split
+                                     in proportion to the weights of its counties, or equally if
+                                     None or none of its counties has a weight.
+
+    Returns
+    -------
+    Dataframe with fire_id (position of the fire in df), county, share (of the fire, summing to
+    1 per fire), and acres and area_SF times share. Fires without a county are kept whole, as
+    'Multiple Counties'.
+    """
+    codes, uniques = pd.factorize(df['county'].astype(object))
+    # Counties of each distinct value, and of missing values last
+    sets = [parse_counties(value) or (MULTIPLE_COUNTIES,) for value in uniques] + [(MULTIPLE_COUNTIES,)]
+    codes = np.where(codes < 0, len(uniques), codes)
+    set_lengths = np.array([len(names) for names in sets], dtype=np.int64)
+    set_starts = np.cumsum(set_lengths) - set_lengths
+    names = np.array([name for names in sets for name in names], dtype=object)
+
+    # Row i of the fire is name i of its set
+    lengths = set_lengths[codes]
+    fire_id = np.repeat(np.arange(len(df)), lengths)
+    row_starts = np.cumsum(lengths) - lengths
+    position = np.arange(len(fire_id)) - np.repeat(row_starts - set_starts[codes], lengths)
+
+    share = 1.0 / lengths[fire_id]
+    if weights is not None:
+        weight = pd.Series(names).map(weights).fillna(0).to_numpy(dtype=np.float64)[position]
+        total = np.bincount(fire_id, weights=weight, minlength=len(df))[fire_id]
+        share = np.where(total > 0, weight / np.where(total > 0, total, 1), share)
+
+    exploded = pd.DataFrame({'fire_id': fire_id, 'county': names[position], 'share': share})
+    for column in ['acres', 'area_SF']:
+        if column in df.columns:
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+            exploded[column] = values[fire_id] * share
+    return exploded
+
+
+def get_region(county):
+    """
+    Region of a county, for region rollups. Uses the same groups as get_county_color.
+    """
+    if county == MULTIPLE_COUNTIES:
+        return MULTIPLE_COUNTIES
+    return REGIONS[_REGION_BY_COUNTY.get(county, 'other')][0]
+
+
+def single_county(county):
+    """
+    Parameters
+    ----------
+    county (Pandas series): county column, as listed by Cal Fire or Wikipedia
+
+    Returns
+    -------
+    Pandas series with the county, or 'Multiple Counties' for fires listed in several counties
+    """
+    # calfire excludes county if there are multiple, sometimes. And sometimes, it includes all
+    # counties separated by commas, or 'and'
+    return _map_distinct(county, lambda value: _single(parse_counties(value)))
+
+
+def _single(names):
+    return names[0] if len(names) == 1 else MULTIPLE_COUNTIES
+
+
+def county_colors(county):
+    """
+    Parameters
+    ----------
+    county (Pandas series): single counties, e.g. from single_county
+
+    Returns
+    -------
+    Pandas series with the plot color of each county, see get_county_color
+    """
+    return _map_distinct(county, get_county_color)
+
+
 def get_county_color(county):
     """
     Helper function to fix colors for a given region while plotting
     """
-    if county in bay_area:
-        return "teal"
-    elif county in socal:
-        return "orange"
-    elif county in sierras_and_cascades:
-        return 'pink'
-    elif county == 'Multiple Counties':
-        return 'maroon'
-    else:
-        return 'grey'
+    if county == MULTIPLE_COUNTIES:
+        return MULTIPLE_COUNTIES_COLOR
+    return REGIONS[_REGION_BY_COUNTY.get(county, 'other')][1]
@@ -0,0 +1,397 @@
+"""
+Precomputed aggregate cube of fires by year, month (of the start date) and county.
+
+Each cell holds the number of fires, the total and largest acres, and the total and largest area
+in San Franciscos. Regions (counties.get_region) are a rollup of counties. Any total, e.g. by year,
+by month, or by region for one year, is read from the cube instead of grouping the incidents again:
+
+    cube = FireCube(df)
+    cube.slice(year=2020, region='Southern California')     # totals of the selection
+    cube.rollup(['year', 'region'], month=[7, 8, 9])         # dataframe of totals per group
+
+A fire in several counties is in the cell of each of them (counties.explode_counties), with its
+share of the acres and area in the totals and its whole acres and area in the largest. It is counted
+once in each of its counties, and once in any total over several of them: the cube keeps how many
+fires share each set of counties, and takes the extra counts back when counties are summed.
+
+Month 0 holds fires without a valid start date. The cube is persisted as a small table (one row per
+non-empty cell) with save/load, and kept current with update as incidents change.
+"""
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from counties import SAN_FRANCISCO_LAND_AREA, explode_counties, get_region
+from storage import read_table, table_paths, write_table
+
+DIMENSIONS = ['year', 'month', 'county', 'region']
+MEASURES = ['num_fires', 'total_acres', 'largest_acres', 'total_area_SF', 'largest_area_SF']
+
+# Incident columns needed to build or update a cube
+CUBE_COLUMNS = ['year', 'start_date', 'county', 'acres']
+# Between the counties of fires in several counties, in saved cubes
+SHARED_SEPARATOR = '|'
+
+
+class FireCube(object):
+
+    def __init__(self, df=None):
+        """
+        Parameters
+        ----------
+        df (Pandas dataframe): fires with year, start_date, county and acres, and optionally area_SF
+        """
+        self._years = []
+        self._counties = []
+        self._regions = []
+        # Axes are year, month, county. Sums and maxima have a first axis for acres and area_SF.
+        self._count = np.zeros((0, 13, 0), dtype=np.int64)
+        self._sum = np.zeros((2, 0, 13, 0))
+        self._max = np.zeros((2, 0, 13, 0))
+        # Number of fires in several counties: (year, month, sorted county indices) to count
+        self._shared = {}
+        if df is not None:
+            self.add(df)
+
+    @property
+    def years(self):
+        return list(self._years)
+
+    @property
+    def counties(self):
+        return list(self._counties)
+
+    def copy(self):
+        """
+        Returns
+        -------
+        FireCube with copies of the arrays, to update without changing this one
+        """
+        cube = FireCube()
+        cube._years, cube._counties, cube._regions = list(self._years), list(self._counties), list(self._regions)
+        cube._count, cube._sum, cube._max = self._count.copy(), self._sum.copy(), self._max.copy()
+        cube._shared = dict(self._shared)
+        return cube
+
+    def add(self, df):
+        """
+        Add fires to the cube
+        """
+        year, month, county, sums, maxes, shared = self._cells(df)
+        self._accumulate(year, month, county, np.ones(len(year), dtype=np.int64), sums, maxes)
+        self._share(shared, 1)
+
+    def update(self, removed, added, rows=None):
+        """
+        Replace old versions of incidents (removed) with their new versions (added).
+
+        Counts and totals are updated in place. A largest value can not be taken back, so cells
+        whose largest fire was removed are recomputed from rows.
+
+        Parameters
+        ----------
+        removed (Pandas dataframe): incidents as they were counted in the cube
+        added (Pandas dataframe): new or changed incidents
+        rows (function): returns all incidents after the change. Only called if a cell has to be
+                         recomputed.
+        """
+        year, month, county, sums, maxes, shared = self._cells(removed)
+        count = np.ones(len(year), dtype=np.int64)
+        self._accumulate(year, month, county, -count, -sums, None)
+        self._share(shared, -1)
+        stale = (self._max[:, year, month, county] <= maxes).any(axis=0)
+        self.add(added)
+
+        if stale.any():
+            cells = set(zip(year[stale].tolist(), month[stale].tolist(), county[stale].tolist()))
+            df = rows() if callable(rows) else rows
+            if df is None:
+                raise ValueError("rows are needed to recompute the largest fires of changed cells")
+            self._recompute_max(cells, df)
+
+    def slice(self, **selection):
+        """
+        Parameters
+        ----------
+        selection: year, month, county or region, each a value or a list of values
+
+        Returns
+        -------
+        Dictionary with the MEASURES of the selected fires
+        """
+        index, count, sums, maxes = self._select(selection)
+        duplicates = self._duplicates(index, np.zeros(len(index[2]), dtype=np.int64), count.shape[:2] + (1,))
+        return {
+            'num_fires': int(count.sum() - duplicates.sum()),
+            'total_acres': int(round(sums[0].sum())),
+            'largest_acres': int(maxes[0].max(initial=0)),
+            'total_area_SF': float(sums[1].sum()),
+            'largest_area_SF': float(maxes[1].max(initial=0)),
+        }
+
+    def rollup(self, by, **selection):
+        """
+        Parameters
+        ----------
+        by (list): DIMENSIONS to group by, e.g. ['year'] or ['region', 'month']
+        selection: year, month, county or region, each a value or a list of values
+
+        Returns
+        -------
+        Dataframe with the by columns and the MEASURES, one row per group that has fires,
+        sorted by the by columns. Without by, the selection is a single group.
+        """
+        unknown = [name for name in by if name not in DIMENSIONS]
+        if unknown:
+            raise ValueError("Unknown dimensions {}, expected some of {}".format(unknown, DIMENSIONS))
+        if not by:
+            df = pd.DataFrame([self.slice(**selection)], columns=MEASURES)
+            return df[df.num_fires > 0].reset_index(drop=True)
+
+        index, count, sums, maxes = self._select(selection)
+        counties = [self._counties[i] for i in index[2]]
+        labels = [np.array([self._years[i] for i in index[0]], dtype=object), index[1],
+                  np.array(counties, dtype=object)]
+
+        if 'county' not in by:
+            # Counties summed into groups: regions, or all of them
+            if 'region' in by:
+                regions = np.array([get_region(county) for county in counties], dtype=object)
+                names = sorted(set(regions))
+            else:
+                regions = np.zeros(len(counties), dtype=object)
+                names = [0]
+            count = np.stack([count[..., regions == name].sum(axis=-1) for name in names], axis=-1)
+            sums = np.stack([sums[..., regions == name].sum(axis=-1) for name in names], axis=-1)
+            maxes = np.stack([maxes[..., regions == name].max(axis=-1, initial=0) for name in names], axis=-1)
+            group = np.array([names.index(region) for region in regions], dtype=np.int64)
+            count = count - self._duplicates(index, group, count.shape)
+            labels[2] = np.array(names, dtype=object)
+
+        axis_of = {'year': 0, 'month': 1, 'county': 2, 'region': 2}
+        keep = sorted({axis_of[name] for name in by})
+        drop = tuple(axis for axis in range(3) if axis not in keep)
+        count = count.sum(axis=drop)
+        sums = sums.sum(axis=tuple(axis + 1 for axis in drop))
+        maxes = maxes.max(axis=tuple(axis + 1 for axis in drop), initial=0)
+
+        cells = np.nonzero(count > 0)
+        df = pd.DataFrame({'num_fires': count[cells],
+                           'total_acres': np.rint(sums[0][cells]).astype(np.int64),
+                           'largest_acres': maxes[0][cells].astype(np.int64),
+                           'total_area_SF': sums[1][cells],
+                           'largest_area_SF': maxes[1][cells]})
+        for position, axis in enumerate(keep):
+            values = labels[axis][cells[position]]
+            if axis == 2:
+                name = 'region' if 'county' not in by else 'county'
+                df[name] = values
+                if 'region' in by and 'county' in by:
+                    df['region'] = [get_region(county) for county in values]
+            else:
+                df[DIMENSIONS[axis]] = values
+        if 'year' in df.columns:
+            df['year'] = df['year'].astype(np.int64)
+        df = df[list(by) + MEASURES]
+        return df.sort_values(list(by)).reset_index(drop=True)
+
+    def to_frame(self):
+        """
+        Returns
+        -------
+        Dataframe with one row per non-empty cell: year, month, county, region and MEASURES
+        """
+        df = self.rollup(['year', 'month', 'county'])
+        df.insert(3, 'region', [get_region(county) for county in df.county])
+        return df
+
+    def save(self, path):
+        """
+        Write the cube as a table at path (extension is ignored)
+
+        Returns
+        -------
+        Path written
+        """
+        # Totals as they are, not rounded as in to_frame: shares of fires in several counties are
+        # not whole acres
+        year, month, county = np.nonzero(self._count)
+        df = pd.DataFrame({'year': np.array(self._years, dtype=np.int64)[year], 'month': month,
+                           'county': np.array(self._counties, dtype=object)[county].astype(str),
+                           'region': np.array(self._regions, dtype=object)[county],
+                           'num_fires': self._count[year, month, county]})
+        for position, measure in enumerate(['acres', 'area_SF']):
+            df['total_' + measure] = self._sum[position, year, month, county]
+            df['largest_' + measure] = self._max[position, year, month, county]
+        df = df[DIMENSIONS + MEASURES]
+        df['shared'] = False
+        # Fires in several counties, as rows listing the counties, with only num_fires
+        shared = [(self._years[year], month, SHARED_SEPARATOR.join(self._counties[i] for i in counties), num)
+                  for (year, month, counties), num in sorted(self._shared.items()) if num]
+        if shared:
+            shared = pd.DataFrame(shared, columns=['year', 'month', 'county', 'num_fires'])
+            for measure in MEASURES[1:]:
+                shared[measure] = 0
+            shared['region'] = ''
+            shared['shared'] = True
+            df = pd.concat([df, shared[df.columns]], ignore_index=True)
+        return write_table(df, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Parameters
+        ----------
+        path (string): table written by save, with or without extension
+
+        Returns
+        -------
+        FireCube, or None if there is no table at path
+        """
+        paths = table_paths(path)
+        if not paths:
+            return None
+        df = read_table(paths[0])
+        cube = cls()
+        if 'shared' in df.columns:
+            shared, df = df[df.shared], df[~df.shared]
+            for year, month, counties, num in zip(shared.year, shared.month, shared.county, shared.num_fires):
+                county = cube._codes(pd.Series(str(counties).split(SHARED_SEPARATOR)), cube._counties)
+                key = (cube._codes(pd.Series([int(year)]), cube._years)[0], int(month), tuple(sorted(county)))
+                cube._shared[key] = int(num)
+        county = cube._codes(df['county'].astype(object), cube._counties)
+        year = cube._codes(df['year'].astype(np.int64), cube._years)
+        cube._grow()
+        sums = df[['total_acres', 'total_area_SF']].to_numpy(dtype=np.float64).T
+        maxes = df[['largest_acres', 'largest_area_SF']].to_numpy(dtype=np.float64).T
+        cube._accumulate(year, df['month'].to_numpy(dtype=np.int64), county, df['num_fires'].to_numpy(), sums,
+                         maxes)
+        return cube
+
+    def _cells(self, df):
+        """
+        Returns
+        -------
+        Year, month and county indices of each fire and county it burned in, arrays of its share of
+        acres and area_SF (for the totals) and of its whole acres and area_SF (for the largest), and
+        the keys of _shared of the fires in several counties
+        """
+        acres = pd.to_numeric(df['acres'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+        if 'area_SF' in df.columns:
+            area = pd.to_numeric(df['area_SF'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+        else:
+            area = acres / SAN_FRANCISCO_LAND_AREA
+        exploded = explode_counties(pd.DataFrame({'county': df['county'].to_numpy()}))
+        fire_id = exploded['fire_id'].to_numpy()
+        share = exploded['share'].to_numpy()
+
+        month = pd.to_datetime(df['start_date'], errors='coerce').dt.month.fillna(0).to_numpy(dtype=np.int64)
+        year = self._codes(pd.to_numeric(df['year']).astype(np.int64), self._years)
+        county = self._codes(exploded['county'], self._counties)
+        self._grow()
+
+        whole = np.stack([acres, area])[:, fire_id]
+        shared = []
+        several = np.bincount(fire_id, minlength=len(df))[fire_id] > 1
+        if several.any():
+            # Rows of a fire are consecutive in exploded
+            ids, starts = np.unique(fire_id[several], return_index=True)
+            groups = np.split(county[several], starts[1:])
+            shared = [(year[i], month[i], tuple(sorted(group.tolist()))) for i, group in zip(ids.tolist(), groups)]
+        return year[fire_id], month[fire_id], county, whole * share, whole, shared
+
+    @staticmethod
+    def _codes(values, labels):
+        # Index of each value in labels, appending values not seen before
+        inverse, uniques = pd.factorize(values, sort=True)
+        index = {label: i for i, label in enumerate(labels)}
+        for value in uniques.tolist():
+            if value not in index:
+                index[value] = len(labels)
+                labels.append(value)
+        return np.array([index[value] for value in uniques.tolist()], dtype=np.int64)[inverse].reshape(-1)
+
+    def _grow(self):
+        # Extend the arrays to new years and counties
+        pad_years = len(self._years) - self._count.shape[0]
+        pad_counties = len(self._counties) - self._count.shape[2]
+        self._regions += [get_region(county) for county in self._counties[len(self._regions):]]
+        if pad_years or pad_counties:
+            self._count = np.pad(self._count, ((0, pad_years), (0, 0), (0, pad_counties)))
+            self._sum = np.pad(self._sum, ((0, 0), (0, pad_years), (0, 0), (0, pad_counties)))
+            self._max = np.pad(self._max, ((0, 0), (0, pad_years), (0, 0), (0, pad_counties)))
+
+    def _accumulate(self, year, month, county, count, sums, maxes):
+        shape = self._count.shape
+        flat = np.ravel_multi_index((year, month, county), shape)
+        size = self._count.size
+        self._count += np.bincount(flat, weights=count, minlength=size).astype(np.int64).reshape(shape)
+        for measure in range(2):
+            self._sum[measure] += np.bincount(flat, weights=sums[measure], minlength=size).reshape(shape)
+            if maxes is not None:
+                np.maximum.at(self._max[measure].reshape(-1), flat, maxes[measure])
+
+    def _share(self, shared, sign):
+        for key, num in Counter(shared).items():
+            self._shared[key] = self._shared.get(key, 0) + sign * num
+            if not self._shared[key]:
+                del self._shared[key]
+
+    def _duplicates(self, index, group, shape):
+        """
+        Extra counts of the fires in several counties, when the counties of the selection are summed
+        into groups
+
+        Parameters
+        ----------
+        index (list): year, month and county indices of the selection, as returned by _select
+        group (array): group of each selected county, from 0
+        shape (tuple): selected years, months and groups
+
+        Returns
+        -------
+        Array of shape with the number of times fires are counted more than once in each group
+        """
+        extra = np.zeros(shape, dtype=np.int64)
+        years, months, counties = [{value: i for i, value in enumerate(axis.tolist())} for axis in index]
+        for (year, month, shared), num in self._shared.items():
+            if year not in years or month not in months:
+                continue
+            groups = Counter(group[counties[county]] for county in shared if county in counties)
+            for position, times in groups.items():
+                extra[years[year], months[month], position] += num * (times - 1)
+        return extra
+
+    def _recompute_max(self, cells, df):
+        year, month, county, _, values, _ = self._cells(df)
+        shape = self._count.shape
+        stale = np.ravel_multi_index(tuple(np.array(sorted(cells)).T), shape)
+        flat = np.ravel_multi_index((year, month, county), shape)
+        in_cells = np.isin(flat, stale)
+        for measure in range(2):
+            self._max[measure].reshape(-1)[stale] = 0
+            np.maximum.at(self._max[measure].reshape(-1), flat[in_cells], values[measure, in_cells])
+
+    def _select(self, selection):
+        # Indices to keep along each axis, None for all
+        keep = [None, None, None]
+        for name, value in selection.items():
+            values = {value} if isinstance(value, str) or not hasattr(value, '__iter__') else set(value)
+            if name == 'year':
+                axis, labels = 0, self._years
+            elif name == 'month':
+                axis, labels = 1, range(13)
+            elif name == 'county':
+                axis, labels = 2, self._counties
+            elif name == 'region':
+                axis, labels = 2, self._regions
+            else:
+                raise ValueError("Unknown dimension {}, expected one of {}".format(name, DIMENSIONS))
+            chosen = {i for i, label in enumerate(labels) if label in values}
+            keep[axis] = chosen if keep[axis] is None else keep[axis] & chosen
+
+        index = [np.arange(size) if chosen is None else np.array(sorted(chosen), dtype=np.int64)
+                 for chosen, size in zip(keep, self._count.shape)]
+        cells = np.ix_(*index)
+        return index, self._count[cells], self._sum[(slice(None),) + cells], self._max[(slice(None),) + cells]
@@ -0,0 +1,225 @@
+"""
+Export of the figures in several formats and sizes, for publishing.
+
+Each figure is drawn once, rasterized once by Agg at the native size (dpi 150, as Plotter writes
+it) and written once as SVG. Every other variant comes from that raster, resized with Pillow:
+smaller PNGs, WebP and thumbnails do not draw the figure again, even when asked for later, as long
+as the native raster is cached. Only widths larger than the native raster draw the figure again,
+at a higher dpi.
+
+    exporter = FigureExporter('public/figures')
+    exporter.export(Plotter(df), formats=['png', 'svg', 'webp'], widths=[None, 1200, 600, THUMBNAIL_WIDTH])
+
+Variants are kept in an LRU cache keyed by (figure, fingerprint of its data and drawing code,
+format, width), so figures whose data has not changed are not rendered again, whichever size or
+format is asked for next. With directory=None nothing is written, and export returns the bytes.
+"""
+from collections import OrderedDict
+from io import BytesIO
+import logging
+import os
+import threading
+
+from build_cache import fingerprint_figure
+import instrumentation
+
+FORMATS = ['png', 'svg', 'webp']
+# Resolution of the native raster, as written by Plotter
+DPI = 150
+THUMBNAIL_WIDTH = 320
+WEBP_QUALITY = 90
+
+
+def _draw(draw, data):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from plotter import _setup_style
+
+    _setup_style()
+    fig = draw(data)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _save(fig, format, dpi=DPI):
+    buffer = BytesIO()
+    fig.savefig(buffer, format=format, bbox_inches='tight', dpi=dpi)
+    return buffer.getvalue()
+
+
+class FigureExporter(object):
+
+    def __init__(self, directory=None, cache_size=128, prefix=None):
+        """
+        Parameters
+        ----------
+        directory (string): where export writes the variants, or None to only return them
+        cache_size (int): number of variants kept in memory
+        prefix (string): start of the file names, e.g. the date as in Plotter, none if None
+        """
+        self.directory = directory
+        self.cache_size = cache_size
+        self.prefix = prefix
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, plotter, formats=('png',), widths=(None,), names=None):
+        """
+        Export figures of a Plotter in every format and width
+
+        Parameters
+        ----------
+        plotter (plotter.Plotter)
+        formats (list): some of FORMATS
+        widths (list): widths in pixels, None for the native size (dpi 150). SVG is only written
+                       once, at its native size.
+        names (list): figures to export, e.g. ['annual-stats'], all if None
+
+        Returns
+        -------
+        Dictionary of (figure name, format, width) to the path written, or to the bytes if
+        directory is None
+        """
+        exported = {}
+        for name, draw, data in plotter.jobs():
+            if names is not None and name not in names:
+                continue
+            variants = self.render(name, draw, data, formats, widths)
+            for (format, width), content in variants.items():
+                exported[(name, format, width)] = self._write(name, format, width, content)
+        return exported
+
+    def render(self, name, draw, data, formats=('png',), widths=(None,)):
+        """
+        Render one figure in every format and width
+
+        Parameters
+        ----------
+        name (string): figure name, e.g. "annual-stats"
+        draw (function): one of the plotter draw_* functions
+        data (Pandas dataframe): aggregate passed to draw
+        formats, widths: see export
+
+        Returns
+        -------
+        Dictionary of (format, width) to bytes
+        """
+        unknown = [format for format in formats if format not in FORMATS]
+        if unknown:
+            raise ValueError("Unknown formats {}, expected some of {}".format(unknown, FORMATS))
+        fingerprint = fingerprint_figure(draw, data)
+        wanted = [(format, None if format == 'svg' else width) for format in formats for width in widths]
+        wanted = list(OrderedDict.fromkeys(wanted))
+
+        variants = {}
+        for variant in wanted:
+            content = self._cached((name, fingerprint) + variant)
+            if content is not None:
+                variants[variant] = content
+        missing = [variant for variant in wanted if variant not in variants]
+        instrumentation.count('variants_reused', len(variants))
+        if not missing:
+            return variants
+
+        with instrumentation.stage('export.render'):
+            rendered = self._render(draw, data, missing, self._cached((name, fingerprint, 'png', None)))
+        instrumentation.count('variants_rendered', len(missing))
+        for variant, content in rendered.items():
+            self._store((name, fingerprint) + variant, content)
+        variants.update((variant, rendered[variant]) for variant in missing)
+        return variants
+
+    def _render(self, draw, data, variants, native=None):
+        """
+        Returns
+        -------
+        Dictionary of (format, width) to bytes, for variants and the native PNG. The figure is only
+        drawn for SVG, for widths larger than the native PNG, or if native is None.
+        """
+        from PIL import Image
+
+        figure = []
+
+        def fig():
+            if not figure:
+                figure.append(_draw(draw, data))
+            return figure[0]
+
+        try:
+            rendered = {}
+            if ('svg', None) in variants:
+                rendered[('svg', None)] = _save(fig(), 'svg')
+            rasters = [(format, width) for format, width in variants if format != 'svg']
+            if not rasters:
+                return rendered
+
+            native = native or _save(fig(), 'png')
+            rendered[('png', None)] = native
+            image = Image.open(BytesIO(native))
+            image.load()
+            larger = None
+            for format, width in rasters:
+                if format == 'png' and (width is None or width == image.width):
+                    rendered[(format, width)] = native
+                    continue
+                source = image
+                if width is not None and width > image.width:
+                    # Upscaling would blur the text, draw at the dpi of the largest width instead
+                    if larger is None:
+                        dpi = DPI * max(w for _, w in rasters if w is not None) / float(image.width)
+                        larger = Image.open(BytesIO(_save(fig(), 'png', dpi=dpi)))
+                        larger.load()
+                    source = larger
+                rendered[(format, width)] = self._encode(source, format, width)
+            return rendered
+        finally:
+            if figure:
+                figure[0].clear()
+
+    @staticmethod
+    def _encode(image, format, width):
+        from PIL import Image
+
+        if width is not None and width != image.width:
+            height = max(1, int(round(image.height * width / float(image.width))))
+            image = image.resize((width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        if format == 'webp':
+            image.save(buffer, format='WEBP', quality=WEBP_QUALITY, method=4)
+        else:
+            image.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
+
+    def filename(self, name, format, width):
+        """
+        Returns
+        -------
+        File name of a variant: [<prefix>-]<name>[-<width>w].<format>
+        """
+        stem = name if self.prefix is None else '{}-{}'.format(self.prefix, name)
+        if width is not None:
+            stem = '{}-{}w'.format(stem, width)
+        return '{}.{}'.format(stem, format)
+
+    def _write(self, name, format, width, content):
+        if self.directory is None:
+            return content
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.filename(name, format, width))
+        with open(path, 'wb') as f:
+            f.write(content)
+        logging.debug("Exported {}".format(path))
+        return path
+
+    def _cached(self, key):
+        with self._lock:
+            content = self._cache.get(key)
+            if content is not None:
+                self._cache.move_to_end(key)
+            return content
+
+    def _store(self, key, content):
+        with self._lock:
+            self._cache[key] = content
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
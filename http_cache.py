@@ -0,0 +1,242 @@
+"""
+On-disk cache of raw http responses, shared by the scrapers.
+
+Each url is stored as its body, its validators (ETag/Last-Modified) and the time it was
+fetched. Refetching a cached url sends a conditional request, and a 304 response returns
+the cached body without downloading it again. Callers can also keep the parsed result of
+a page next to it, so unchanged pages are not parsed again either.
+"""
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+import requests
+
+import instrumentation
+
+CACHE_DIR = 'cache'
+# Eviction leaves the cache at this fraction of max_bytes, so that it is not scanned again until
+# another tenth of it has been downloaded
+EVICT_TO = 0.9
+
+
+class CachedPage(object):
+    """
+    Response returned by PageCache.get
+
+    Attributes
+    ----------
+    url (string)
+    text (string): body of the response, or of the cached copy for a 304
+    status_code (int): status of the response actually received
+    not_modified (bool): True if the server answered 304 and the cached body was reused
+    fetched_at (datetime): time the body was last downloaded or revalidated
+    """
+
+    def __init__(self, url, text, status_code, not_modified, fetched_at):
+        self.url = url
+        self.text = text
+        self.status_code = status_code
+        self.not_modified = not_modified
+        self.fetched_at = fetched_at
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class PageCache(object):
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=200 * 1024 * 1024, max_age_days=180):
+        """
+        Parameters
+        ----------
+        directory (string): where responses are stored
+        max_bytes (int): total size of the cache. Least recently used entries are evicted past this.
+        max_age_days (float): entries not fetched or revalidated for this long are evicted
+
+        The cache directory is scanned for entries to evict after the first download, and then only
+        when the downloads since the last scan take the cache past max_bytes.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        # Size of the cache at the last scan plus what was written since, None before the first scan
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url, session=None, params=None, timeout=30):
+        """
+        GET url, revalidating the cached copy if there is one
+
+        Parameters
+        ----------
+        url (string)
+        session (requests.Session): defaults to the requests module
+        params (dict): query parameters, part of the cache key
+        timeout (float)
+
+        Returns
+        -------
+        CachedPage
+        """
+        url = requests.Request('GET', url, params=params).prepare().url
+        key = self._key(url)
+        meta = self._read_meta(key)
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = (session or requests).get(url, headers=headers, timeout=timeout)
+        now = datetime.utcnow()
+
+        if response.status_code == 304 and meta is not None:
+            body = self._read_body(key)
+            if body is not None:
+                logging.debug("Not modified: {}".format(url))
+                instrumentation.count('pages_not_modified')
+                meta['fetched_at'] = now.isoformat()
+                self._write_meta(key, meta)
+                return CachedPage(url, body, 304, True, now)
+            # The body is gone, e.g. evicted by another process: download it in full
+            logging.debug("Cached body missing, fetching again: {}".format(url))
+            response = (session or requests).get(url, timeout=timeout)
+
+        response.raise_for_status()
+        instrumentation.count('bytes_downloaded', len(response.content))
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': now.isoformat(),
+        }
+        # The parsed result of the previous body is stale now
+        self._remove(self._path(key, 'parsed'))
+        self._write(self._path(key, 'body'), response.content)
+        self._write_meta(key, meta)
+        self._written(len(response.content))
+        return CachedPage(url, response.text, response.status_code, False, now)
+
+    def load_parsed(self, url, params=None):
+        """
+        Returns
+        -------
+        Object saved with store_parsed for the current body of url, or None
+        """
+        url = requests.Request('GET', url, params=params).prepare().url
+        path = self._path(self._key(url), 'parsed')
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def store_parsed(self, url, parsed, params=None):
+        """
+        Keep the parsed result of the current body of url
+        """
+        url = requests.Request('GET', url, params=params).prepare().url
+        data = pickle.dumps(parsed)
+        self._write(self._path(self._key(url), 'parsed'), data)
+        self._written(len(data))
+
+    def evict(self):
+        """
+        Remove entries older than max_age_days, then, if the cache does not fit in max_bytes,
+        least recently used entries until it fits in EVICT_TO of max_bytes
+        """
+        with self._lock:
+            entries = []
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.json'):
+                    continue
+                key = filename[:-len('.json')]
+                meta = self._read_meta(key)
+                paths = [self._path(key, kind) for kind in ('json', 'body', 'parsed')]
+                size = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+                last_used = max(os.path.getmtime(p) for p in paths if os.path.exists(p))
+                entries.append((key, meta, size, last_used))
+
+            now = datetime.utcnow()
+            kept = []
+            for key, meta, size, last_used in entries:
+                try:
+                    age = (now - datetime.fromisoformat(meta['fetched_at'])).total_seconds() / 86400
+                except (TypeError, KeyError, ValueError):
+                    age = None
+                if age is None or age > self.max_age_days:
+                    self._remove_entry(key)
+                else:
+                    kept.append((last_used, size, key))
+
+            total = sum(size for _, size, _ in kept)
+            limit = self.max_bytes * EVICT_TO if total > self.max_bytes else self.max_bytes
+            for last_used, size, key in sorted(kept):
+                if total <= limit:
+                    break
+                self._remove_entry(key)
+                total -= size
+            self._size = total
+
+    def _written(self, size):
+        # Evict only when the cache may have grown past max_bytes, not after every download
+        with self._lock:
+            scan = self._size is None or self._size + size > self.max_bytes
+            if not scan:
+                self._size += size
+        if scan:
+            self.evict()
+
+    def _key(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _path(self, key, kind):
+        return os.path.join(self.directory, '{}.{}'.format(key, kind))
+
+    def _read_meta(self, key):
+        try:
+            with open(self._path(key, 'json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        self._write(self._path(key, 'json'), json.dumps(meta).encode('utf-8'))
+
+    def _read_body(self, key):
+        path = self._path(key, 'body')
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        # Reading counts as a use for eviction
+        os.utime(path)
+        return body.decode('utf-8', errors='replace')
+
+    def _write(self, path, data):
+        # Write to a temporary file first, so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove_entry(self, key):
+        for kind in ('json', 'body', 'parsed'):
+            self._remove(self._path(key, kind))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
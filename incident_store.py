@@ -0,0 +1,259 @@
+"""
+Append-friendly store for Cal Fire incidents.
+
+The store is a dated base snapshot ("data/<date>_calfire_data.parquet") plus a change log
+("data/calfire_changes.csv") that only ever gets rows appended to it. Loading the store
+applies the log to the snapshot, the last version of an incident winning. Refreshing
+appends only the incidents that are new or have changed, so its cost scales with the
+number of changed incidents and not with the size of the year.
+
+A cube.FireCube of the incidents ("data/calfire_cube.parquet") is kept next to the snapshot. It is
+rebuilt with every snapshot and updated with every upsert.
+"""
+from datetime import datetime
+import json
+import logging
+import os
+import tempfile
+
+import pandas as pd
+
+from cube import CUBE_COLUMNS, FireCube
+from staging import StagedTable
+from storage import HAS_PARQUET, apply_schema, find_table, read_table, table_paths, write_table
+
+KEY_COLUMNS = ['name', 'start_date']
+BASE_STEM = 'calfire_data'
+CUBE_STEM = 'calfire_cube'
+CHANGES_FILENAME = 'calfire_changes.csv'
+STATE_FILENAME = 'calfire_state.json'
+
+
+def incident_key(df):
+    """
+    Stable key of an incident: its name and start date, normalized.
+    Counties, acres and containment change while a fire is active, so they are not part of the key.
+
+    Parameters
+    ----------
+    df (Pandas dataframe): with name and start_date columns
+
+    Returns
+    -------
+    Pandas series of strings
+    """
+    name = df['name'].fillna('').astype(str).str.strip().str.lower()
+    start_date = pd.to_datetime(df['start_date'], errors='coerce').dt.strftime('%Y-%m-%d').fillna('')
+    return name + '|' + start_date
+
+
+class IncidentStore(object):
+
+    def __init__(self, directory='data', compact_after=5000, export_csv=False):
+        """
+        Parameters
+        ----------
+        directory (string)
+        compact_after (int): fold the change log into a new snapshot once it has this many rows
+        export_csv (bool): write a CSV copy of every snapshot
+        """
+        self.directory = directory
+        self.compact_after = compact_after
+        self.export_csv = export_csv
+        self.changes_path = os.path.join(directory, CHANGES_FILENAME)
+        self.state_path = os.path.join(directory, STATE_FILENAME)
+        self.cube_path = os.path.join(directory, CUBE_STEM)
+
+    def base_path(self):
+        """
+        Returns
+        -------
+        Path of the latest snapshot, or None
+        """
+        return find_table(self.directory, BASE_STEM)
+
+    def exists(self):
+        return self.base_path() is not None
+
+    def load(self, columns=None, keys=None):
+        """
+        Parameters
+        ----------
+        columns (list): return only these columns
+        keys (list-like): return only the incidents with these keys (see incident_key)
+
+        Returns
+        -------
+        Pandas dataframe with the latest version of every incident
+        """
+        rows = None
+        if keys is not None:
+            rows = incident_key(read_table(self.base_path(), KEY_COLUMNS)).isin(keys).values
+        if not os.path.exists(self.changes_path):
+            return read_table(self.base_path(), columns, rows=rows)
+
+        read_columns = None if columns is None else list(dict.fromkeys(KEY_COLUMNS + list(columns)))
+        df = read_table(self.base_path(), read_columns, rows=rows)
+        changes = pd.read_csv(self.changes_path).drop('updated_at', axis=1)
+        if keys is not None:
+            changes = changes[incident_key(changes).isin(keys)]
+        changes = apply_schema(changes)
+        changes = changes[~incident_key(changes).duplicated(keep='last')]
+        if read_columns is not None:
+            changes = changes[read_columns]
+        # Rows of the snapshot are kept as they are, unless the log has a newer version
+        df = df[~incident_key(df).isin(incident_key(changes))]
+        df = apply_schema(pd.concat([df, changes], ignore_index=True))
+        return df if columns is None else df[columns]
+
+    def cube(self):
+        """
+        Returns
+        -------
+        cube.FireCube of the stored incidents, built and saved if there is none yet
+        """
+        cube = FireCube.load(self.cube_path)
+        if cube is None:
+            cube = FireCube(self.load(CUBE_COLUMNS))
+            cube.save(self.cube_path)
+        return cube
+
+    def write(self, df):
+        """
+        Replace the store with df, as a new snapshot dated today, and clear the change log
+        """
+        self._replace(lambda path: write_table(df, path, export_csv=self.export_csv))
+
+    def staging(self):
+        """
+        Returns
+        -------
+        staging.StagedTable to fetch a new snapshot into, resuming an interrupted fetch if there is one
+        """
+        return StagedTable(self.directory, BASE_STEM)
+
+    def write_staged(self, staging):
+        """
+        Replace the store with the batches of staging, as a new snapshot dated today, and clear
+        the change log. The batches are read one at a time.
+        """
+        self._replace(lambda path: staging.finish(path, export_csv=self.export_csv))
+
+    def _replace(self, write):
+        os.makedirs(self.directory, exist_ok=True)
+        old_base = self.base_path()
+        path = os.path.join(self.directory, '{}_{}'.format(datetime.today().strftime('%Y-%m-%d'), BASE_STEM))
+        path = write(path)
+        if old_base is not None:
+            for old_path in table_paths(old_base):
+                if old_path not in table_paths(path):
+                    os.remove(old_path)
+        if os.path.exists(self.changes_path):
+            os.remove(self.changes_path)
+        FireCube(read_table(path, CUBE_COLUMNS)).save(self.cube_path)
+
+    def migrate(self):
+        """
+        Store a CSV snapshot as Parquet, under the same date. The CSV is left in place.
+        """
+        path = self.base_path()
+        if HAS_PARQUET and path is not None and path.endswith('.csv'):
+            logging.info("Converting {} to Parquet".format(path))
+            write_table(read_table(path), path)
+
+    def upsert(self, df):
+        """
+        Append incidents of df that are new, or differ from their stored version, to the change log
+
+        Parameters
+        ----------
+        df (Pandas dataframe): incidents with at least the key columns
+
+        Returns
+        -------
+        Pandas dataframe with the rows that were appended
+        """
+        # Only the stored versions of the incoming incidents are read and compared
+        current = self.load(keys=incident_key(df))
+        columns = [c for c in current.columns if c in df.columns]
+        # Compare typed values, so "2,400" and 2400 are the same number of acres
+        incoming = apply_schema(df[columns])
+        incoming = incoming[~incident_key(incoming).duplicated(keep='last')]
+
+        stored = current[columns].copy()
+        stored.index = incident_key(stored)
+        stored = stored[~stored.index.duplicated(keep='last')]
+        incoming.index = incident_key(incoming)
+
+        known = incoming.index.isin(stored.index)
+        changed = pd.Series(~known, index=incoming.index)
+        if known.any():
+            old = self._as_text(stored.loc[incoming.index[known]])
+            new = self._as_text(incoming[known])
+            changed[known] = (old.values != new.values).any(axis=1)
+
+        updates = incoming[changed.values].reset_index(drop=True)
+        if len(updates):
+            replaced = current[incident_key(current).isin(incident_key(updates))]
+            updates['updated_at'] = datetime.utcnow().isoformat()
+            header = not os.path.exists(self.changes_path)
+            # A single append, so an interrupted run leaves at most this batch incomplete
+            with open(self.changes_path, 'a') as f:
+                f.write(updates.to_csv(index=None, header=header))
+            logging.info("Upserted {} new or changed incidents".format(len(updates)))
+            if self._num_changes() >= self.compact_after:
+                self.compact()
+            else:
+                self._update_cube(replaced, updates)
+        return updates.drop('updated_at', axis=1, errors='ignore')
+
+    def compact(self):
+        """
+        Fold the change log into a new snapshot
+        """
+        logging.info("Compacting incident change log")
+        self.write(self.load())
+
+    def get_state(self, key):
+        """
+        Returns
+        -------
+        datetime stored under key with set_state, or None
+        """
+        try:
+            with open(self.state_path) as f:
+                value = json.load(f).get(key)
+        except (OSError, ValueError):
+            return None
+        return datetime.fromisoformat(value) if value else None
+
+    def set_state(self, key, value):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state[key] = value.isoformat()
+        self._atomic_write(self.state_path, lambda f: json.dump(state, f))
+
+    def _update_cube(self, removed, added):
+        cube = FireCube.load(self.cube_path)
+        # Without a cube there is nothing to keep current, cube() builds one when asked for
+        if cube is None:
+            return
+        cube.update(removed, added, rows=lambda: self.load(CUBE_COLUMNS))
+        cube.save(self.cube_path)
+
+    def _num_changes(self):
+        with open(self.changes_path) as f:
+            return sum(1 for _ in f) - 1
+
+    @staticmethod
+    def _as_text(df):
+        return df[[c for c in df.columns if c not in KEY_COLUMNS]].astype(str)
+
+    def _atomic_write(self, path, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            write(f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,302 @@
+"""
+Per-stage timers, counters and memory of a run, reported as JSON.
+
+A stage is a named step of the pipeline, e.g. "calfire.fetch" or "plot.annual_stats", timed with
+the stage context manager or the timed decorator. Counters go to the innermost stage running in
+the thread, and to the run as a whole:
+
+    with instrumentation.stage('combine'):
+        ...
+        instrumentation.count('rows_parsed', len(df))
+
+Jobs run in worker threads are not inside any stage of their own thread. Wrap them in
+within(current_stages()), taken in the thread that submits them, to count them in its stages.
+
+    instrumentation.write_report('reports/run.json')
+
+Recording is always on, and costs a few microseconds per stage. With enable_profiling, every
+stage is also run under cProfile (or pyinstrument), one profile per stage accumulated over its
+calls, and dump_profiles writes them out. A profiler only runs one at a time, so stages nested in
+a profiled stage, or running in other threads meanwhile, show up in that profile instead of their own.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+PROFILERS = ['cprofile', 'pyinstrument']
+
+
+def peak_rss_mb():
+    """
+    Returns
+    -------
+    Peak resident memory of this process so far, in MB
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+class RunMetrics(object):
+    """
+    Timers and counters of one run. Thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = datetime.now()
+            self._start = time.perf_counter()
+            self._stages = {}
+            self._counters = {}
+            self._profiler = None
+            self._profile_directory = None
+            self._profiles = {}
+            self._profiling = False
+
+    @contextmanager
+    def stage(self, name, profile=True):
+        """
+        Time the enclosed block as a call of stage name
+
+        Parameters
+        ----------
+        name (string)
+        profile (bool): profile the stage when profiling is enabled. Turn this off for stages that
+                        only group others, so that those get profiles of their own.
+        """
+        stack = self._stack()
+        stack.append(name)
+        profile = self._start_profile(name) if profile else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profile is not None:
+                self._stop_profile(profile)
+            stack.pop()
+            peak = peak_rss_mb()
+            with self._lock:
+                record = self._record(name)
+                record['calls'] += 1
+                record['seconds'] += seconds
+                record['max_seconds'] = max(record['max_seconds'], seconds)
+                record['peak_rss_mb'] = max(record['peak_rss_mb'], peak)
+
+    def current_stages(self):
+        """
+        Returns
+        -------
+        List of the stages running in this thread, outermost first, to pass to within
+        """
+        return list(self._stack())
+
+    @contextmanager
+    def within(self, stages):
+        """
+        Run the enclosed block inside stages, without timing them again: its counters and nested
+        stages go to them. Jobs run in worker threads use it to report to the stages of the thread
+        that started them.
+
+        Parameters
+        ----------
+        stages (list): as returned by current_stages
+        """
+        stack = self._stack()
+        depth = len(stack)
+        stack.extend(stages)
+        try:
+            yield
+        finally:
+            del stack[depth:]
+
+    def timed(self, name, profile=True):
+        """
+        Decorator: time every call of the function as stage name, see stage
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name, profile):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        """
+        Add value to counter name, of the run and of the innermost stage running in this thread
+        """
+        stack = self._stack()
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+            if stack:
+                counters = self._record(stack[-1])['counters']
+                counters[name] = counters.get(name, 0) + value
+
+    def report(self):
+        """
+        Returns
+        -------
+        Dictionary with started, wall_seconds, peak_rss_mb, counters of the run, and stages:
+        for each stage its calls, seconds (total), max_seconds, peak_rss_mb (of the process, at the
+        end of its calls) and counters
+        """
+        with self._lock:
+            stages = {name: dict(record, counters=dict(record['counters'])) for name, record in self._stages.items()}
+            counters = dict(self._counters)
+        for record in stages.values():
+            record['seconds'] = round(record['seconds'], 6)
+            record['max_seconds'] = round(record['max_seconds'], 6)
+        return {
+            'started': self.started.isoformat(),
+            'wall_seconds': round(time.perf_counter() - self._start, 6),
+            'peak_rss_mb': peak_rss_mb(),
+            'counters': counters,
+            'stages': stages,
+        }
+
+    def write_report(self, path):
+        """
+        Write report() as JSON to path
+
+        Returns
+        -------
+        path
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+        logging.info("Run report written to {}".format(path))
+        return path
+
+    def enable_profiling(self, directory, profiler='cprofile'):
+        """
+        Profile every stage from now on
+
+        Parameters
+        ----------
+        directory (string): where dump_profiles writes the profiles
+        profiler (string): "cprofile" (<stage>.prof, for pstats or snakeviz) or "pyinstrument"
+                           (<stage>.txt), which has to be installed
+        """
+        if profiler not in PROFILERS:
+            raise ValueError("Unknown profiler {}, expected one of {}".format(profiler, PROFILERS))
+        if profiler == 'pyinstrument':
+            # Fail now rather than in the first stage
+            import pyinstrument  # noqa: F401
+        with self._lock:
+            self._profiler = profiler
+            self._profile_directory = directory
+
+    def dump_profiles(self):
+        """
+        Write the profile of every profiled stage
+
+        Returns
+        -------
+        List of paths written
+        """
+        if self._profile_directory is None:
+            return []
+        os.makedirs(self._profile_directory, exist_ok=True)
+        paths = []
+        with self._lock:
+            profiles = dict(self._profiles)
+        for name, profile in profiles.items():
+            if self._profiler == 'cprofile':
+                path = os.path.join(self._profile_directory, '{}.prof'.format(name))
+                profile.dump_stats(path)
+            else:
+                path = os.path.join(self._profile_directory, '{}.txt'.format(name))
+                with open(path, 'w') as f:
+                    f.write(profile.output_text())
+            paths.append(path)
+        logging.info("{} stage profiles written to {}".format(len(paths), self._profile_directory))
+        return paths
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _record(self, name):
+        # Call with the lock held
+        if name not in self._stages:
+            self._stages[name] = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'peak_rss_mb': 0.0,
+                                  'counters': {}}
+        return self._stages[name]
+
+    def _start_profile(self, name):
+        # Another profiler, e.g. one the whole run is under, is active. Before Python 3.12 enabling
+        # a profile would silently replace it rather than raise.
+        if sys.getprofile() is not None:
+            return None
+        with self._lock:
+            if self._profiler is None or self._profiling:
+                return None
+            self._profiling = True
+            profile = self._profiles.get(name)
+            if profile is None:
+                if self._profiler == 'cprofile':
+                    import cProfile
+                    profile = cProfile.Profile()
+                else:
+                    from pyinstrument import Profiler
+                    profile = Profiler()
+                self._profiles[name] = profile
+        try:
+            if self._profiler == 'cprofile':
+                profile.enable()
+            else:
+                profile.start()
+        except ValueError as e:
+            # Another profiler is active in a thread of its own (Python 3.12+)
+            logging.debug(e)
+            with self._lock:
+                self._profiling = False
+            return None
+        return profile
+
+    def _stop_profile(self, profile):
+        if self._profiler == 'cprofile':
+            profile.disable()
+        else:
+            profile.stop()
+        with self._lock:
+            self._profiling = False
+
+
+# Metrics of the current run, used by the module functions
+metrics = RunMetrics()
+
+stage = metrics.stage
+timed = metrics.timed
+count = metrics.count
+current_stages = metrics.current_stages
+within = metrics.within
+report = metrics.report
+write_report = metrics.write_report
+enable_profiling = metrics.enable_profiling
+dump_profiles = metrics.dump_profiles
+reset = metrics.reset
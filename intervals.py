@@ -0,0 +1,238 @@
+"""
+Interval index over the burning period of each fire, from its start date to its contained date.
+
+Answers, without scanning every fire:
+    active_count(date)          number of fires burning on a date, O(log n)
+    active(date)                fires burning on a date, O(log n * log d + k)
+    overlapping(start, end)     fires burning at any time in a window, O(log n * log d + k)
+    daily_counts(start, end)    number of fires burning on each day, O(n + days)
+where k is the number of fires returned and d the number of days spanned by the data.
+
+Dates are whole days. A fire burns from its start date through its contained date, both included.
+Cal Fire does not publish contained dates, so fires without one are taken to burn until the data
+was last updated if they are less than 100% contained, and for the median duration of the fires that
+have one otherwise. Start dates outside the year a fire is listed under (Cal Fire shows missing dates
+as 12/31/1969) are treated as missing.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Node keys pack (level + 1, block) into one integer; blocks of a level are below 2 ** _LEVEL_SHIFT
+_LEVEL_SHIFT = 40
+
+
+def start_dates(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): fires with start_date, and optionally year
+
+    Returns
+    -------
+    Pandas series of the start dates as datetime64, NaT if missing, unparseable or outside the year
+    the fire is listed under
+    """
+    start = pd.to_datetime(df['start_date'], errors='coerce')
+    if 'year' in df.columns:
+        year = pd.to_numeric(df['year'], errors='coerce').to_numpy()
+        start = start.where(start.dt.year.to_numpy() == year)
+    return start
+
+
+def interval_defaults(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): fires, as given to FireIntervals
+
+    Returns
+    -------
+    (default_days, today) that FireIntervals takes for df when they are not given
+    """
+    return _defaults(*_bounds(df))
+
+
+def _bounds(df):
+    # Start and contained dates, indexed by row
+    start = start_dates(df).reset_index(drop=True)
+    if 'contained_date' in df.columns:
+        end = pd.to_datetime(df['contained_date'], errors='coerce').reset_index(drop=True)
+    else:
+        end = pd.Series(pd.NaT, index=start.index)
+    return start, end
+
+
+def _defaults(start, end, default_days=None, today=None):
+    if today is None:
+        latest = pd.Series([start.max(), end.max()]).max()
+        today = datetime.today() if pd.isnull(latest) else min(latest, pd.Timestamp(datetime.today()))
+    today = pd.Timestamp(today).normalize()
+    if default_days is None:
+        known = start.notnull() & end.notnull() & (end >= start)
+        durations = (end[known] - start[known]).dt.days
+        default_days = int(durations.median()) if len(durations) else 0
+    return default_days, today
+
+
+class FireIntervals(object):
+
+    def __init__(self, df, default_days=None, today=None):
+        """
+        Parameters
+        ----------
+        df (Pandas dataframe): fires with start_date, and optionally contained_date and containment
+        default_days (int): duration of contained fires without a contained date. Defaults to the
+                            median duration of the fires that have one.
+        today (datetime): end of fires that are still burning. Defaults to the latest date in the
+                          data, i.e. when it was last updated, but not later than today.
+        """
+        self._df = df
+
+        start, end = _bounds(df)
+        default_days, today = _defaults(start, end, default_days, today)
+        self.default_days = default_days
+        self.today = today
+
+        missing = start.notnull() & end.isnull()
+        end = end.where(~missing, start + pd.Timedelta(days=default_days))
+        if 'containment' in df.columns:
+            containment = df['containment'].astype(str).str.rstrip('%').reset_index(drop=True)
+            burning = missing & (pd.to_numeric(containment, errors='coerce') < 100)
+            end = end.where(~burning, today)
+        end = end.where(end >= start, start)
+
+        # Fires without a start date can not be placed in time
+        self._positions = np.flatnonzero(start.notnull().values)
+        days_start = start.values[self._positions].astype('datetime64[D]').astype(np.int64)
+        days_end = end.values[self._positions].astype('datetime64[D]').astype(np.int64)
+        self.origin = np.datetime64(int(days_start.min()), 'D') if len(days_start) else np.datetime64(0, 'D')
+        self._start = days_start - self.origin.astype(np.int64)
+        self._end = days_end - self.origin.astype(np.int64)
+
+        self._by_start_order = np.argsort(self._start, kind='stable')
+        self._sorted_start = self._start[self._by_start_order]
+        self._sorted_end = np.sort(self._end)
+        self._build_tree()
+
+    def __len__(self):
+        return len(self._start)
+
+    def active_count(self, date):
+        """
+        Returns
+        -------
+        Number of fires burning on date
+        """
+        day = self._day(date)
+        started = np.searchsorted(self._sorted_start, day, side='right')
+        ended = np.searchsorted(self._sorted_end, day, side='left')
+        return int(started - ended)
+
+    def active(self, date):
+        """
+        Returns
+        -------
+        Rows of the fires burning on date, in their original order
+        """
+        return self._rows(self._stab(self._day(date)))
+
+    def overlapping(self, start, end):
+        """
+        Parameters
+        ----------
+        start, end (dates): window, both days included
+
+        Returns
+        -------
+        Rows of the fires burning at any time between start and end, in their original order
+        """
+        first, last = self._day(start), self._day(end)
+        if last < first:
+            return self._rows(np.array([], dtype=np.int64))
+        # Fires burning on the first day, and fires starting later in the window
+        lo = np.searchsorted(self._sorted_start, first, side='right')
+        hi = np.searchsorted(self._sorted_start, last, side='right')
+        return self._rows(np.concatenate([self._stab(first), self._by_start_order[lo:hi]]))
+
+    def daily_counts(self, start=None, end=None):
+        """
+        Parameters
+        ----------
+        start, end (dates): range of days, defaults to the first and last day of any fire
+
+        Returns
+        -------
+        Pandas series with the number of fires burning on each day, indexed by date
+        """
+        num_days = int(self._end.max()) + 1 if len(self) else 0
+        # +1 on the day a fire starts, -1 on the day after it is contained
+        change = (np.bincount(self._start, minlength=num_days + 1) -
+                  np.bincount(self._end + 1, minlength=num_days + 1))
+        counts = pd.Series(np.cumsum(change[:num_days]), index=pd.date_range(self.origin, periods=num_days))
+        if start is not None or end is not None:
+            counts = counts.reindex(pd.date_range(start or counts.index[0], end or counts.index[-1]), fill_value=0)
+        return counts
+
+    def _day(self, date):
+        day = pd.Timestamp(date).to_datetime64().astype('datetime64[D]')
+        return int(day.astype(np.int64) - self.origin.astype(np.int64))
+
+    def _rows(self, indices):
+        return self._df.iloc[self._positions[np.sort(indices)]]
+
+    def _build_tree(self):
+        # Implicit centered interval tree over days. A fire is stored at the first node, going down
+        # from the root, whose center day it burns on: for level h, the blocks of 2 ** (h + 1) days
+        # are split at their center, and a fire is stored at level h if it starts before the center
+        # and ends on or after it. h is the highest bit in which its start and end days differ.
+        # One day fires are stored at level -1. Each node keeps its fires sorted by start and by end.
+        differ = self._start ^ self._end
+        level = np.where(differ > 0, np.frexp(differ.astype(np.float64))[1] - 1, -1).astype(np.int64)
+        self._levels = int(level.max()) + 1 if len(self) else 0
+        width = level + 1
+        block_start = (self._start >> width) << width
+
+        # Fires of a node are within its block, so sorting a level by start (or by descending end,
+        # mirrored inside the block) groups it by node too
+        self._node_by_start = np.argsort((width << _LEVEL_SHIFT) | self._start)
+        mirrored_end = 2 * block_start + (1 << width) - 1 - self._end
+        self._node_by_end = np.argsort((width << _LEVEL_SHIFT) | mirrored_end)
+        self._node_start = self._start[self._node_by_start]
+        self._node_neg_end = -self._end[self._node_by_end]
+
+        keys = ((width << _LEVEL_SHIFT) | (self._start >> width))[self._node_by_start]
+        first = np.flatnonzero(np.diff(keys, prepend=-1))
+        last = np.append(first[1:], len(keys))
+        self._nodes = dict(zip(keys[first].tolist(), zip(first.tolist(), last.tolist())))
+
+    def _stab(self, day):
+        """
+        Returns
+        -------
+        Indices of the fires burning on day, one binary search per level of the tree
+        """
+        found = []
+        if day < 0:
+            return np.array([], dtype=np.int64)
+        for level in range(-1, self._levels):
+            block = day >> (level + 1)
+            node = self._nodes.get(((level + 1) << _LEVEL_SHIFT) | block)
+            if node is None:
+                continue
+            lo, hi = node
+            if level == -1:
+                # One day fires, all on this day
+                found.append(self._node_by_start[lo:hi])
+                continue
+            center = (block << (level + 1)) + (1 << level)
+            if day < center:
+                # All fires of the node end after day, those started by day are burning
+                count = np.searchsorted(self._node_start[lo:hi], day, side='right')
+                found.append(self._node_by_start[lo:lo + count])
+            else:
+                # All fires of the node started before day, those not yet contained are burning
+                count = np.searchsorted(self._node_neg_end[lo:hi], -day, side='right')
+                found.append(self._node_by_end[lo:lo + count])
+        return np.concatenate(found) if found else np.array([], dtype=np.int64)
@@ -0,0 +1,298 @@
+"""
+Record linkage of Cal Fire and Wikipedia incidents.
+
+Both sources list many of the same fires under slightly different names ("Camp Fire" and "Camp"),
+dates and county lists. link_incidents matches them, one to one, and merges the matches into one
+row with the fields of both sources.
+
+Two incidents are candidates if they share a county and started within window_days of each other.
+Candidates are found by blocking rather than comparing every pair: each incident is keyed by
+(county, start day), and the window of each incident on one side is looked up in the sorted keys
+of the other side, so the number of comparisons grows with the number of fires per county and
+day, not with the product of the two tables. Incidents without a county are keyed by start day
+and the first letter of their name instead, and incidents without a start date by county, year
+and name.
+
+Names are compared by the Jaccard similarity of their character trigrams, computed once per
+distinct pair of normalized names.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from counties import MULTIPLE_COUNTIES, explode_counties
+from intervals import start_dates
+
+# Cal Fire fields win, Wikipedia fills in what Cal Fire does not have
+WIKI_FIELDS = ['notes', 'contained_date']
+
+_PARENTHESES = re.compile(r'\([^)]*\)')
+_NOT_ALNUM = re.compile(r'[^a-z0-9]+')
+_FIRE_WORD = re.compile(r'\bfires?\b')
+
+
+def normalize_names(names):
+    """
+    Parameters
+    ----------
+    names (Pandas series): incident names, e.g. "Camp Fire", "CAMP (Butte County)"
+
+    Returns
+    -------
+    Pandas series of lower case names without the word fire, parentheses or punctuation, e.g. "camp"
+    """
+    names = names.fillna('').astype(str).str.lower()
+    names = names.str.replace(_PARENTHESES, ' ', regex=True).str.replace(_FIRE_WORD, ' ', regex=True)
+    return names.str.replace(_NOT_ALNUM, ' ', regex=True).str.split().str.join(' ')
+
+
+def _trigrams(name):
+    padded = '  {} '.format(name)
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def name_similarity(left, right):
+    """
+    Parameters
+    ----------
+    left, right (arrays): normalized names, compared pairwise
+
+    Returns
+    -------
+    Numpy array with the trigram Jaccard similarity of each pair, from 0 to 1
+    """
+    codes, names = pd.factorize(pd.concat([pd.Series(left, dtype=object), pd.Series(right, dtype=object)],
+                                          ignore_index=True))
+    return _similarity(codes[:len(left)], codes[len(left):], names)
+
+
+def _similarity(left_codes, right_codes, names):
+    # Similarity of names[left_codes] and names[right_codes], scoring each distinct pair once
+    similarity = np.ones(len(left_codes))
+    differ = np.flatnonzero(left_codes != right_codes)
+    pair_codes = left_codes[differ].astype(np.int64) * len(names) + right_codes[differ]
+    distinct, inverse = np.unique(pair_codes, return_inverse=True)
+    trigrams = {}
+    scores = np.empty(len(distinct))
+    for i, (a, b) in enumerate(zip((distinct // len(names)).tolist(), (distinct % len(names)).tolist())):
+        for code in (a, b):
+            if code not in trigrams:
+                trigrams[code] = _trigrams(names[code])
+        union = len(trigrams[a] | trigrams[b])
+        scores[i] = len(trigrams[a] & trigrams[b]) / union if union else 0.0
+    similarity[differ] = scores[inverse.reshape(-1)]
+    return similarity
+
+
+def _blocking_keys(df, counties, county_codes, name_codes, initial_codes):
+    """
+    Returns
+    -------
+    Dataframe with one row per incident and county, all integer codes: id (row of the incident),
+    county, day (-1 if missing), year, name and initial (first letter of name)
+    """
+    ids = counties.fire_id.to_numpy()
+    days = start_dates(df).values.astype('datetime64[D]')[ids]
+    names = name_codes[ids]
+    return pd.DataFrame({
+        'id': ids,
+        'county': county_codes,
+        'day': np.where(np.isnat(days), -1, days.astype(np.int64)),
+        'year': pd.to_numeric(df['year'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)[ids],
+        'name': names,
+        'initial': initial_codes[names],
+    })
+
+
+def candidate_pairs(left, right, window_days=3):
+    """
+    Pairs of incidents that share a county and started within window_days. Incidents without a
+    county pair with those that started within window_days and whose name has the same first
+    letter. Incidents without a start date pair with those of the same county, year and name.
+
+    Returns
+    -------
+    Dataframe with left and right (row positions) and days (difference of start dates, NaN if one
+    is missing), one row per pair
+    """
+    left_names, right_names, names = _name_codes(left, right)
+    return _candidate_pairs(left, right, window_days, left_names, right_names, names)
+
+
+def _name_codes(left, right):
+    # Codes of the normalized names of both tables, and the names. Names repeat, so each distinct
+    # name is normalized once.
+    raw_codes, raw_names = pd.factorize(pd.concat([left['name'], right['name']], ignore_index=True))
+    normalized = normalize_names(pd.Series(raw_names, dtype=object))
+    name_codes, uniques = pd.factorize(pd.concat([normalized, pd.Series([''])], ignore_index=True))
+    # Missing names get code -1, i.e. the trailing empty name
+    codes = name_codes[raw_codes]
+    return codes[:len(left)], codes[len(left):], uniques
+
+
+def _candidate_pairs(left, right, window_days, left_names, right_names, names):
+    left_counties, right_counties = explode_counties(left[['county']]), explode_counties(right[['county']])
+    county_codes, counties = pd.factorize(pd.concat([left_counties.county, right_counties.county],
+                                                    ignore_index=True))
+    unknown = counties.get_loc(MULTIPLE_COUNTIES) if MULTIPLE_COUNTIES in counties else -1
+    initial_codes = pd.factorize(pd.Series(names).str[:1])[0]
+    left_keys = _blocking_keys(left, left_counties, county_codes[:len(left_counties)], left_names, initial_codes)
+    right_keys = _blocking_keys(right, right_counties, county_codes[len(left_counties):], right_names,
+                                initial_codes)
+    pairs = []
+
+    # Dated fires: same county, or no county (listed as multiple) on either side and the same initial
+    left_dated = left_keys[left_keys.day >= 0]
+    right_dated = right_keys[right_keys.day >= 0]
+    left_unknown = (left_dated.county == unknown).to_numpy()
+    right_unknown = (right_dated.county == unknown).to_numpy()
+    for block, left_rows, right_rows in [('county', slice(None), slice(None)),
+                                         ('initial', left_unknown, ~right_unknown),
+                                         ('initial', ~left_unknown, right_unknown)]:
+        a, b = left_dated[left_rows], right_dated[right_rows]
+        a_rows, b_rows = _window_join(a[block].to_numpy(), a.day.to_numpy(), b[block].to_numpy(), b.day.to_numpy(),
+                                      window_days)
+        pairs.append(pd.DataFrame({'id_left': a.id.to_numpy()[a_rows], 'id_right': b.id.to_numpy()[b_rows]}))
+
+    # Undated fires, on either side
+    left_undated = left_keys.day < 0
+    right_undated = right_keys.day < 0
+    for a, b in [(left_keys[left_undated], right_keys), (left_keys[~left_undated], right_keys[right_undated])]:
+        pairs.append(a.merge(b, on=['county', 'year', 'name'], suffixes=('_left', '_right'))[['id_left', 'id_right']])
+
+    pairs = pd.concat(pairs, ignore_index=True).drop_duplicates()
+    pairs.columns = ['left', 'right']
+    left_days = start_dates(left).values.astype('datetime64[D]')
+    right_days = start_dates(right).values.astype('datetime64[D]')
+    # NaN if either date is missing
+    days = left_days[pairs.left.to_numpy()] - right_days[pairs.right.to_numpy()]
+    pairs['days'] = np.abs(days / np.timedelta64(1, 'D'))
+    return pairs.reset_index(drop=True)
+
+
+def _window_join(left_blocks, left_days, right_blocks, right_days, window_days):
+    """
+    Pairs of rows in the same block that are at most window_days apart. The rows of the right
+    side are sorted by (block, day) once, and the window of each left row is a range of them
+    found by binary search, so no row is repeated for every day of its window.
+
+    Returns
+    -------
+    (left rows, right rows) of the pairs, as numpy arrays of positions
+    """
+    if not len(left_days) or not len(right_days):
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    low = min(left_days.min(), right_days.min()) - window_days
+    scale = max(left_days.max(), right_days.max()) + window_days - low + 1
+    left_keys = left_blocks.astype(np.int64) * scale + (left_days - low)
+    right_keys = right_blocks.astype(np.int64) * scale + (right_days - low)
+
+    order = np.argsort(right_keys, kind='stable')
+    sorted_keys = right_keys[order]
+    start = np.searchsorted(sorted_keys, left_keys - window_days, side='left')
+    counts = np.searchsorted(sorted_keys, left_keys + window_days, side='right') - start
+    left_rows = np.repeat(np.arange(len(left_keys)), counts)
+    within = np.arange(len(left_rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return left_rows, order[np.repeat(start, counts) + within]
+
+
+def match_incidents(left, right, window_days=3, min_similarity=0.6):
+    """
+    Match incidents of two tables one to one
+
+    Parameters
+    ----------
+    left, right (Pandas dataframes): incidents with name, start_date, county and year
+    window_days (int): largest difference of start dates of a match
+    min_similarity (float): smallest name similarity of a match. Matches without a start date on
+                            either side need an identical normalized name.
+
+    Returns
+    -------
+    Dataframe with left and right (row positions of the matched incidents) and score
+    """
+    if not len(left) or not len(right):
+        return pd.DataFrame({'left': np.array([], dtype=np.int64), 'right': np.array([], dtype=np.int64),
+                             'score': np.array([])})
+    left_names, right_names, names = _name_codes(left, right)
+    pairs = _candidate_pairs(left, right, window_days, left_names, right_names, names)
+    left_codes, right_codes = left_names[pairs.left.to_numpy()], right_names[pairs.right.to_numpy()]
+    similarity = _similarity(left_codes, right_codes, names)
+    # Fires without a name match nothing
+    similarity[names[left_codes] == ''] = 0
+
+    keep = np.where(pairs.days.isnull(), similarity == 1.0, similarity >= min_similarity)
+    pairs = pairs[keep]
+    # Closer names first, then closer dates
+    pairs = pairs.assign(score=similarity[keep] - pairs.days.fillna(window_days + 1) / (10.0 * (window_days + 1)))
+
+    # Greedy one to one assignment: take the pairs that are the best pair of both their fires,
+    # drop those fires, and repeat with the pairs that are left. The best pair overall always
+    # qualifies, so every round matches at least one pair.
+    matches = [pd.DataFrame({'left': np.array([], dtype=np.int64), 'right': np.array([], dtype=np.int64),
+                             'score': np.array([])})]
+    pairs = pairs.sort_values('score', ascending=False, kind='stable')
+    while len(pairs):
+        best = pairs.drop_duplicates('left').merge(pairs.drop_duplicates('right')[['left', 'right']],
+                                                   on=['left', 'right'])
+        matches.append(best[['left', 'right', 'score']])
+        pairs = pairs[~pairs.left.isin(best.left) & ~pairs.right.isin(best.right)]
+    return pd.concat(matches, ignore_index=True)
+
+
+def link_incidents(calfire, wiki, window_days=3, min_similarity=0.6, keep_unmatched=True):
+    """
+    Merge Cal Fire and Wikipedia incidents of the same years into one table
+
+    Parameters
+    ----------
+    calfire (Pandas dataframe): Cal Fire incidents, with name, start_date, county, acres and year
+    wiki (Pandas dataframe): Wikipedia incidents, with notes and contained_date as well
+    window_days, min_similarity: see match_incidents
+    keep_unmatched (bool): add Wikipedia incidents that match no Cal Fire incident
+
+    Returns
+    -------
+    Dataframe with every Cal Fire incident, in order, and the fields of its Wikipedia match:
+    notes and contained_date where Cal Fire has none, and wiki_name and wiki_acres (a number) as
+    listed by Wikipedia. source is "calfire", "both" or "wikipedia", and match_score the score of the match.
+    """
+    calfire = calfire.reset_index(drop=True)
+    wiki = wiki.reset_index(drop=True)
+    matches = match_incidents(calfire, wiki, window_days, min_similarity)
+
+    linked = calfire.copy()
+    rows, wiki_rows = matches.left.to_numpy(), matches.right.to_numpy()
+    linked['source'] = 'calfire'
+    linked.loc[rows, 'source'] = 'both'
+    linked['match_score'] = np.nan
+    linked.loc[rows, 'match_score'] = matches.score.to_numpy()
+
+    for field in WIKI_FIELDS:
+        if field not in wiki.columns:
+            continue
+        if field not in linked.columns:
+            linked[field] = None
+        current = linked[field].iloc[rows]
+        missing = (current.isnull() | (current.astype(str).str.strip() == '')).to_numpy()
+        values = wiki[field].iloc[wiki_rows[missing]]
+        # Dates stay datetime64: parsing a whole column of objects again is slow
+        if field.endswith('_date'):
+            linked[field] = pd.to_datetime(linked[field], errors='coerce')
+            values = pd.to_datetime(values, errors='coerce')
+        else:
+            linked[field] = linked[field].astype(object)
+        linked.loc[rows[missing], field] = values.to_numpy()
+    # Typed rather than object columns of None, which are slow to concatenate
+    linked['wiki_name'] = pd.Series(pd.NA, index=linked.index, dtype='string')
+    linked.loc[rows, 'wiki_name'] = wiki['name'].iloc[wiki_rows].astype(str).to_numpy()
+    wiki_acres = pd.to_numeric(wiki['acres'].astype(str).str.replace(',', '', regex=False), errors='coerce')
+    linked['wiki_acres'] = np.nan
+    linked.loc[rows, 'wiki_acres'] = wiki_acres.iloc[wiki_rows].to_numpy()
+
+    if keep_unmatched:
+        unmatched = wiki.drop(index=matches.right.values).copy()
+        unmatched['source'] = 'wikipedia'
+        linked = pd.concat([linked, unmatched], ignore_index=True)
+    return linked
@@ -1,60 +1,378 @@
-import matplotlib.pyplot as plt
-import matplotlib
+from matplotlib.artist import setp
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.patches import Patch
-import seaborn as sns
 
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from counties import *
-
-matplotlib.rcParams['font.family'] = "AppleGothic"
-sns.set(style='darkgrid', palette='muted')
+import logging
+from aggregates import FireAggregates
+from build_cache import fingerprint_figure, fingerprint_input
+from counties import MULTIPLE_COUNTIES
+import instrumentation
 
 TODAY = datetime.today()
 TODAY = TODAY.strftime("%Y-%m-%d")   # date-string to name files
 
 
+# Figures are drawn on explicit Figure objects with an Agg canvas, not through the pyplot
+# state machine, so they can be drawn in worker processes and are freed once saved.
+
+_style_is_set = False
+
+
+def _setup_style():
+    """
+    Apply the seaborn style, once per process. seaborn is slow to import, so this is
+    deferred until the first figure is drawn.
+    """
+    global _style_is_set
+    if not _style_is_set:
+        import seaborn as sns
+        sns.set(style='darkgrid', palette='muted')
+        _style_is_set = True
+
+
+def draw_annual_stats(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): FireAggregates.annual()
+
+    Returns
+    -------
+    Figure with total/largest area burned, and number of fires, by year
+    """
+    f = Figure(figsize=(16, 5))
+    a = f.subplots(1, 2)
+
+    a[0].bar(df.year, df.total_area_burned_SF, color='grey', alpha=0.7, label='total area burned')
+    a[0].bar(df.year, df.biggest_fire_area_SF, color='orange', alpha=0.7, label='largest fire area')
+    a[0].set_xticks(range(2002, 2022, 2))
+    a[0].set_ylabel("Area (# San Franciscos)", fontsize=16)
+    a[0].legend()
+
+    a[1].bar(df.year, df.num_fires)
+    a[1].set_xticks(range(2002, 2022, 2))
+    a[1].set_ylabel("Number of Fires", fontsize=16)
+    return f
+
+
+def draw_monthly_stats(monthly_df):
+    """
+    Parameters
+    ----------
+    monthly_df (Pandas dataframe): FireAggregates.monthly()
+
+    Returns
+    -------
+    Figure with total/largest area burned, and number of fires, by calendar month
+    """
+    f = Figure(figsize=(16, 5))
+    a = f.subplots(1, 2)
+    a[0].bar(monthly_df.month, monthly_df.total_area_SF, color='grey', alpha=0.5, label='total area burned')
+    a[0].bar(monthly_df.month, monthly_df.largest_fire_SF, color='orange', alpha=0.5, label='largest fire area')
+    a[0].set_ylabel("Area (# San Franciscos)", fontsize=16)
+    a[0].set_xlabel("month", fontsize=16)
+    a[0].legend()
+
+    a[1].bar(monthly_df.month, monthly_df.num_fires)
+    a[1].set_ylabel("# Fires", fontsize=16)
+    a[1].set_xlabel("month", fontsize=16)
+    return f
+
+
+def draw_county_num_fires(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): FireAggregates.county()
+
+    Returns
+    -------
+    Figure with number of fires by county, with multi-county fires split between their counties.
+    Fires without a county are shown as "No county listed".
+    """
+    df = df.sort_values('num_fires', ascending=False)
+    df = df.assign(county=df.county.replace({MULTIPLE_COUNTIES: 'No county listed'}))
+
+    f = Figure(figsize=(18, 8))
+    a = f.subplots()
+    a.bar(df.county, height=df.num_fires, color=df.color.values, alpha=0.7)
+    setp(a.get_xticklabels(), rotation=90, fontsize=14)
+    a.set_ylabel("# fires   (2002-present)", fontsize=16)
+    a.set_xlabel("County", fontsize=16)
+
+    legend_elements = [Patch(facecolor='teal', label='SF Bay Area'),
+                       Patch(facecolor='orange', label='SoCal'),
+                       Patch(facecolor='pink', label='Sierras/Cascades'),
+                       Patch(facecolor='maroon', label='No county listed'),
+                       Patch(facecolor='grey', label='Northern and Central Coast, Central Valley')]
+
+    a.legend(handles=legend_elements, loc='best', fancybox=True, frameon=True, facecolor='w', fontsize=14)
+    return f
+
+
+def draw_county_fire_area(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): FireAggregates.county()
+
+    Returns
+    -------
+    Figure with total area burned by county, with the area of multi-county fires split between
+    their counties. Fires without a county are left out.
+    """
+    df = df.sort_values('total_area', ascending=False)
+    df = df[df.county != MULTIPLE_COUNTIES]
+
+    f = Figure(figsize=(18, 8))
+    a = f.subplots()
+    a.bar(df.county, height=df.total_area, color=df.color.values, alpha=0.7)
+    setp(a.get_xticklabels(), rotation=90, fontsize=14)
+    a.set_ylabel("Total acres burned  (2002-present)", fontsize=16)
+    a.set_xlabel("County", fontsize=16)
+
+    legend_elements = [Patch(facecolor='teal', label='SF Bay Area'),
+                       Patch(facecolor='orange', label='SoCal'),
+                       Patch(facecolor='pink', label='Sierras/Cascades'),
+                       Patch(facecolor='grey', label='Other')]
+
+    a.legend(handles=legend_elements, loc='best', fancybox=True, frameon=True, facecolor='w', fontsize=14)
+    return f
+
+
+def draw_largest_fires(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): FireAggregates.largest(n)
+
+    Returns
+    -------
+    Figure with the area of each fire in df
+    """
+    # We will color code the last five years, all other years will be grey
+    current_year = datetime.today().year
+    years = [i for i in range(current_year, current_year - 5, -1)]
+    colors = ['#cc3300', '#ff8c66', '#e6ac00', '#ffd24d', '#ffdf80']
+    color = df.year.map(dict(zip(years, colors))).fillna('grey')
+
+    f = Figure(figsize=(18, 8))
+    a = f.subplots()
+    a.bar(df.display_name, height=df.area_SF, color=color, alpha=0.6)
+
+    legend_elements = [Patch(facecolor=colors[i], label=str(years[i])) for i in range(5)]
+    a.legend(handles=legend_elements, loc='best', fancybox=True, frameon=True, facecolor='w', fontsize=14)
+
+    setp(a.get_xticklabels(), rotation=90, fontsize=16)
+    setp(a.get_yticklabels(), fontsize=16)
+
+    a.set_ylabel("Fire area    (# SFs)", fontsize=16)
+    a.set_title("Twenty Largest Fires", fontsize=24)
+    return f
+
+
+def draw_active_fires(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): FireAggregates.daily_active()
+
+    Returns
+    -------
+    Figure with the number of fires burning on each day
+    """
+    f = Figure(figsize=(18, 5))
+    a = f.subplots()
+    a.fill_between(df.date.values, df.active_fires.values, step='post', color='orange', alpha=0.6)
+    a.set_xlim(df.date.min(), df.date.max())
+    a.set_ylim(bottom=0)
+    a.set_ylabel("# fires burning", fontsize=16)
+    a.set_title("Fires burning each day", fontsize=24)
+    return f
+
+
+def draw_rolling_fires(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): FireAggregates.rolling('started')
+
+    Returns
+    -------
+    Figure with the number of fires started per day, averaged over each window
+    """
+    f = Figure(figsize=(18, 5))
+    a = f.subplots()
+    windows = [column for column in df.columns if column != 'date']
+    colors = ['#ffd24d', '#ff8c66', '#cc3300']
+    for window, color in zip(windows, colors):
+        a.plot(df.date.values, df[window].values, color=color, lw=1 if window == windows[0] else 2,
+               label='{} day average'.format(window[:-1]))
+    a.set_ylim(bottom=0)
+    a.set_ylabel("# fires started per day", fontsize=16)
+    a.set_title("Fires started, rolling averages", fontsize=24)
+    a.legend(loc='upper left', fontsize=14)
+    return f
+
+
+def draw_season_curves(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): FireAggregates.season_curves('acres')
+
+    Returns
+    -------
+    Figure with the acres burned so far each year, by day of the year, the latest year highlighted
+    """
+    f = Figure(figsize=(18, 8))
+    a = f.subplots()
+    years = [column for column in df.columns if column != 'day_of_year']
+    for year in years[:-1]:
+        a.plot(df.day_of_year.values, df[year].values, color='grey', alpha=0.4, lw=1)
+    if years:
+        a.plot(df.day_of_year.values, df[years[-1]].values, color='#cc3300', lw=3, label=str(years[-1]))
+        a.legend(loc='upper left', fontsize=14)
+    a.set_xticks([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+    a.set_xticklabels(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
+    setp(a.get_xticklabels(), fontsize=14)
+    a.set_ylabel("Acres burned so far", fontsize=16)
+    a.set_title("Fire seasons", fontsize=24)
+    return f
+
+
+def draw_acres_anomalies(df):
+    """
+    Parameters
+    ----------
+    df (Pandas dataframe): FireAggregates.anomalies('acres', window)
+
+    Returns
+    -------
+    Figure with the acres of fires started over the window, above (red) or below (blue) the mean
+    of the same time of the year
+    """
+    f = Figure(figsize=(18, 5))
+    a = f.subplots()
+    anomaly = df.anomaly.fillna(0).values
+    a.fill_between(df.date.values, anomaly, where=anomaly > 0, color='#cc3300', alpha=0.6, step='post')
+    a.fill_between(df.date.values, anomaly, where=anomaly < 0, color='teal', alpha=0.6, step='post')
+    a.axhline(0, color='black', lw=0.5)
+    a.set_ylabel("Acres, difference with usual", fontsize=16)
+    window = "{} days".format(int(df.window.iloc[0])) if len(df) else "the window"
+    a.set_title("Acres burned over {}, compared to the same time in other years".format(window), fontsize=24)
+    return f
+
+
+@instrumentation.timed('plot.render')
+def render_figure(draw, data, filename):
+    """
+    Draw a figure, save it, and release it
+
+    Parameters
+    ----------
+    draw (function): one of the draw_* functions
+    data (Pandas dataframe): aggregate passed to draw
+    filename (string)
+
+    Returns
+    -------
+    filename
+    """
+    _setup_style()
+    fig = draw(data)
+    FigureCanvasAgg(fig)
+    fig.savefig(filename, bbox_inches='tight', dpi=150)
+    fig.clear()
+    return filename
+
+
+DRAW_FUNCTIONS = [draw_annual_stats, draw_monthly_stats, draw_county_num_fires, draw_county_fire_area,
+                  draw_largest_fires, draw_active_fires, draw_rolling_fires, draw_season_curves,
+                  draw_acres_anomalies]
+
+
 class Plotter(object):
 
     def __init__(self, df):
-        self.df = df
+        self.aggregates = FireAggregates(df)
 
-    def generate_all_plots(self):
-        self.plot_annual_stats()
-        self.plot_monthly_stats()
-        self.plot_county_stats()
-        self.plot_largest_fires()
+    @property
+    def df(self):
+        return self.aggregates.df
 
-    def plot_annual_stats(self):
-        """
-        Plots number of fires by year
-        Plots total area burned by year
+    @df.setter
+    def df(self, df):
+        self.aggregates.set_data(df)
 
+    @instrumentation.timed('plot.all')
+    def generate_all_plots(self, parallel=False, workers=None, build_cache=None):
+        """
         Parameters
         ----------
-        df (Pandas dataframe): dataframe containing wildfire data.
+        parallel (bool): render each figure in its own worker process
+        workers (int): number of worker processes, defaults to one per figure
+        build_cache (build_cache.PlotBuildCache): skip figures whose data has not changed since
+                                                  they were last rendered, reusing the old image
 
         Returns
         -------
-        Figures are saved in "images/<today>-annual-stats.png".
+        List of paths written
         """
-        df = self.df.groupby('year', as_index=False).agg({'area_SF': ['sum', 'max', 'count']})
-        df.columns = ['year', 'total_area_burned_SF', 'biggest_fire_area_SF', 'num_fires']
-        f, a = plt.subplots(1, 2, figsize=(16, 5))
-
-        a[0].bar(df.year, df.total_area_burned_SF, color='grey', alpha=0.7, label='total area burned')
-        a[0].bar(df.year, df.biggest_fire_area_SF, color='orange', alpha=0.7, label='largest fire area')
-        a[0].set_xticks(range(2002, 2022, 2))
-        a[0].set_ylabel("Area (# San Franciscos)", fontsize=16)
-        a[0].legend()
-
-        a[1].bar(df.year, df.num_fires)
-        a[1].set_xticks(range(2002, 2022, 2))
-        a[1].set_ylabel("Number of Fires", fontsize=16)
+        input_fingerprint = None
+        if build_cache is not None:
+            input_fingerprint = fingerprint_input(DRAW_FUNCTIONS, self.df)
+            if build_cache.input_is_current(input_fingerprint):
+                logging.info("Input data unchanged, reusing all figures")
+                paths = []
+                for name in build_cache.figures():
+                    build_cache.reuse(name, None, self._filename(name))
+                    paths.append(self._filename(name))
+                build_cache.save(input_fingerprint)
+                return paths
+
+        with instrumentation.stage('plot.aggregate'):
+            jobs = self.jobs()
+        to_render = []
+        for name, draw, data in jobs:
+            if build_cache is not None:
+                fingerprint = fingerprint_figure(draw, data)
+                if build_cache.reuse(name, fingerprint, self._filename(name)):
+                    continue
+                build_cache.record(name, fingerprint, self._filename(name))
+            to_render.append((draw, data, self._filename(name)))
+        instrumentation.count('figures_rendered', len(to_render))
+        instrumentation.count('figures_reused', len(jobs) - len(to_render))
+
+        if not parallel or len(to_render) < 2:
+            for job in to_render:
+                render_figure(*job)
+        else:
+            # Workers get the small aggregates, never the full frame
+            with ProcessPoolExecutor(max_workers=workers or len(to_render)) as executor:
+                for future in [executor.submit(render_figure, *job) for job in to_render]:
+                    future.result()
+
+        if build_cache is not None:
+            build_cache.save(input_fingerprint)
+        return [self._filename(name) for name, _, _ in jobs]
+
+    @instrumentation.timed('plot.annual_stats')
+    def plot_annual_stats(self):
+        """
+        Plots number of fires by year
+        Plots total area burned by year
 
-        filename = "images/{}-annual-stats.png".format(TODAY)
-        plt.savefig(filename, bbox_inches='tight', dpi=150)
+        Returns
+        -------
+        Path of the figure, saved in "images/<today>-annual-stats.png".
+        """
+        return self._render(self._annual_jobs())[0]
 
+    @instrumentation.timed('plot.monthly_stats')
     def plot_monthly_stats(self):
         """
         Plots number of fires by calendar month
@@ -62,100 +380,23 @@ class Plotter(object):
 
         Returns
         -------
-        Nothing. Figures are saved in "images/<today>-monthly-stats.png"
-        """
-
-        df = self.df.copy()
-        df['start_date'] = pd.to_datetime(df.start_date)
-        df['month'] = df.start_date.apply(lambda x: x.month)
-        monthly_df = df.groupby('month', as_index=False).agg({'acres': ['sum', 'count', 'max'],
-                                                              'area_SF': ['sum', 'max']})
-        monthly_df.columns = ['month', 'total_area', 'num_fires', 'largest_fire_area',
-                              'total_area_SF', 'largest_fire_SF']
-        f, a = plt.subplots(1, 2, figsize=(16, 5))
-        a[0].bar(monthly_df.month, monthly_df.total_area_SF, color='grey', alpha=0.5, label='total area burned')
-        a[0].bar(monthly_df.month, monthly_df.largest_fire_SF, color='orange', alpha=0.5, label='largest fire area')
-        a[0].set_ylabel("Area (# San Franciscos)", fontsize=16)
-        a[0].set_xlabel("month", fontsize=16)
-        a[0].legend()
-
-        a[1].bar(monthly_df.month, monthly_df.num_fires)
-        a[1].set_ylabel("# Fires", fontsize=16)
-        a[1].set_xlabel("month", fontsize=16)
-
-        filename = "images/{}-monthly-stats.png".format(TODAY)
-        plt.savefig(filename, bbox_inches='tight', dpi=150)
+        Path of the figure, saved in "images/<today>-monthly-stats.png"
+        """
+        return self._render(self._monthly_jobs())[0]
 
+    @instrumentation.timed('plot.county_stats')
     def plot_county_stats(self):
         """
         Plots number of fires and area burned by county starting from 2002 until present
 
         Returns
         -------
-        Nothing.
-        Figures saved in images/<TODAY>-county-num-fires.png
+        Paths of the figures, saved in images/<TODAY>-county-num-fires.png
+        and images/<TODAY>-county-fire-area.png
         """
+        return self._render(self._county_jobs())
 
-        df = self.df.copy()
-        # calfire excludes county if there are multiple, sometimes
-        df['county'].fillna('Multiple Counties', inplace=True)
-
-        # And sometimes, it includes all counties separated by commas, or 'and'
-        def clean_county_name(name):
-            if "," in name or 'and' in name:
-                return 'Multiple Counties'
-            else:
-                return name
-
-        df['county2'] = df.county.apply(clean_county_name)
-
-        df = df.groupby("county2", as_index=False).agg({'name': 'count', 'acres': ['sum', 'max']})
-        df.columns = ['county', 'num_fires', 'total_area', 'largest_fire_area']
-
-        # throw out 1 fire each from Mexico, Nevada and Oregon
-        df = df[~df.county.isin(["State of Oregon", "State of Nevada", "Mexico"])]
-        df['color'] = df.county.apply(get_county_color)
-
-        # Plot number of fires by county
-        df = df.sort_values('num_fires', ascending=False)
-
-        plt.figure(figsize=(18, 8))
-        plt.bar(df.county, height=df.num_fires, color=df.color.values, alpha=0.7)
-        plt.xticks(rotation=90, fontsize=14)
-        plt.ylabel("# fires   (2002-present)", fontsize=16)
-        plt.xlabel("County", fontsize=16)
-
-        legend_elements = [Patch(facecolor='teal', label='SF Bay Area'),
-                           Patch(facecolor='orange', label='SoCal'),
-                           Patch(facecolor='pink', label='Sierras/Cascades'),
-                           Patch(facecolor='maroon', label='Multiple counties'),
-                           Patch(facecolor='grey', label='Northern and Central Coast, Central Valley')]
-
-        plt.legend(handles=legend_elements, loc='best', fancybox=True, frameon=True, facecolor='w', fontsize=14)
-
-        filename = "images/{}-county-num-fires.png".format(TODAY)
-        plt.savefig(filename, bbox_inches='tight', dpi=150)
-
-        # Plot total area burned by county
-        df = df.sort_values('total_area', ascending=False)
-        df = df[df.county != "Multiple Counties"].copy()
-
-        plt.figure(figsize=(18, 8))
-        plt.bar(df.county, height=df.total_area, color=df.color.values, alpha=0.7)
-        plt.xticks(rotation=90, fontsize=14)
-        plt.ylabel("Total acres burned  (2002-present)", fontsize=16)
-        plt.xlabel("County", fontsize=16)
-
-        legend_elements = [Patch(facecolor='teal', label='SF Bay Area'),
-                           Patch(facecolor='orange', label='SoCal'),
-                           Patch(facecolor='pink', label='Sierras/Cascades'),
-                           Patch(facecolor='grey', label='Other')]
-
-        plt.legend(handles=legend_elements, loc='best', fancybox=True, frameon=True, facecolor='w', fontsize=14)
-
-        filename = "images/{}-county-fire-area.png".format(TODAY)
-        plt.savefig(filename, bbox_inches='tight', dpi=150)
-
+    @instrumentation.timed('plot.largest_fires')
     def plot_largest_fires(self, n=20):
         """
         Plots n largest fires
@@ -166,46 +407,70 @@ class Plotter(object):
 
         Returns
         -------
-        Nothing.
-        Figures saved in images/<TODAY>-largest_fires.png
+        Path of the figure, saved in images/<TODAY>-largest_fires.png
+        """
+        return self._render(self._largest_fires_jobs(n))[0]
+
+    @instrumentation.timed('plot.active_fires')
+    def plot_active_fires(self):
+        """
+        Plots the number of fires burning on each day, from start to containment
+
+        Returns
+        -------
+        Path of the figure, saved in images/<TODAY>-active-fires.png
+        """
+        return self._render(self._active_fires_jobs())[0]
+
+    @instrumentation.timed('plot.timeseries')
+    def plot_timeseries(self):
+        """
+        Plots fires started per day averaged over 7, 30 and 365 days, acres burned so far each
+        season, and the acres burned over 30 days compared to the same time in other years
+
+        Returns
+        -------
+        Paths of the figures, saved in images/<TODAY>-rolling-fires.png,
+        images/<TODAY>-season-curves.png and images/<TODAY>-acres-anomalies.png
         """
-        df = self.df.sort_values(by='acres', ascending=False)
-        df = df.iloc[:n, :].copy()
-        df.county.fillna("", inplace=True)
+        return self._render(self._timeseries_jobs())
 
-        # Add year to fire name for display in plot
-        def get_display_name(row):
-            name = row['name']
-            new_name = name.split("(")[0].strip()
-            display_name = '{}, {}'.format(new_name, row.year)
-            return display_name
+    def jobs(self):
+        """
+        Returns
+        -------
+        List of (figure name, draw function, aggregate) for every figure, see render_figure
+        """
+        return (self._annual_jobs() + self._monthly_jobs() + self._county_jobs() + self._largest_fires_jobs() +
+                self._active_fires_jobs() + self._timeseries_jobs())
 
-        df['display_name'] = df.apply(get_display_name, axis=1)
+    def _render(self, jobs):
+        return [render_figure(draw, data, self._filename(name)) for name, draw, data in jobs]
 
-        # We will color code the last five years, all other years will be grey
-        current_year = datetime.today().year
-        years = [i for i in range(current_year, current_year - 5, -1)]
-        colors = ['#cc3300', '#ff8c66', '#e6ac00', '#ffd24d', '#ffdf80']
+    @staticmethod
+    def _filename(name):
+        return "images/{}-{}.png".format(TODAY, name)
 
-        def get_color(year):
-            if year in years:
-                return colors[years.index(year)]
-            else:
-                return 'grey'
+    # Each *_jobs method returns (figure name, draw function, aggregate) for the figures of one plot
 
-        df['color'] = df.year.apply(get_color)
+    def _annual_jobs(self):
+        return [('annual-stats', draw_annual_stats, self.aggregates.annual())]
 
-        plt.figure(figsize=(18, 8))
-        plt.bar(df.display_name, height=df.area_SF, color=df.color, alpha=0.6)
+    def _monthly_jobs(self):
+        return [('monthly-stats', draw_monthly_stats, self.aggregates.monthly())]
 
-        legend_elements = [Patch(facecolor=colors[i], label=str(years[i])) for i in range(5)]
-        plt.legend(handles=legend_elements, loc='best', fancybox=True, frameon=True, facecolor='w', fontsize=14)
+    def _county_jobs(self):
+        df = self.aggregates.county()
+        return [('county-num-fires', draw_county_num_fires, df),
+                ('county-fire-area', draw_county_fire_area, df)]
 
-        plt.xticks(rotation=90, fontsize=16)
-        plt.yticks(fontsize=16)
+    def _largest_fires_jobs(self, n=20):
+        return [('largest_fires', draw_largest_fires, self.aggregates.largest(n))]
 
-        plt.ylabel("Fire area    (# SFs)", fontsize=16)
-        plt.title("Twenty Largest Fires", fontsize=24)
+    def _active_fires_jobs(self):
+        return [('active-fires', draw_active_fires, self.aggregates.daily_active())]
 
-        filename = "images/{}-largest_fires.png".format(TODAY)
-        plt.savefig(filename, bbox_inches='tight', dpi=150)
+    def _timeseries_jobs(self):
+        return [('rolling-fires', draw_rolling_fires, self.aggregates.rolling('started')),
+                ('season-curves', draw_season_curves, self.aggregates.season_curves('acres')),
+                ('acres-anomalies', draw_acres_anomalies, self.aggregates.anomalies('acres', 30))]
@@ -1,19 +1,25 @@
-import pandas as pd
-from plotter import Plotter
-from calfire_data_fetcher import CalFire
-from wikipedia_calfire_scraper import WikiFire
+from calfire_backends import BACKENDS
+from datetime import datetime
+import instrumentation
+import argparse
 import sys
-import re
 import os
 
 import logging
 log_format = '%(asctime)s|%(levelname)s| %(message)s'
 logging.basicConfig(stream=sys.stdout, format=log_format, level=logging.INFO)
 
-SAN_FRANCISCO_LAND_AREA = 30022.4   # acres
+# Heavy modules (pandas, selenium, requests, matplotlib, seaborn) are imported in the
+# functions that use them, so a subcommand only pays for what it runs.
 
+COMBINED_STEM = 'combined_fire_data'
+COUNTIES_STEM = 'fire_counties'
+# Cal Fire years, and Wikipedia pages, fetched concurrently
+DEFAULT_WORKERS = 4
 
-def get_combined_dataframe():
+
+@instrumentation.timed('combine')
+def get_combined_dataframe(backend='selenium', cache=None, workers=DEFAULT_WORKERS):
     """
     Gather data from Calfire and Wikipedia, and combine the two dataframes
 
@@ -24,39 +30,186 @@ def get_combined_dataframe():
     It also does not include end (contained) date, and a clean notes columns. Additional
     info on fires is presented in its own individual page.
 
+    From 2013 on, Cal Fire incidents are linked to the Wikipedia incidents of the same fire
+    (see linkage.link_incidents), which fill in their notes and contained dates.
+
+    Parameters
+    ----------
+    backend (string): how Cal Fire incidents are fetched, "selenium", "http" or "auto"
+    cache (http_cache.PageCache): raw page cache shared by both scrapers
+    workers (int): number of Cal Fire years fetched concurrently, each with its own backend session,
+                   and of Wikipedia pages fetched concurrently
+
     Returns
     -------
     Dataframe with all wildfire data from 2002 - present
     """
-
-    cf = CalFire()
-    calfire = cf.get_data()
-    wf = WikiFire()
+    import pandas as pd
+    from calfire_data_fetcher import CalFire
+    from counties import SAN_FRANCISCO_LAND_AREA
+    from linkage import link_incidents
+    from wikipedia_calfire_scraper import WikiFire
+
+    cf = CalFire(backend=backend, cache=cache)
+    calfire = cf.get_data(workers=workers)
+    wf = WikiFire(cache=cache, workers=workers)
     wikifire = wf.get_data()
 
     # Rename column, and add empty columns to concatenate with older wiki data
     calfire.rename(columns={'acres_burned': 'acres'}, inplace=True)
     calfire['notes'] = ''
-    calfire['contained_date'] = None
-
-    all_fires = pd.concat([wikifire[wikifire.year < 2013], calfire])
-
-    # Convert acres from string to int
-    all_fires.acres.fillna("", inplace=True)
-    all_fires['acres'] = all_fires.acres.apply(lambda x: int(re.sub(",", "", x)) if x != '' else 0)
+    calfire['contained_date'] = pd.NaT
+
+    # Wikipedia fires of the Cal Fire years only add their details to the matching Cal Fire fire.
+    # Without any, nothing can link and the link columns are left out.
+    recent, older = wikifire[wikifire.year >= 2013], wikifire[wikifire.year < 2013]
+    if len(recent):
+        with instrumentation.stage('link'):
+            calfire = link_incidents(calfire, recent, keep_unmatched=False)
+            instrumentation.count('incidents_linked', int((calfire.source == 'both').sum()))
+        older = older.assign(source='wikipedia')
+    all_fires = pd.concat([older, calfire])
+
+    # Convert acres from string to int. Tables read through storage are already typed.
+    if not pd.api.types.is_numeric_dtype(all_fires.acres):
+        acres = all_fires.acres.fillna("").str.replace(",", "", regex=False).replace("", "0")
+        all_fires['acres'] = pd.to_numeric(acres).astype(int)
     all_fires["area_SF"] = all_fires['acres']/SAN_FRANCISCO_LAND_AREA
+    instrumentation.count('rows_combined', len(all_fires))
 
     return all_fires
 
 
-if __name__ == '__main__':
+@instrumentation.timed('fetch', profile=False)
+def fetch(args):
+    """
+    Fetch or refresh Cal Fire and Wikipedia data in data/
+    """
+    from calfire_data_fetcher import CalFire
+    from wikipedia_calfire_scraper import WikiFire
+
+    cache = _page_cache(args)
+    CalFire(backend=args['backend'], cache=cache).get_data(workers=args['workers'])
+    WikiFire(cache=cache, workers=args['workers']).get_data()
+
+
+@instrumentation.timed('clean', profile=False)
+def clean(args):
+    """
+    Combine and clean the fetched data, and store it as data/<date>_combined_fire_data, along with
+    one row per fire and county it burned in as data/<date>_fire_counties (see
+    counties.explode_counties, fire_id is the row of the fire in the combined data)
+
+    Returns
+    -------
+    Combined dataframe
+    """
+    from counties import explode_counties
+    from storage import COUNTIES_SCHEMA, write_table
+
+    fire_df = get_combined_dataframe(backend=args['backend'], cache=_page_cache(args), workers=args['workers'])
+    fire_df = fire_df.reset_index(drop=True)
+    today = datetime.today().strftime('%Y-%m-%d')
+    path = write_table(fire_df, os.path.join('data', '{}_{}'.format(today, COMBINED_STEM)))
+    logging.info("Combined data saved to {}".format(path))
+    path = write_table(explode_counties(fire_df), os.path.join('data', '{}_{}'.format(today, COUNTIES_STEM)),
+                       schema=COUNTIES_SCHEMA)
+    logging.info("Fires by county saved to {}".format(path))
+    return fire_df
+
+
+@instrumentation.timed('plot', profile=False)
+def plot(args, fire_df=None):
+    """
+    Generate all figures in images/, from fire_df or else from the latest stored combined data
+    """
+    from plotter import Plotter
+    from build_cache import PlotBuildCache
+
+    if fire_df is None:
+        fire_df = _stored_dataframe(args)
 
     # All figures are saved in images/
     if not os.path.exists('images/'):
         os.mkdir('images')
 
-    fire_df = get_combined_dataframe()
-
     logging.info("Generating plots")
     plotter = Plotter(fire_df)
-    plotter.generate_all_plots()
+    build_cache = None if args['force'] else PlotBuildCache()
+    return plotter.generate_all_plots(parallel=args['parallel'], build_cache=build_cache)
+
+
+@instrumentation.timed('export', profile=False)
+def export(args, fire_df=None):
+    """
+    Export all figures in every format of args['formats'] and width of args['widths'] to
+    args['out'], from fire_df or else from the latest stored combined data
+    """
+    from exporter import FigureExporter
+    from plotter import TODAY, Plotter
+
+    if fire_df is None:
+        fire_df = _stored_dataframe(args)
+    widths = [None if width == 0 else width for width in args['widths']]
+    logging.info("Exporting figures to {}".format(args['out']))
+    return FigureExporter(args['out'], prefix=TODAY).export(Plotter(fire_df), args['formats'], widths)
+
+
+def _stored_dataframe(args):
+    from storage import find_table, read_table
+
+    path = find_table('data', COMBINED_STEM)
+    if path is None:
+        logging.info("No combined data found, run 'clean' first. Combining now.")
+        return get_combined_dataframe(backend=args['backend'], cache=_page_cache(args), workers=args['workers'])
+    logging.info("Using combined data {}".format(path))
+    return read_table(path)
+
+
+def _page_cache(args):
+    if args['no_cache']:
+        return None
+    from http_cache import PageCache
+    return PageCache()
+
+
+if __name__ == '__main__':
+
+    ap = argparse.ArgumentParser(description="Fetch wildfire data and plot it. Without a command, does everything.")
+    ap.add_argument("-b", "--backend", default='selenium', choices=BACKENDS, help="how to fetch Cal Fire incidents")
+    ap.add_argument("-w", "--workers", default=DEFAULT_WORKERS, type=int,
+                    help="number of years and pages to fetch in parallel (one headless browser each with selenium)")
+    ap.add_argument("--no-cache", action='store_true', help="download pages even if a cached copy is current")
+    ap.add_argument("--parallel", action='store_true', help="render figures in parallel worker processes")
+    ap.add_argument("--force", action='store_true', help="render all figures, even if their data has not changed")
+    ap.add_argument("--report", default=None, help="write a JSON report of stage timings and counters to this path")
+    ap.add_argument("--profile", default=None, help="profile each stage, writing the profiles to this directory")
+    ap.add_argument("--profiler", default='cprofile', choices=instrumentation.PROFILERS, help="profiler for --profile")
+    ap.add_argument("--formats", nargs='+', default=['png', 'svg', 'webp'], help="formats of export")
+    ap.add_argument("--widths", nargs='+', default=[0, 1200, 600, 320], type=int,
+                    help="widths in pixels of export, 0 for the native size")
+    ap.add_argument("--out", default=os.path.join('images', 'export'), help="directory of export")
+    ap.add_argument("command", nargs='?', choices=['fetch', 'clean', 'plot', 'export'],
+                    help="fetch: refresh data/, clean: store combined data, plot: generate images/, "
+                         "export: write every figure in several formats and sizes to --out")
+    args = vars(ap.parse_args())
+
+    if args['profile']:
+        instrumentation.enable_profiling(args['profile'], args['profiler'])
+    try:
+        if args['command'] == 'fetch':
+            fetch(args)
+        elif args['command'] == 'clean':
+            clean(args)
+        elif args['command'] == 'plot':
+            plot(args)
+        elif args['command'] == 'export':
+            export(args)
+        else:
+            plot(args, get_combined_dataframe(backend=args['backend'], cache=_page_cache(args),
+                                              workers=args['workers']))
+    finally:
+        # Also after a failure, to see how far the run got
+        if args['report']:
+            instrumentation.write_report(args['report'])
+        instrumentation.dump_profiles()
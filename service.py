@@ -0,0 +1,399 @@
+"""
+Long-running service keeping the combined fire data and its aggregates in memory, and serving them
+over a local HTTP API.
+
+The data is loaded once (from the latest combined table in data/, or fetched if there is none), its
+aggregates are computed up front, and a background thread refreshes both every refresh interval
+with CalFire and WikiFire. Requests only read what is already in memory:
+
+    GET  /health                     rows, version and time of the data, last refresh error
+    GET  /aggregates/<name>          annual, monthly, county, daily_active, largest (?n=20),
+                                     rolling, season_curves or anomalies, as JSON
+    GET  /cube?by=year,region&year=2020&month=7,8
+                                     cube.FireCube rollup (or its slice without by), as JSON
+    GET  /figures/<name>.<format>    figure rendered on demand as png, svg or webp, optionally resized
+                                     with ?width=600, e.g. /figures/annual-stats.png
+    GET  /report                     instrumentation report of the service
+    POST /refresh                    refresh now, in the background
+
+Responses are cached per URL until the data changes, and carry the data version as their ETag, so
+pollers get a 304 without a body while the data is unchanged. A refresh that fetches the same data
+keeps the cache, and one that changes some fires updates the cube and the daily time series of the
+served version with those fires only (FireAggregates.update_from). /health and /report change
+without the data, and are computed on every request, without an ETag.
+
+Usage:
+    python service.py [--host 127.0.0.1] [--port 8050] [--refresh-minutes 60] [-b http] [-w 4] [--no-cache]
+"""
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import json
+import logging
+import threading
+
+from exporter import FORMATS, FigureExporter
+import instrumentation
+
+AGGREGATES = ['annual', 'monthly', 'county', 'daily_active', 'largest', 'rolling', 'season_curves', 'anomalies']
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml', 'webp': 'image/webp'}
+# Largest width of a figure, in pixels
+MAX_WIDTH = 4000
+
+
+class ServiceError(Exception):
+
+    def __init__(self, status, message):
+        super(ServiceError, self).__init__(message)
+        self.status = status
+
+
+class FireService(object):
+
+    def __init__(self, backend='http', cache=None, refresh_seconds=3600, max_responses=256, workers=4):
+        """
+        Parameters
+        ----------
+        backend (string): how Cal Fire incidents are fetched, see run.get_combined_dataframe
+        cache (http_cache.PageCache): raw page cache of the scrapers
+        refresh_seconds (float): time between background refreshes
+        max_responses (int): number of responses kept in the cache, least recently used first out
+        workers (int): number of years and pages fetched concurrently, see run.get_combined_dataframe
+        """
+        self.backend = backend
+        self.cache = cache
+        self.refresh_seconds = refresh_seconds
+        self.max_responses = max_responses
+        self.workers = workers
+        self.last_error = None
+        # (Plotter of the compact data, version, loaded_at, NotesTable), replaced as a whole on refresh
+        self._state = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._exporter = FigureExporter()
+        self._responses = OrderedDict()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        return self._state[1] if self._state else None
+
+    def load(self, df=None):
+        """
+        Load df, or else the latest combined table in data/, or else fetch the data
+
+        Returns
+        -------
+        True if the data changed
+        """
+        if df is None:
+            from run import COMBINED_STEM
+            from storage import find_table, read_table
+
+            path = find_table('data', COMBINED_STEM)
+            if path is None:
+                return self.refresh()
+            logging.info("Serving combined data {}".format(path))
+            df = read_table(path)
+        return self._swap(df)
+
+    @instrumentation.timed('service.refresh')
+    def refresh(self):
+        """
+        Fetch and combine the data again, and serve it once its aggregates are computed. On
+        failure, the current data is kept and the error is reported by /health.
+
+        Returns
+        -------
+        True if the data changed
+        """
+        from run import get_combined_dataframe
+
+        # One refresh at a time, a refresh asked for meanwhile is served by the running one
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            df = get_combined_dataframe(backend=self.backend, cache=self.cache, workers=self.workers)
+            changed = self._swap(df)
+            self.last_error = None
+            return changed
+        except Exception as e:
+            logging.exception("Refresh failed, still serving version {}".format(self.version))
+            self.last_error = '{}: {}'.format(type(e).__name__, e)
+            return False
+        finally:
+            self._refresh_lock.release()
+
+    def start(self):
+        """
+        Refresh in a background thread every refresh_seconds, until stop
+        """
+        def loop():
+            while not self._stop.wait(self.refresh_seconds):
+                self.refresh()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='fire-service-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def refresh_in_background(self):
+        threading.Thread(target=self.refresh, name='fire-service-refresh-now', daemon=True).start()
+
+    def get(self, path, query=None):
+        """
+        Response of a GET request, from the cache if the data has not changed since
+
+        Parameters
+        ----------
+        path (string): e.g. "/aggregates/annual"
+        query (dict): query parameters, each a list of values as given by urllib.parse.parse_qs
+
+        Returns
+        -------
+        (content type, body as bytes, data version). The version is None for /health and /report,
+        whose content changes without the data.
+        """
+        state = self._state
+        if state is None:
+            raise ServiceError(503, "No data loaded yet")
+        query = query or {}
+        if path == '/health':
+            return self._json(self.health())
+        if path == '/report':
+            return self._json(instrumentation.report())
+
+        key = (state[1], path, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+        if response is not None:
+            instrumentation.count('responses_cached')
+            return response
+
+        with instrumentation.stage('service.respond'):
+            response = self._respond(path, query, state)
+        instrumentation.count('responses_computed')
+        with self._lock:
+            self._responses[key] = response
+            while len(self._responses) > self.max_responses:
+                self._responses.popitem(last=False)
+        return response
+
+    def health(self):
+        """
+        Returns
+        -------
+        Dictionary with rows, version, loaded_at and memory_mb (of the data and notes) of the data,
+        and last_error of the last refresh
+        """
+        from compact import memory_report
+
+        state = self._state
+        return {
+            'rows': len(state[0].df) if state else 0,
+            'memory_mb': round(memory_report(state[0].df, state[3]).bytes.iloc[-1] / 1e6, 1) if state else 0,
+            'version': state[1] if state else None,
+            'loaded_at': state[2].isoformat() if state else None,
+            'last_error': self.last_error,
+        }
+
+    def _swap(self, df):
+        from aggregates import changed_rows
+        from build_cache import fingerprint_frame
+        from compact import compact_incidents
+        from plotter import Plotter
+
+        df = df.reset_index(drop=True)
+        version = fingerprint_frame(df)[:16]
+        if self._state is not None and self._state[1] == version:
+            logging.info("Data unchanged, still serving version {}".format(version))
+            return False
+
+        # Only the compact frame is kept, and the aggregates are computed before serving them
+        df, notes = compact_incidents(df)
+        plotter = Plotter(df)
+        previous = self._state[0].aggregates if self._state is not None else None
+        with instrumentation.stage('service.aggregate'):
+            if previous is not None and _same_columns(previous.df, df):
+                # The cube and the time series of the served version, updated with the changed fires
+                removed, added = changed_rows(previous.df, df)
+                instrumentation.count('rows_changed', len(removed) + len(added))
+                plotter.aggregates.update_from(previous, removed, added)
+            plotter.jobs()
+            plotter.aggregates.cube()
+        with self._lock:
+            self._state = (plotter, version, datetime.now(), notes)
+            self._responses.clear()
+        logging.info("Serving {} fires, version {}".format(len(df), version))
+        return True
+
+    def _respond(self, path, query, state):
+        plotter = state[0]
+        parts = [part for part in path.split('/') if part]
+        if len(parts) == 2 and parts[0] == 'aggregates':
+            name = parts[1]
+            if name not in AGGREGATES:
+                raise ServiceError(404, "Unknown aggregate {}, expected one of {}".format(name, AGGREGATES))
+            if name == 'largest':
+                df = plotter.aggregates.largest(_int(query, 'n', 20))
+                df = df.assign(notes=state[3].get(df.index).values)
+            else:
+                df = getattr(plotter.aggregates, name)()
+            return self._frame(df, state)
+
+        if parts == ['cube']:
+            cube = plotter.aggregates.cube()
+            by = [name for value in query.get('by', []) for name in value.split(',') if name]
+            selection = {}
+            try:
+                for name in ['year', 'month', 'county', 'region']:
+                    values = [value for values in query.get(name, []) for value in values.split(',')]
+                    if values:
+                        selection[name] = [int(value) for value in values] if name in ['year', 'month'] else values
+                if by:
+                    return self._frame(cube.rollup(by, **selection), state)
+                return self._json(cube.slice(**selection), state)
+            except ValueError as e:
+                raise ServiceError(400, str(e))
+
+        if len(parts) == 2 and parts[0] == 'figures' and parts[1].rpartition('.')[2] in FORMATS:
+            name, _, format = parts[1].rpartition('.')
+            jobs = {job[0]: job[1:] for job in plotter.jobs()}
+            if name not in jobs:
+                raise ServiceError(404, "Unknown figure {}, expected one of {}".format(name, sorted(jobs)))
+            width = _int(query, 'width', None)
+            if width is not None and not 0 < width <= MAX_WIDTH:
+                raise ServiceError(400, "width should be between 1 and {}".format(MAX_WIDTH))
+            # Figures are drawn one at a time: the style setup and font cache are shared
+            with self._render_lock:
+                variants = self._exporter.render(name, jobs[name][0], jobs[name][1], [format], [width])
+            return CONTENT_TYPES[format], list(variants.values())[0], state[1]
+
+        raise ServiceError(404, "Unknown path {}".format(path))
+
+    @staticmethod
+    def _frame(df, state):
+        return 'application/json', df.to_json(orient='records', date_format='iso').encode('utf-8'), state[1]
+
+    @staticmethod
+    def _json(data, state=None):
+        return 'application/json', json.dumps(data).encode('utf-8'), state[1] if state is not None else None
+
+
+def _same_columns(old, new):
+    # Same columns and types, categoricals whatever their categories: rows can be compared
+    return list(old.columns) == list(new.columns) and \
+        [str(dtype) for dtype in old.dtypes] == [str(dtype) for dtype in new.dtypes]
+
+
+def _int(query, name, default):
+    if name not in query:
+        return default
+    try:
+        return int(query[name][0])
+    except ValueError:
+        raise ServiceError(400, "{} should be an integer".format(name))
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    Serves the FireService of its server (server.service)
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            content_type, body, version = self.server.service.get(url.path, parse_qs(url.query))
+        except ServiceError as e:
+            return self._send(e.status, 'application/json', json.dumps({'error': str(e)}).encode('utf-8'))
+        except Exception as e:
+            logging.exception("Failed to serve {}".format(self.path))
+            return self._send(500, 'application/json', json.dumps({'error': str(e)}).encode('utf-8'))
+
+        if version is None:
+            return self._send(200, content_type, body)
+        etag = '"{}"'.format(version)
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, None, b'', etag)
+        self._send(200, content_type, body, etag)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/refresh':
+            return self._send(404, 'application/json', json.dumps({'error': 'Unknown path'}).encode('utf-8'))
+        self.server.service.refresh_in_background()
+        self._send(202, 'application/json', json.dumps({'refreshing': True}).encode('utf-8'))
+
+    def _send(self, status, content_type, body, etag=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("{} {}".format(self.address_string(), format % args))
+
+
+def serve(service, host='127.0.0.1', port=8050):
+    """
+    Returns
+    -------
+    ThreadingHTTPServer serving service, call serve_forever on it
+    """
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.service = service
+    return server
+
+
+if __name__ == '__main__':
+    from calfire_backends import BACKENDS
+    from run import DEFAULT_WORKERS
+
+    ap = argparse.ArgumentParser(description="Serve fire aggregates and figures over HTTP, refreshing the data")
+    ap.add_argument("--host", default='127.0.0.1')
+    ap.add_argument("--port", default=8050, type=int)
+    ap.add_argument("--refresh-minutes", default=60, type=float, help="time between data refreshes")
+    ap.add_argument("-b", "--backend", default='http', choices=BACKENDS, help="how to fetch Cal Fire incidents")
+    ap.add_argument("-w", "--workers", default=DEFAULT_WORKERS, type=int,
+                    help="number of years and pages to fetch in parallel")
+    ap.add_argument("--no-cache", action='store_true', help="download pages even if a cached copy is current")
+    args = vars(ap.parse_args())
+
+    logging.basicConfig(level=logging.INFO)
+    import matplotlib
+    matplotlib.use('Agg')
+
+    cache = None
+    if not args['no_cache']:
+        from http_cache import PageCache
+        cache = PageCache()
+
+    service = FireService(backend=args['backend'], cache=cache, refresh_seconds=args['refresh_minutes'] * 60,
+                          workers=args['workers'])
+    service.load()
+    service.start()
+    server = serve(service, args['host'], args['port'])
+    logging.info("Serving on http://{}:{}".format(args['host'], args['port']))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
@@ -0,0 +1,146 @@
+"""
+On-disk staging for tables that are fetched in batches.
+
+Fetchers yield a batch of rows per page (Cal Fire) or per year (Wikipedia). Each batch is
+cleaned and written to "data/.<stem>.staging/" as soon as it arrives, and recorded in a
+checkpoint. Once every batch is in, the staged batches are written out as one table, reading
+one batch at a time. A fetch that is interrupted and run again resumes after the last batch
+that was staged, instead of starting over.
+"""
+from datetime import datetime
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from storage import concat_tables, write_table
+
+CHECKPOINT_FILENAME = 'checkpoint.json'
+
+
+class StagedTable(object):
+
+    def __init__(self, directory, stem, max_age_hours=24):
+        """
+        Parameters
+        ----------
+        directory (string): where the finished table goes, e.g. "data"
+        stem (string): name of the table, e.g. "calfire_data"
+        max_age_hours (float): a checkpoint older than this is discarded, instead of resumed
+        """
+        self.path = os.path.join(directory, '.{}.staging'.format(stem))
+        self.checkpoint_path = os.path.join(self.path, CHECKPOINT_FILENAME)
+        self._lock = threading.Lock()
+        self._state = self._load_checkpoint(max_age_hours)
+
+    def completed(self):
+        """
+        Returns
+        -------
+        Set of units (e.g. years) whose batches are all staged
+        """
+        with self._lock:
+            return {unit for unit, entry in self._state['units'].items() if entry['complete']}
+
+    def batches(self, unit):
+        """
+        Returns
+        -------
+        Number of batches staged for unit, i.e. the number of pages to skip when resuming it
+        """
+        with self._lock:
+            entry = self._state['units'].get(unit)
+            return 0 if entry is None else entry['batches']
+
+    def append(self, unit, df):
+        """
+        Stage the next batch of unit, and checkpoint it
+
+        Parameters
+        ----------
+        unit (string): e.g. a year. Batches of different units may be appended from different threads.
+        df (Pandas dataframe): cleaned rows of the batch
+        """
+        with self._lock:
+            entry = self._state['units'].setdefault(unit, {'batches': 0, 'paths': [], 'complete': False})
+            batch = entry['batches']
+        os.makedirs(self.path, exist_ok=True)
+        path = None
+        if len(df):
+            path = write_table(df, os.path.join(self.path, '{}-{:05d}'.format(unit, batch)))
+        with self._lock:
+            entry['batches'] = batch + 1
+            if path is not None:
+                entry['paths'].append(path)
+            self._save_checkpoint()
+
+    def complete(self, unit):
+        """
+        Mark unit as fully staged. It is skipped when a fetch is resumed.
+        """
+        with self._lock:
+            entry = self._state['units'].setdefault(unit, {'batches': 0, 'paths': [], 'complete': False})
+            entry['complete'] = True
+            self._save_checkpoint()
+
+    def finish(self, path, units=None, export_csv=False):
+        """
+        Write all staged batches as a single table, and remove the staging directory
+
+        Parameters
+        ----------
+        path (string): table to write, extension is ignored
+        units (list): units in the order they should appear, defaults to sorted order
+        export_csv (bool): also write a CSV copy
+
+        Returns
+        -------
+        Path written
+        """
+        with self._lock:
+            if units is None:
+                units = sorted(self._state['units'])
+            paths = [part for unit in units for part in self._state['units'][unit]['paths']]
+        logging.info("Writing {} staged batches to {}".format(len(paths), path))
+        path = concat_tables(paths, path, export_csv=export_csv)
+        self.discard()
+        return path
+
+    def discard(self):
+        """
+        Remove all staged batches and the checkpoint
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        with self._lock:
+            self._state = self._new_state()
+
+    def _load_checkpoint(self, max_age_hours):
+        try:
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+
+        if state is not None:
+            age = datetime.today() - datetime.fromisoformat(state['started'])
+            if age.total_seconds() < max_age_hours * 3600:
+                logging.info("Resuming fetch from checkpoint {}".format(self.checkpoint_path))
+                return state
+            logging.info("Discarding checkpoint {}, started {}".format(self.checkpoint_path, state['started']))
+        shutil.rmtree(self.path, ignore_errors=True)
+        return self._new_state()
+
+    @staticmethod
+    def _new_state():
+        return {'started': datetime.today().isoformat(), 'units': {}}
+
+    def _save_checkpoint(self):
+        # Called with the lock held. Written atomically, so a crash keeps the previous checkpoint.
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._state, f, indent=2)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,247 @@
+"""
+Typed, columnar storage for the fire tables in data/.
+
+Tables are written as Parquet with a declared schema, and read back with column
+projection and memory-mapping, so loading does not re-parse strings on every run.
+CSV is still supported: older dated CSVs are read and typed on load, and a CSV copy
+can be exported next to each table.
+"""
+import logging
+import os
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# Column dtypes of stored tables. Columns not listed here are kept as they are.
+SCHEMA = {
+    'acres': 'int32',
+    'start_date': 'datetime64[ns]',
+    'contained_date': 'datetime64[ns]',
+    'county': 'category',
+    'year': 'int16',
+}
+# Fires by county (counties.explode_counties): acres are shares of a fire's acres, kept as floats
+COUNTIES_SCHEMA = dict(SCHEMA, acres='float64')
+
+# Preferred extension first
+EXTENSIONS = ['.parquet', '.csv']
+
+
+def apply_schema(df, schema=None):
+    """
+    Cast the columns of df listed in the schema to their declared types
+
+    Acres given as strings like "2,400" are converted to numbers, missing acres become 0.
+    Dates that cannot be parsed become NaT.
+
+    Parameters
+    ----------
+    df (Pandas dataframe)
+    schema (dict): column dtypes, SCHEMA if None
+
+    Returns
+    -------
+    Pandas dataframe with typed columns
+    """
+    df = df.copy()
+    for column, dtype in (schema or SCHEMA).items():
+        if column not in df.columns:
+            continue
+        if column == 'acres':
+            acres = df['acres']
+            if not pd.api.types.is_numeric_dtype(acres):
+                acres = pd.to_numeric(acres.astype(str).str.replace(",", "", regex=False), errors='coerce')
+            df['acres'] = acres.fillna(0).astype(dtype)
+        elif dtype.startswith('datetime64'):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def find_table(directory, stem):
+    """
+    Find the latest dated table "<date>_<stem>" in directory, in any of the stored formats
+
+    Parameters
+    ----------
+    directory (string)
+    stem (string): e.g. "calfire_data"
+
+    Returns
+    -------
+    Path, or None. Parquet is preferred over CSV for the same date.
+    """
+    if not os.path.isdir(directory):
+        return None
+    candidates = []
+    for filename in os.listdir(directory):
+        base, extension = os.path.splitext(filename)
+        if extension in EXTENSIONS and base.split("_", 1)[-1] == stem:
+            candidates.append((base.split("_")[0], -EXTENSIONS.index(extension), filename))
+    if not candidates:
+        return None
+    return os.path.join(directory, max(candidates)[2])
+
+
+def table_paths(path):
+    """
+    Returns
+    -------
+    All stored formats of the table at path, that exist
+    """
+    base = os.path.splitext(path)[0]
+    return [base + extension for extension in EXTENSIONS if os.path.exists(base + extension)]
+
+
+def read_table(path, columns=None, schema=None, rows=None):
+    """
+    Parameters
+    ----------
+    path (string): Parquet or CSV file
+    columns (list): read only these columns
+    schema (dict): column dtypes of a CSV file, SCHEMA if None. Parquet files keep their own.
+    rows (boolean array): read only these rows. Other rows of Parquet files are not converted
+                          to Pandas, and other rows of CSV files are not typed.
+
+    Returns
+    -------
+    Pandas dataframe with typed columns
+    """
+    if path.endswith('.parquet'):
+        if rows is None:
+            return pd.read_parquet(path, columns=columns, memory_map=True)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns, memory_map=True, use_pandas_metadata=True)
+        return table.filter(pa.array(rows)).to_pandas().reset_index(drop=True)
+    df = pd.read_csv(path, usecols=columns)
+    if rows is not None:
+        df = df[rows].reset_index(drop=True)
+    return apply_schema(df, schema)
+
+
+def write_table(df, path, export_csv=False, schema=None):
+    """
+    Write df with its schema applied
+
+    Parameters
+    ----------
+    df (Pandas dataframe)
+    path (string): extension is ignored. Written as Parquet, or CSV if pyarrow is not installed.
+    export_csv (bool): also write a CSV copy next to the Parquet file
+    schema (dict): column dtypes, SCHEMA if None
+
+    Returns
+    -------
+    Path written
+    """
+    df = apply_schema(df, schema).reset_index(drop=True)
+    base = os.path.splitext(path)[0]
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    if HAS_PARQUET:
+        path = base + '.parquet'
+        _atomic_write(path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+    else:
+        logging.warning("pyarrow is not installed, storing {} as CSV".format(base))
+        export_csv = True
+        path = base + '.csv'
+
+    if export_csv:
+        _atomic_write(base + '.csv', lambda tmp_path: df.to_csv(tmp_path, index=None))
+    return path
+
+
+def concat_tables(paths, path, export_csv=False):
+    """
+    Write the tables at paths, one after the other, as a single table.
+    Only one of them is held in memory at a time.
+
+    Parameters
+    ----------
+    paths (list): Parquet or CSV tables with the same columns
+    path (string): extension is ignored, as in write_table
+    export_csv (bool): also write a CSV copy next to the Parquet file
+
+    Returns
+    -------
+    Path written
+    """
+    base = os.path.splitext(path)[0]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def frames():
+        for part in paths:
+            yield apply_schema(read_table(part)).reset_index(drop=True)
+
+    if HAS_PARQUET:
+        path = base + '.parquet'
+        _atomic_write(path, lambda tmp_path: _write_parquet_frames(frames(), tmp_path))
+    else:
+        logging.warning("pyarrow is not installed, storing {} as CSV".format(base))
+        export_csv = True
+        path = base + '.csv'
+
+    if export_csv:
+        _atomic_write(base + '.csv', lambda tmp_path: _write_csv_frames(frames(), tmp_path))
+    return path
+
+
+def _write_parquet_frames(frames, path):
+    # Each frame becomes a row group. The schema is taken from the first frame, with columns that
+    # are all missing there typed as strings, and categories allowed to grow beyond int8 codes.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for df in frames:
+            if writer is None:
+                schema = pa.Table.from_pandas(df, preserve_index=False).schema
+                fields = []
+                for field in schema:
+                    if pa.types.is_null(field.type):
+                        field = field.with_type(pa.string())
+                    elif pa.types.is_dictionary(field.type):
+                        field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+                    fields.append(field)
+                schema = pa.schema(fields, metadata=schema.metadata)
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pd.DataFrame().to_parquet(path, index=False)
+
+
+def _write_csv_frames(frames, path):
+    columns = None
+    with open(path, 'w') as f:
+        for df in frames:
+            header = columns is None
+            if header:
+                columns = list(df.columns)
+            f.write(df.to_csv(index=None, header=header, columns=columns))
+
+
+def _atomic_write(path, write):
+    # Write to a temporary file first, so readers never see a partial table
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        # mkstemp creates files readable by the owner only
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,35 @@
+"""
+Shared fixtures: the repository and benchmarks/ on sys.path, and a local http server serving
+saved-page style fixtures (see local_server.py), so the scrapers can be tested offline.
+"""
+import os
+import sys
+
+import pytest
+
+from local_server import LocalServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture
+def local_server(monkeypatch):
+    """
+    Returns
+    -------
+    function starting a LocalServer with the given routes. Servers are shut down after the test.
+    """
+    # Requests to the local server must not go through a proxy of the environment
+    monkeypatch.setenv('NO_PROXY', '127.0.0.1')
+    monkeypatch.setenv('no_proxy', '127.0.0.1')
+    servers = []
+
+    def start(routes):
+        servers.append(LocalServer(routes))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,86 @@
+"""
+Local http server for the tests, and routes serving pages slowly or failing.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import threading
+import time
+
+
+class LocalServer(object):
+    """
+    Serve routes on 127.0.0.1, on a free port.
+
+    A route maps a path to a function of the query (a dict of lists, as from parse_qs) returning
+    (status, body), or to (status, body) itself. Unknown paths get a 404. Every request is recorded
+    in requests as (path, query).
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                server.requests.append((parts.path, query))
+                route = server.routes.get(parts.path, (404, ''))
+                status, body = route(query) if callable(route) else route
+                body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._httpd.server_address[1])
+
+    def requested(self, path):
+        return [query for requested_path, query in self.requests if requested_path == path]
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class PageRoutes(object):
+    """
+    Routes serving pages (a dict of path to html) after delay seconds, recording in max_active how
+    many requests were served at the same time. The first failures[path] requests of a path get
+    failure_status.
+    """
+
+    def __init__(self, pages, delay=0.0, failures=None, failure_status=500):
+        self.pages = pages
+        self.delay = delay
+        self.failures = dict(failures or {})
+        self.failure_status = failure_status
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def routes(self):
+        return {path: lambda query, path=path: self._serve(path) for path in self.pages}
+
+    def _serve(self, path):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            failing = self.failures.get(path, 0) > 0
+            if failing:
+                self.failures[path] -= 1
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return (self.failure_status, '') if failing else (200, self.pages[path])
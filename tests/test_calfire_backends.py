@@ -0,0 +1,109 @@
+"""
+The http backend against a local stub of the incidents page and its JSON feed.
+"""
+import json
+
+import pytest
+
+from calfire_backends import INCIDENT_FEED_PATH, FallbackBackend, HttpBackend, parse_incident_page
+from calfire_data_fetcher import CalFire
+from fixtures import incident_page_html
+
+FEED = [
+    {'Name': 'Creek Fire', 'Started': '2020-09-04T18:33:00Z', 'Counties': ['Fresno', 'Madera'],
+     'AcresBurned': 379895, 'PercentContained': 100, 'IsActive': False},
+    {'Name': 'Zogg Fire', 'Started': '2020-09-27T14:03:00Z', 'Counties': 'Shasta',
+     'AcresBurned': 56338, 'PercentContained': 100, 'IsActive': False},
+    {'Name': 'Other Year Fire', 'Started': '2019-07-01T10:00:00Z', 'Counties': 'Napa',
+     'AcresBurned': 10, 'PercentContained': 100, 'IsActive': False},
+]
+# What the incidents page looks like before its scripts render the table
+UNRENDERED_PAGE = '<html><body><div id="incidents"></div><script src="incidents.js"></script></body></html>'
+
+
+class StubBackend(object):
+    """
+    Secondary backend returning fixed rows, in place of selenium
+    """
+    name = 'stub'
+    errors = ()
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.urls = []
+
+    def open(self, headless=None):
+        return 'session'
+
+    def close(self, session):
+        pass
+
+    def iter_pages(self, url, session, skip=0):
+        self.urls.append(url)
+        yield self.rows
+
+
+def test_http_backend_reads_feed(local_server):
+    server = local_server({INCIDENT_FEED_PATH: (200, json.dumps(FEED))})
+    backend = HttpBackend()
+    session = backend.open()
+    try:
+        df = backend.fetch(server.url + '/incidents/2020/', session)
+    finally:
+        backend.close(session)
+
+    assert list(df.name) == ['Creek Fire', 'Zogg Fire']
+    assert list(df.county) == ['Fresno and Madera', 'Shasta']
+    assert list(df.acres) == ['379,895', '56,338']
+    assert server.requested(INCIDENT_FEED_PATH) == [{'inactive': ['true'], 'year': ['2020']}]
+
+
+def test_http_backend_falls_back_to_page(local_server):
+    page = incident_page_html(n_rows=7, year=2020)
+    server = local_server({INCIDENT_FEED_PATH: (500, ''), '/incidents/2020/': (200, page)})
+    backend = HttpBackend()
+    session = backend.open()
+    try:
+        df = backend.fetch(server.url + '/incidents/2020/', session)
+    finally:
+        backend.close(session)
+
+    assert df.values.tolist() == parse_incident_page(page)
+    assert len(df) == 7
+
+
+def test_parse_incident_page_without_table():
+    with pytest.raises(ValueError):
+        parse_incident_page(UNRENDERED_PAGE)
+    assert parse_incident_page(incident_page_html(n_rows=0)) == []
+
+
+def test_unrendered_page_raises(local_server):
+    server = local_server({INCIDENT_FEED_PATH: (500, ''), '/incidents/2020/': (200, UNRENDERED_PAGE)})
+    backend = HttpBackend()
+    session = backend.open()
+    try:
+        with pytest.raises(ValueError):
+            backend.fetch(server.url + '/incidents/2020/', session)
+    finally:
+        backend.close(session)
+
+
+def test_unrendered_page_is_retried(local_server):
+    server = local_server({INCIDENT_FEED_PATH: (500, ''), '/incidents/2020/': (200, UNRENDERED_PAGE)})
+    calfire = CalFire(base_url=server.url + '/incidents/', backend=HttpBackend())
+
+    with pytest.raises(ValueError):
+        calfire.fetch(2020, 2020, retries=2)
+    assert len(server.requested('/incidents/2020/')) == 3
+
+
+def test_unrendered_page_falls_back_to_secondary(local_server):
+    server = local_server({INCIDENT_FEED_PATH: (500, ''), '/incidents/2020/': (200, UNRENDERED_PAGE)})
+    rows = [['Creek Fire', '9/4/2020', 'Fresno and Madera', '379,895', '100%']]
+    secondary = StubBackend(rows)
+    calfire = CalFire(base_url=server.url + '/incidents/', backend=FallbackBackend(HttpBackend(), secondary))
+
+    df = calfire.fetch(2020, 2020)
+    assert df.drop('year', axis=1).values.tolist() == rows
+    assert secondary.urls == [server.url + '/incidents/2020/']
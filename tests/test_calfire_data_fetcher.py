@@ -0,0 +1,69 @@
+"""
+Parallel per-year fetching of CalFire against a local server serving saved incident pages.
+"""
+from datetime import datetime
+import time
+
+import pandas as pd
+
+from calfire_backends import INCIDENT_FEED_PATH
+from calfire_data_fetcher import CalFire
+from fixtures import incident_page_html
+from local_server import PageRoutes
+
+
+def year_pages(years, delay=0.0, failures=None):
+    """
+    Returns
+    -------
+    (PageRoutes serving an incident page per year, routes with the incident feed missing as well)
+    """
+    pages = {'/incidents/{}/'.format(year): incident_page_html(n_rows=5 + year % 7, year=year, seed=year)
+             for year in years}
+    failures = {'/incidents/{}/'.format(year): count for year, count in (failures or {}).items()}
+    pages = PageRoutes(pages, delay=delay, failures=failures)
+    return pages, dict(pages.routes(), **{INCIDENT_FEED_PATH: (404, '')})
+
+
+def test_parallel_fetch_matches_serial_fetch(local_server):
+    pages, routes = year_pages(range(2013, 2021), delay=0.2)
+    server = local_server(routes)
+    calfire = CalFire(base_url=server.url + '/incidents/', backend='http')
+
+    start = time.perf_counter()
+    parallel = calfire.fetch(2013, 2020, workers=4)
+    parallel_seconds = time.perf_counter() - start
+    assert pages.max_active > 1
+
+    pages.max_active = 0
+    serial = calfire.fetch(2013, 2020)
+    assert pages.max_active == 1
+
+    pd.testing.assert_frame_equal(parallel.reset_index(drop=True), serial.reset_index(drop=True))
+    assert list(parallel.year.unique()) == list(range(2013, 2021))
+    # 8 pages of 0.2s each, fetched 4 at a time
+    assert parallel_seconds < 8 * 0.2
+
+
+def test_parallel_fetch_retries_failed_year(local_server):
+    pages, routes = year_pages(range(2013, 2017), failures={2015: 1})
+    server = local_server(routes)
+    calfire = CalFire(base_url=server.url + '/incidents/', backend='http')
+
+    df = calfire.fetch(2013, 2016, workers=4, retries=1)
+    assert list(df.year.unique()) == list(range(2013, 2017))
+    assert len(df[df.year == 2015]) == 5 + 2015 % 7
+    assert len(server.requested('/incidents/2015/')) == 2
+
+
+def test_get_data_fetches_years_in_parallel(local_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    years = range(2013, datetime.today().year + 1)
+    pages, routes = year_pages(years, delay=0.05)
+    server = local_server(routes)
+    calfire = CalFire(base_url=server.url + '/incidents/', backend='http')
+
+    df = calfire.get_data(workers=4)
+    assert pages.max_active > 1
+    assert sorted(df.year.unique()) == list(years)
+    assert len(df) == sum(5 + year % 7 for year in years)
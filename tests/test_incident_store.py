@@ -0,0 +1,47 @@
+"""
+Upserts into the incident store: only new or changed incidents are appended to the change log.
+"""
+import pandas as pd
+
+from incident_store import IncidentStore, incident_key
+
+
+def incidents():
+    return pd.DataFrame({'name': ['Camp Fire', 'Rim Fire', 'Oak Fire', 'Elm Fire'],
+                         'start_date': ['2018-11-08', '2013-08-17', '2019-07-01', '2020-06-02'],
+                         'county': ['Butte', 'Tuolumne', 'Napa', 'Kern'],
+                         'acres': [153336, 257314, 120, 45],
+                         'containment': ['100%', '100%', '40%', '10%'],
+                         'year': [2018, 2013, 2019, 2020]})
+
+
+def test_load_keys_reads_only_those_incidents(tmp_path):
+    store = IncidentStore(str(tmp_path))
+    store.write(incidents())
+    store.upsert(incidents().iloc[[2]].assign(acres='1,200'))
+
+    keys = incident_key(incidents().iloc[[0, 2]])
+    df = store.load(keys=keys)
+    assert sorted(df.name) == ['Camp Fire', 'Oak Fire']
+    assert df.set_index('name').acres.to_dict() == {'Camp Fire': 153336, 'Oak Fire': 1200}
+    assert store.load(['name', 'acres'], keys=keys[:1]).values.tolist() == [['Camp Fire', 153336]]
+
+
+def test_upsert_appends_new_and_changed_incidents(tmp_path):
+    store = IncidentStore(str(tmp_path))
+    store.write(incidents())
+
+    refresh = incidents().iloc[[0, 2, 3]].copy()
+    refresh['name'] = [' camp fire ', 'Oak Fire', 'Elm Fire']
+    refresh['acres'] = ['153,336', 900, 45]
+    refresh['containment'] = ['100%', '70%', '10%']
+    new = pd.DataFrame({'name': ['Pine Fire'], 'start_date': ['2020-06-03'], 'county': ['Kern'],
+                        'acres': [10], 'containment': ['0%'], 'year': [2020]})
+
+    updates = store.upsert(pd.concat([refresh, new], ignore_index=True))
+    assert updates.name.tolist() == ['Oak Fire', 'Pine Fire']
+    assert store.upsert(pd.concat([refresh, new], ignore_index=True)).empty
+
+    df = store.load().set_index('name')
+    assert len(df) == 5
+    assert df.loc['Oak Fire', 'acres'] == 900
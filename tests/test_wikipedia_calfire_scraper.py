@@ -0,0 +1,105 @@
+"""
+WikiFire against a local server serving saved-page style year pages.
+"""
+import os
+
+import pandas as pd
+
+from fixtures import synthetic_wiki_frame, wiki_year_page_html
+from local_server import PageRoutes
+from wikipedia_calfire_scraper import WIKI_COLUMNS, WIKI_STEM, WikiFire
+
+
+def year_pages(years, n_rows=20):
+    return {'/{}_California_wildfires'.format(year): (200, wiki_year_page_html(year, n_rows=n_rows))
+            for year in years}
+
+
+def requested_years(server):
+    return sorted(int(path.strip('/').split('_')[0]) for path, query in server.requests)
+
+
+def test_get_data_fetches_through_end_year(local_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = local_server(year_pages(range(2010, 2016)))
+    wiki = WikiFire(url_template=server.url + '/{}_California_wildfires', start_year=2010, end_year=2015)
+
+    df = wiki.get_data()
+    assert list(df.columns) == WIKI_COLUMNS
+    assert sorted(df.year.unique()) == list(range(2010, 2016))
+    assert df.groupby('year').size().tolist() == [20] * 6
+    assert requested_years(server) == list(range(2010, 2016))
+
+
+def test_get_data_adds_missing_years(local_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    stored = synthetic_wiki_frame(50, years=range(2010, 2013))
+    stored.to_csv(os.path.join('data', '2020-01-01_{}.csv'.format(WIKI_STEM)), index=None)
+    server = local_server(year_pages(range(2010, 2016)))
+    wiki = WikiFire(url_template=server.url + '/{}_California_wildfires', start_year=2010, end_year=2015)
+
+    df = wiki.get_data()
+    assert requested_years(server) == [2013, 2014, 2015]
+    assert len(df[df.year < 2013]) == 50
+    assert sorted(df.year.unique()) == list(range(2010, 2016))
+
+    # Stored today through end_year, so the next call reads it without fetching
+    WikiFire(url_template=server.url + '/{}_California_wildfires', start_year=2010, end_year=2015).get_data()
+    assert requested_years(server) == [2013, 2014, 2015]
+
+
+def test_get_data_refreshes_years_that_were_not_over(local_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    stored = synthetic_wiki_frame(50, years=range(2010, 2016))
+    stored.to_csv(os.path.join('data', '2015-08-01_{}.csv'.format(WIKI_STEM)), index=None)
+    server = local_server(year_pages(range(2010, 2016)))
+    wiki = WikiFire(url_template=server.url + '/{}_California_wildfires', start_year=2010, end_year=2015)
+
+    df = wiki.get_data()
+    assert requested_years(server) == [2015]
+    assert len(df[df.year < 2015]) == (stored.year < 2015).sum()
+    assert (df.year == 2015).sum() == 20
+
+
+def slow_pages(years, delay=0.0, failures=None):
+    # Year pages as PageRoutes, failing with a 503 like an overloaded Wikipedia
+    pages = {'/{}_California_wildfires'.format(year): wiki_year_page_html(year, n_rows=10) for year in years}
+    failures = {'/{}_California_wildfires'.format(year): count for year, count in (failures or {}).items()}
+    return PageRoutes(pages, delay=delay, failures=failures, failure_status=503)
+
+
+def test_concurrent_fetch_matches_serial_fetch(local_server):
+    pages = slow_pages(range(2002, 2013), delay=0.1)
+    server = local_server(pages.routes())
+    wiki = WikiFire(url_template=server.url + '/{}_California_wildfires')
+
+    parallel = wiki.fetch_data(2002, 2012, workers=4)
+    assert pages.max_active > 1
+    pages.max_active = 0
+    serial = wiki.fetch_data(2002, 2012, workers=1)
+    assert pages.max_active == 1
+
+    pd.testing.assert_frame_equal(parallel, serial)
+    assert list(parallel.year.unique()) == list(range(2002, 2013))
+
+
+def test_concurrent_fetch_retries_unavailable_pages(local_server):
+    pages = slow_pages(range(2002, 2006), failures={2003: 2})
+    server = local_server(pages.routes())
+    wiki = WikiFire(url_template=server.url + '/{}_California_wildfires', retries=3, backoff=0.01)
+
+    df = wiki.fetch_data(2002, 2005, workers=4)
+    assert df.groupby('year').size().tolist() == [10] * 4
+    assert len(server.requested('/2003_California_wildfires')) == 3
+
+
+def test_get_data_fetches_concurrently_by_default(local_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pages = slow_pages(range(2002, 2013), delay=0.05)
+    server = local_server(pages.routes())
+
+    df = WikiFire(url_template=server.url + '/{}_California_wildfires', end_year=2012).get_data()
+    assert pages.max_active > 1
+    assert sorted(df.year.unique()) == list(range(2002, 2013))
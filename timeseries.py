@@ -0,0 +1,283 @@
+"""
+Daily time series of the fires, as NumPy arrays over every day from January 1 of the first year
+with a fire to the last day of any fire:
+
+    started     number of fires started that day
+    acres       acres of the fires started that day
+    active      number of fires burning that day (see intervals.FireIntervals)
+
+Statistics are computed from the arrays, in O(days), never from the fires again:
+
+    series = FireTimeSeries(df)
+    series.rolling('acres', 30)                 # 30 day totals, O(days) whatever the window
+    series.anomalies('started', 365)            # against the mean of the same day in other years
+    series.season_curves('acres')               # acres so far each year, by day of year
+
+add and update change the arrays in place as fires are added or change, touching only the days
+those fires span. Days of the year are counted on a leap year calendar (0 to 365), so a date falls
+on the same day every year. Fires without a valid start date (Cal Fire shows them as 12/31/1969)
+are only counted in undated.
+"""
+import numpy as np
+import pandas as pd
+
+from intervals import FireIntervals, start_dates
+
+SERIES = ['started', 'acres', 'active']
+WINDOWS = [7, 30, 365]
+DAYS_IN_YEAR = 366
+
+
+def day_of_year(dates):
+    """
+    Parameters
+    ----------
+    dates (array of datetime64[D])
+
+    Returns
+    -------
+    Array of days of the year, from 0 (January 1) to 365 (December 31), on a leap year calendar:
+    March 1 is day 60 in every year
+    """
+    year_start = dates.astype('datetime64[Y]')
+    day = (dates - year_start.astype('datetime64[D]')).astype(np.int64)
+    year = year_start.astype(np.int64) + 1970
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    return np.where(~leap & (day >= 59), day + 1, day)
+
+
+class FireTimeSeries(object):
+
+    def __init__(self, df=None, default_days=None, today=None):
+        """
+        Parameters
+        ----------
+        df (Pandas dataframe): fires with start_date and acres, and optionally year, contained_date
+                               and containment
+        default_days, today: duration of contained fires without a contained date, and end of
+                             fires still burning, see FireIntervals. Taken from the first fires
+                             added if None, and kept for later ones.
+        """
+        self.default_days = default_days
+        self.today = today
+        self.undated = 0
+        self.origin = None
+        self._arrays = {'started': np.zeros(0, dtype=np.int64), 'acres': np.zeros(0),
+                        'active': np.zeros(0, dtype=np.int64)}
+        if df is not None:
+            self.add(df)
+
+    def __len__(self):
+        return len(self._arrays['started'])
+
+    @property
+    def dates(self):
+        """
+        Numpy array of the days of the series, as datetime64[D]
+        """
+        if self.origin is None:
+            return np.array([], dtype='datetime64[D]')
+        return self.origin + np.arange(len(self))
+
+    def copy(self):
+        """
+        Returns
+        -------
+        FireTimeSeries with copies of the arrays, to update without changing this one
+        """
+        series = FireTimeSeries(default_days=self.default_days, today=self.today)
+        series.undated = self.undated
+        series.origin = self.origin
+        series._arrays = {name: values.copy() for name, values in self._arrays.items()}
+        return series
+
+    def add(self, df):
+        """
+        Add fires to the series
+        """
+        self._accumulate(df, 1)
+
+    def update(self, removed, added):
+        """
+        Replace old versions of fires (removed, as they were added) with their new versions (added)
+        """
+        self._accumulate(removed, -1)
+        self._accumulate(added, 1)
+
+    def series(self, name):
+        """
+        Parameters
+        ----------
+        name (string): one of SERIES
+
+        Returns
+        -------
+        Pandas series of the values of each day, indexed by date
+        """
+        return pd.Series(self._values(name), index=pd.DatetimeIndex(self.dates))
+
+    def to_frame(self):
+        """
+        Returns
+        -------
+        Dataframe with date and every one of SERIES, one row per day
+        """
+        df = pd.DataFrame({name: self._values(name) for name in SERIES})
+        df.insert(0, 'date', pd.DatetimeIndex(self.dates))
+        return df
+
+    def rolling(self, name, window, how='sum'):
+        """
+        Totals over a moving window, from a cumulative sum: O(days) for any window
+
+        Parameters
+        ----------
+        name (string): one of SERIES
+        window (int): days in the window, the day itself and the window - 1 days before it
+        how (string): "sum", or "mean" per day
+
+        Returns
+        -------
+        Pandas series indexed by date, NaN for the first window - 1 days
+        """
+        values = self._values(name)
+        totals = np.cumsum(np.concatenate([np.zeros(1, dtype=values.dtype), values]))
+        rolled = np.full(len(values), np.nan)
+        if window <= len(values):
+            rolled[window - 1:] = totals[window:] - totals[:-window]
+        if how == 'mean':
+            rolled /= window
+        elif how != 'sum':
+            raise ValueError("Unknown aggregation {}, expected sum or mean".format(how))
+        return pd.Series(rolled, index=pd.DatetimeIndex(self.dates))
+
+    def by_year(self, name, window=1):
+        """
+        Parameters
+        ----------
+        name (string): one of SERIES
+        window (int): days summed on each day, see rolling
+
+        Returns
+        -------
+        Dataframe with one row per year and one column per day of the year (0 to 365), NaN on days
+        outside the series and on February 29 of other years
+        """
+        values = self.rolling(name, window).values if window > 1 else self._values(name).astype(np.float64)
+        dates = self.dates
+        years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        first = int(years[0]) if len(years) else 0
+        num_years = int(years[-1]) - first + 1 if len(years) else 0
+        matrix = np.full((num_years, DAYS_IN_YEAR), np.nan)
+        matrix[years - first, day_of_year(dates)] = values
+        return pd.DataFrame(matrix, index=pd.Index(np.arange(first, first + num_years), name='year'))
+
+    def climatology(self, name, window=1, baseline=None):
+        """
+        Parameters
+        ----------
+        name (string): one of SERIES
+        window (int): days summed on each day, see rolling
+        baseline (tuple): first and last year averaged, all years if None
+
+        Returns
+        -------
+        Numpy array with the mean value of each day of the year (0 to 365) over the baseline years
+        """
+        matrix = self.by_year(name, window)
+        if baseline is not None:
+            matrix = matrix.loc[baseline[0]:baseline[1]]
+        values = matrix.values
+        counts = np.sum(~np.isnan(values), axis=0)
+        totals = np.nansum(values, axis=0)
+        return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+    def anomalies(self, name, window=30, baseline=None):
+        """
+        Difference of each day's total over window with the mean total of the same day of the year
+        over the baseline years. With window=365, the difference of the past year with a typical year.
+
+        Parameters
+        ----------
+        name (string): one of SERIES
+        window (int): days summed on each day, see rolling
+        baseline (tuple): first and last year of the climatology, all years if None
+
+        Returns
+        -------
+        Dataframe with date, value, climatology and anomaly (value - climatology), one row per day
+        """
+        value = self.rolling(name, window).values if window > 1 else self._values(name).astype(np.float64)
+        climatology = self.climatology(name, window, baseline)[day_of_year(self.dates)]
+        return pd.DataFrame({'date': pd.DatetimeIndex(self.dates), 'value': value,
+                             'climatology': climatology, 'anomaly': value - climatology})
+
+    def season_curves(self, name='acres', years=None):
+        """
+        Parameters
+        ----------
+        name (string): one of SERIES
+        years (list): years to include, all if None
+
+        Returns
+        -------
+        Dataframe with day_of_year (0 to 365) and one column per year with the total of the year so
+        far, NaN after the last day of the series
+        """
+        matrix = self.by_year(name)
+        if years is not None:
+            matrix = matrix.loc[[year for year in years if year in matrix.index]]
+        values = matrix.values
+        # February 29 of other years, and days before the series, add nothing
+        cumulative = np.cumsum(np.nan_to_num(values), axis=1)
+        after_end = np.zeros(values.shape, dtype=bool)
+        if len(matrix) and matrix.index[-1] == self.dates[-1].astype('datetime64[Y]').astype(np.int64) + 1970:
+            after_end[-1, day_of_year(self.dates[-1:])[0] + 1:] = True
+        cumulative[after_end] = np.nan
+        df = pd.DataFrame(cumulative.T, columns=list(matrix.index))
+        df.insert(0, 'day_of_year', np.arange(DAYS_IN_YEAR))
+        return df
+
+    def _values(self, name):
+        if name not in self._arrays:
+            raise ValueError("Unknown series {}, expected one of {}".format(name, SERIES))
+        return self._arrays[name]
+
+    def _accumulate(self, df, sign):
+        if not len(df):
+            return
+        intervals = FireIntervals(df, self.default_days, self.today)
+        if self.default_days is None:
+            self.default_days = intervals.default_days
+        if self.today is None:
+            self.today = intervals.today
+
+        start = start_dates(df).values.astype('datetime64[D]')
+        dated = ~np.isnat(start)
+        self.undated += sign * int((~dated).sum())
+        if not dated.any():
+            return
+        active = intervals.daily_counts()
+        active_first = active.index[0].to_datetime64().astype('datetime64[D]')
+        self._grow(min(start[dated].min(), active_first),
+                   max(start[dated].max(), active_first + len(active) - 1))
+
+        day = (start[dated] - self.origin).astype(np.int64)
+        acres = pd.to_numeric(df['acres'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)[dated]
+        np.add.at(self._arrays['started'], day, sign)
+        np.add.at(self._arrays['acres'], day, sign * acres)
+        offset = int((active_first - self.origin).astype(np.int64))
+        self._arrays['active'][offset:offset + len(active)] += sign * active.values.astype(np.int64)
+
+    def _grow(self, first, last):
+        # Extend the arrays to cover first to last, starting on January 1
+        first = first.astype('datetime64[Y]').astype('datetime64[D]')
+        if self.origin is not None:
+            first = min(first, self.origin)
+            last = max(last, self.origin + len(self) - 1)
+        before = 0 if self.origin is None else int((self.origin - first).astype(np.int64))
+        after = int((last - first).astype(np.int64)) + 1 - before - len(self)
+        if before or after:
+            for name, values in self._arrays.items():
+                self._arrays[name] = np.pad(values, (before, after))
+        self.origin = first
@@ -1,10 +1,13 @@
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pandas.errors import OutOfBoundsDatetime
-from dateutil.parser._parser import ParserError
+
+import instrumentation
+from staging import StagedTable
+from storage import HAS_PARQUET, find_table, read_table, write_table
 
 import logging
 import sys
@@ -13,82 +16,316 @@ import os
 log_format = '%(asctime)s|%(levelname)s| %(message)s'
 logging.basicConfig(stream=sys.stdout, format=log_format, level=logging.INFO)
 
+WIKI_URL = "https://en.wikipedia.org/wiki/{}_California_wildfires"
+WIKI_STEM = 'wiki_calfire_data'
+# Pages before 2013 fill in the years Cal Fire does not list, later ones add notes and contained
+# dates to the Cal Fire incidents they link to (see linkage.py)
+START_YEAR = 2002
+# Columns of the stored table, whatever the columns of a year's table
+WIKI_COLUMNS = ['name', 'county', 'acres', 'start_date', 'contained_date', 'notes', 'year']
+
+# "auto" uses lxml when it is installed, and BeautifulSoup's html.parser otherwise
+PARSERS = ['auto', 'lxml', 'html.parser']
+
+# Tables whose first row has "County" as its second header cell
+INCIDENT_TABLE_XPATH = "//table[(.//tr)[1]/th[2][normalize-space(.)='County']]"
+
 
 class WikiFire(object):
 
-    def get_data(self):
+    def __init__(self, url_template=WIKI_URL, workers=4, timeout=30, retries=3, backoff=0.5, cache=None,
+                 parser='auto', start_year=START_YEAR, end_year=None):
+        """
+        Parameters
+        ----------
+        url_template (string): page url with a placeholder for the year.
+                               Point this at a local server to scrape saved pages.
+        workers (int): number of year pages fetched concurrently by get_data
+        timeout (float): seconds to wait for a page
+        retries (int): retries for failed connections and 429/5xx responses
+        backoff (float): backoff factor between retries, in seconds
+        cache (http_cache.PageCache): revalidate cached pages instead of downloading them,
+                                      and skip parsing pages that have not changed
+        parser (string): one of PARSERS. Both parsers return the same table.
+        start_year (int): first year stored by get_data
+        end_year (int): last year stored by get_data, the current year if None
+        """
+        if parser not in PARSERS:
+            raise ValueError("Unknown parser {}, expected one of {}".format(parser, PARSERS))
+        self.url_template = url_template
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.parser = parser
+        self.start_year = start_year
+        self.end_year = end_year
+
+    def get_data(self, columns=None, export_csv=False, refresh_days=1):
         """
         If data is present locally, read and return data.
-        Else, fetch data from years 2002-2012 from Wikipedia and return
+        Else, fetch data from years start_year through end_year from Wikipedia and return
+
+        Years after the last stored one are fetched and added to the stored data. Pages of years
+        that were not over when the data was stored are fetched again every refresh_days, as
+        their fires are still being added and contained.
+
+        Parameters
+        ----------
+        columns (list): return only these columns
+        export_csv (bool): also write the fetched data as CSV
+        refresh_days (float): how often pages of years that were not over are fetched again
 
         Returns
         -------
-        Pandas Dataframe
+        Pandas Dataframe, typed as in storage.SCHEMA
         """
-        wiki_filename = None
-        for filename in os.listdir('data/'):
-            if 'wiki' in filename:
-                wiki_filename = filename
-
-        if not wiki_filename:
-
-            logging.info("No file with wikipedia data found. Fetching now.")
-            wiki_df = self.fetch_data(2002, 2012)
+        wiki_filename = find_table("data", WIKI_STEM)
+        end_year = self.end_year or datetime.today().year
+
+        if wiki_filename and wiki_filename.endswith('.csv') and HAS_PARQUET:
+            logging.info("Converting {} to Parquet".format(wiki_filename))
+            wiki_filename = write_table(read_table(wiki_filename), wiki_filename)
+
+        fetch_from = self._fetch_from(wiki_filename, end_year, refresh_days)
+        if fetch_from is not None:
+            if not wiki_filename:
+                logging.info("No file with wikipedia data found. Fetching now.")
+            else:
+                logging.info("Fetching wikipedia data from {} on".format(fetch_from))
+            staging = StagedTable("data", WIKI_STEM)
+            if wiki_filename:
+                # Stored years are staged as they are, so only the others are fetched
+                stored = read_table(wiki_filename)
+                completed = staging.completed()
+                for year, df in stored[stored.year < fetch_from].groupby('year'):
+                    if str(year) not in completed:
+                        staging.append(str(year), df)
+                        staging.complete(str(year))
+            staging = self.stream(self.start_year, end_year, staging, workers=self.workers)
             today = datetime.today()
             date_string = today.strftime('%Y-%m-%d')
-            filename = '{}_wiki_calfire_data.csv'.format(date_string)
+            filename = '{}_{}'.format(date_string, WIKI_STEM)
             filename = os.path.join("data", filename)
-            wiki_df.to_csv(filename, index=None)
+            wiki_filename = staging.finish(filename, export_csv=export_csv)
 
-        else:
-            logging.info("Using wiki file {}".format(wiki_filename))
-            wiki_filename = os.path.join("data", wiki_filename)
-            wiki_df = pd.read_csv(wiki_filename)
+        logging.info("Using wiki file {}".format(wiki_filename))
+        wiki_df = read_table(wiki_filename, columns)
 
         return wiki_df
 
-    def fetch_data(self, start_year, end_year):
+    def _fetch_from(self, wiki_filename, end_year, refresh_days):
+        """
+        Parameters
+        ----------
+        wiki_filename (string): stored table "<date>_wiki_calfire_data", or None
+        end_year (int)
+        refresh_days (float)
+
+        Returns
+        -------
+        First year to fetch, or None if the stored table is current
+        """
+        if not wiki_filename:
+            return self.start_year
+        stored_on = pd.to_datetime(os.path.basename(wiki_filename).split("_")[0])
+        fetch_from = int(read_table(wiki_filename, ['year']).year.max()) + 1
+        if (datetime.today() - stored_on).days >= refresh_days:
+            fetch_from = min(fetch_from, stored_on.year)
+        return fetch_from if fetch_from <= end_year else None
+
+    def fetch_data(self, start_year, end_year, workers=1):
         """
         Parameters
         ----------
         start_year, end_year (ints)
         Get data from <start_year> to <end_year> inclusive.
+        workers (int): number of pages fetched concurrently over a shared connection pool.
+                       Each page is parsed as soon as it arrives.
 
         Returns
         -------
         Pandas Dataframe
         """
-        fires = []
-        for year in range(start_year, end_year+1):
-            df = self._fetch_data(year)
-            fires.append(df)
-        return self.clean_data(fires)
+        years = list(range(start_year, end_year+1))
+        session = self._new_session(workers)
+        try:
+            fires = dict(self.iter_pages(years, session, workers))
+        finally:
+            session.close()
+        # Reassemble in year order, whatever order the pages arrived in
+        return self.clean_data([fires[year] for year in years])
+
+    def stream(self, start_year, end_year, staging, workers=1):
+        """
+        Fetch years into staging. Each year is cleaned and stored as soon as its page is parsed,
+        and years that were stored before an interruption are not fetched again.
+
+        Parameters
+        ----------
+        start_year, end_year (ints)
+        staging (staging.StagedTable)
+        workers (int): number of pages fetched concurrently
+
+        Returns
+        -------
+        staging, with every year complete
+        """
+        completed = staging.completed()
+        years = [year for year in range(start_year, end_year+1) if str(year) not in completed]
+        session = self._new_session(workers)
+        try:
+            for year, df in self.iter_pages(years, session, workers):
+                staging.append(str(year), self.clean_data([df]).reindex(columns=WIKI_COLUMNS))
+                staging.complete(str(year))
+        finally:
+            session.close()
+        return staging
+
+    def iter_pages(self, years, session, workers=1):
+        """
+        Parameters
+        ----------
+        years (list)
+        session (requests.Session)
+        workers (int): number of pages fetched concurrently over session
+
+        Yields
+        ------
+        (year, Pandas dataframe with the raw table of the year), as each page is parsed
+        """
+        if workers > 1 and len(years) > 1:
+            # Counters of the worker threads go to the stages of this one
+            stages = instrumentation.current_stages()
+
+            def fetch_in_stages(year):
+                with instrumentation.within(stages):
+                    return self._fetch_data(year, session)
+
+            with ThreadPoolExecutor(max_workers=min(workers, len(years))) as executor:
+                futures = {executor.submit(fetch_in_stages, year): year for year in years}
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+        else:
+            for year in years:
+                yield year, self._fetch_data(year, session)
 
-    def _fetch_data(self, year):
+    def _new_session(self, pool_size=1):
+        """
+        Returns
+        -------
+        requests.Session with a connection pool of pool_size, and retries with backoff
+        """
+        # Only needed when pages are downloaded, not when the stored table is current
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=self.retries, backoff_factor=self.backoff, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @instrumentation.timed('wiki.fetch_data')
+    def _fetch_data(self, year, session=None):
         """
         Scrapes data from Wikipedia page for <year>
 
         Parameters
         ----------
         year (int): The year to fetch data for.
+        session (requests.Session): reuse connections of this session, if given
 
         Returns
         -------
         Pandas dataframe with wildfire data
         """
         logging.info("Fetching year: {}".format(year))
-        url = "https://en.wikipedia.org/wiki/{}_California_wildfires".format(year)
-        html_page = requests.get(url).text
+        instrumentation.count('pages_fetched')
+        url = self.url_template.format(year)
+        if self.cache is not None:
+            page = self.cache.get(url, session, timeout=self.timeout)
+            if page.not_modified:
+                df = self.cache.load_parsed(url)
+                if df is not None:
+                    logging.info("Year {} has not changed, using cached table".format(year))
+                    return df
+            df = self._parse_page(page.text, year)
+            self.cache.store_parsed(url, df)
+            return df
+
+        if session is None:
+            import requests
+            session = requests
+        response = session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        instrumentation.count('bytes_downloaded', len(response.content))
+        return self._parse_page(response.text, year)
+
+    @instrumentation.timed('wiki.parse')
+    def _parse_page(self, html_page, year):
+        """
+        Parameters
+        ----------
+        html_page (string): Wikipedia page for <year>
+        year (int)
+
+        Returns
+        -------
+        Pandas dataframe with wildfire data
+        """
+        if self.parser != 'html.parser':
+            try:
+                return self._parse_page_lxml(html_page, year)
+            except ImportError:
+                if self.parser == 'lxml':
+                    raise
+                logging.debug("lxml is not installed, parsing with html.parser")
+
+        from bs4 import BeautifulSoup
+
         parsed_page = BeautifulSoup(html_page, "html.parser")
         tables = parsed_page.findAll("table")
 
         header, table = self._get_correct_table(tables)
 
         rows = table.find_all('tr')[1:]
+        entries = [[x.get_text().strip() for x in row.find_all('td')] for row in rows]
+        return self._table_frame(header, entries, year)
+
+    def _parse_page_lxml(self, html_page, year):
+        """
+        Same as _parse_page, with lxml: the incidents table is selected with one xpath query
+        instead of walking every table, and its cells are read in C.
+        """
+        from lxml import html
+
+        tables = html.fromstring(html_page).xpath(INCIDENT_TABLE_XPATH)
+        if not tables:
+            raise ValueError("No incidents table found on the page for {}".format(year))
+        rows = tables[0].xpath('.//tr')
+        header = [cell.text_content().strip() for cell in rows[0].xpath('th')]
+        entries = [[cell.text_content().strip() for cell in row.xpath('.//td')] for row in rows[1:]]
+        return self._table_frame(header, entries, year)
+
+    @staticmethod
+    def _table_frame(header, entries, year):
+        """
+        Parameters
+        ----------
+        header (list): header cells of the incidents table
+        entries (list): cells of each row. Rows without notes have 6 cells.
+        year (int)
+
+        Returns
+        -------
+        Pandas dataframe with one column per header cell, and the year
+        """
         my_dict = {}
-        for i, row in enumerate(rows):
-            columns = row.find_all('td')
-            entry = [x.get_text().strip() for x in columns]
+        for i, entry in enumerate(entries):
             if len(entry) == 6:
                 entry.append("")
             entry.append(year)
@@ -98,6 +335,7 @@ class WikiFire(object):
 
         header.append("year")
         df.columns = header
+        instrumentation.count('rows_parsed', len(df))
         return df
 
     def _get_correct_table(self, tables):
@@ -129,6 +367,7 @@ class WikiFire(object):
                     return header, table
 
     @staticmethod
+    @instrumentation.timed('wiki.clean_data')
     def clean_data(fires):
 
         """
@@ -148,20 +387,17 @@ class WikiFire(object):
         -------
         Single dataframe with cleaned data
         """
+        from dateutil.parser._parser import ParserError
 
         #  Two helper functions to set dates using pandas
         #  Some years include year in their dates "5th August, 2020". Other years do not, as in "5th August",
         #  considering the year is obvious from the page we are looking at, such as "Wildfires of 2020"
+        #  These parse a single date string, and are only used for strings the vectorized parse can not handle.
 
-        def get_start_date(row):
-
-            day = row['start_date'].split(",")[0]
-            date_string = '{}, {}'.format(day, row['year'])
+        def get_start_date(date_string):
             return pd.to_datetime(date_string)
 
-        def get_end_date(row):
-            day = row['contained_date'].split(",")[0]
-            date_string = '{}, {}'.format(day, row['year'])
+        def get_end_date(date_string):
             try:
                 date = pd.to_datetime(date_string)
             except OutOfBoundsDatetime:
@@ -191,12 +427,55 @@ class WikiFire(object):
                 df.drop("Ref", axis=1, inplace=True)
 
         fires = pd.concat(fires)
-        fires['start_date'] = fires.apply(get_start_date, axis=1)
-        fires['contained_date'] = fires.apply(get_end_date, axis=1)
+        fires['start_date'] = WikiFire._parse_dates(fires['start_date'], fires['year'], get_start_date)
+        fires['contained_date'] = WikiFire._parse_dates(fires['contained_date'], fires['year'], get_end_date)
 
         fires.columns = [colname.lower() for colname in fires.columns]
         return fires
 
+    @staticmethod
+    def _parse_dates(dates, years, parse_one, date_format='%B %d, %Y'):
+        """
+        Vectorized date parsing: drop any year from the date strings, append the year of the page,
+        and parse all of them with one to_datetime call.
+
+        Dates repeat a lot, so the string operations and the parse run once per distinct
+        (date, year) pair, and the results are broadcast back with a single take.
+        Strings that do not match date_format are passed to parse_one, which decides what an
+        unparseable date becomes.
+
+        Parameters
+        ----------
+        dates (Pandas series): date strings, with or without a year
+        years (Pandas series): year of each date
+        parse_one (function): parses a single "<date>, <year>" string
+        date_format (string): format of most dates once the year is appended
+
+        Returns
+        -------
+        Pandas series with the same index as dates
+        """
+        date_codes, date_uniques = pd.factorize(dates)
+        year_codes, year_uniques = pd.factorize(years.to_numpy())
+        # Missing dates get code -1, point them at a trailing missing value instead
+        date_uniques = pd.Series(list(date_uniques) + [np.nan], dtype=object)
+        date_codes = np.where(date_codes < 0, len(date_uniques) - 1, date_codes)
+
+        pairs = date_codes.astype(np.int64) * len(year_uniques) + year_codes
+        unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+        days = date_uniques.take(unique_pairs // len(year_uniques)).str.split(",").str[0]
+        pair_years = pd.Series(year_uniques).take(unique_pairs % len(year_uniques)).astype(str)
+        date_strings = pd.Series(days.values + ", " + pair_years.values)
+
+        parsed = pd.to_datetime(date_strings, format=date_format, errors='coerce')
+        lookup = parsed.astype(object)
+        unparsed = parsed.isnull()
+        lookup[unparsed] = [parse_one(date_string) for date_string in date_strings[unparsed]]
+
+        if lookup.map(lambda date: date is None or isinstance(date, pd.Timestamp)).all():
+            lookup = pd.to_datetime(lookup)
+        return pd.Series(lookup.values[inverse], index=dates.index)
+
 
 if __name__ == '__main__':
     wf = WikiFire()